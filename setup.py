@@ -95,6 +95,8 @@ setup(
     packages=['tadataka'],
     rust_extensions=[
         RustExtension("rust_bindings.camera", debug=debug_rust),
+        RustExtension("rust_bindings.dvo", debug=debug_rust),
+        RustExtension("rust_bindings.gradient", debug=debug_rust),
         RustExtension("rust_bindings.homogeneous", debug=debug_rust),
         RustExtension("rust_bindings.interpolation", debug=debug_rust),
         RustExtension("rust_bindings.projection", debug=debug_rust),
@@ -13,6 +13,20 @@ impl CameraParameters {
         CameraParameters { focal_length: arr1(&[fx, fy]), offset: arr1(&[ox, oy]) }
     }
 
+    // Fixed-size versions of Normalizer for per-pixel computation.
+    // They do not allocate
+    #[inline]
+    pub fn normalize_xy(&self, u: &[f64; 2]) -> [f64; 2] {
+        [(u[0] - self.offset[0]) / self.focal_length[0],
+         (u[1] - self.offset[1]) / self.focal_length[1]]
+    }
+
+    #[inline]
+    pub fn unnormalize_xy(&self, x: &[f64; 2]) -> [f64; 2] {
+        [x[0] * self.focal_length[0] + self.offset[0],
+         x[1] * self.focal_length[1] + self.offset[1]]
+    }
+
     fn matrix(&self) -> Array2<f64> {
         let fx = self.focal_length[0];
         let fy = self.focal_length[1];
@@ -97,6 +111,15 @@ mod tests {
         assert_eq!(camera_params.unnormalize(&normalized), unnormalized);
     }
 
+    #[test]
+    fn test_normalizer_xy() {
+        let camera_params = CameraParameters::new((10., 20.), (2., 4.));
+        assert_eq!(camera_params.normalize_xy(&[12., 24.]), [1.0, 1.0]);
+        assert_eq!(camera_params.unnormalize_xy(&[1.0, 1.0]), [12., 24.]);
+        assert_eq!(camera_params.normalize_xy(&[0., 0.]), [-0.2, -0.2]);
+        assert_eq!(camera_params.unnormalize_xy(&[-0.2, -0.2]), [0., 0.]);
+    }
+
     #[test]
     fn test_camera() {
         let c = CameraParameters::new((1.0, 1.2), (0.8, 0.2));
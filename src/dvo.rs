@@ -0,0 +1,381 @@
+use crate::camera::CameraParameters;
+use crate::interpolation::interpolate_xy;
+use ndarray::{ArrayView1, ArrayView2};
+use num::NumCast;
+use num_traits::float::Float;
+use rayon::prelude::*;
+
+// number of points accumulated by one task
+// chunks are merged in a fixed order so the result does not depend on
+// the number of threads
+const CHUNK_SIZE: usize = 4096;
+
+// J^T * W * J, J^T * W * r, sum of w * r^2 and the number of valid points
+// of one Gauss-Newton step of DVO
+#[derive(Clone, Debug, PartialEq)]
+pub struct NormalEquation {
+    pub jtwj: [[f64; 6]; 6],
+    pub jtwr: [f64; 6],
+    pub error: f64,
+    pub count: usize,
+}
+
+impl NormalEquation {
+    pub fn zeros() -> Self {
+        NormalEquation {
+            jtwj: [[0.; 6]; 6],
+            jtwr: [0.; 6],
+            error: 0.,
+            count: 0,
+        }
+    }
+
+    #[inline]
+    fn add(&mut self, j: &[f64; 6], r: f64, w: f64) {
+        for a in 0..6 {
+            let wj = w * j[a];
+            self.jtwr[a] += wj * r;
+            // fill the upper triangle only. see 'symmetrize'
+            for b in a..6 {
+                self.jtwj[a][b] += wj * j[b];
+            }
+        }
+        self.error += w * r * r;
+        self.count += 1;
+    }
+
+    fn merge(mut self, other: &NormalEquation) -> Self {
+        for a in 0..6 {
+            self.jtwr[a] += other.jtwr[a];
+            for b in a..6 {
+                self.jtwj[a][b] += other.jtwj[a][b];
+            }
+        }
+        self.error += other.error;
+        self.count += other.count;
+        self
+    }
+
+    fn symmetrize(mut self) -> Self {
+        for a in 0..6 {
+            for b in 0..a {
+                self.jtwj[a][b] = self.jtwj[b][a];
+            }
+        }
+        self
+    }
+}
+
+// Kerl, Christian.
+// "Odometry from rgb-d cameras for autonomous quadrocopters."
+// Master's Thesis, Technical University (2012).
+#[inline]
+fn jacobian(fgx: f64, fgy: f64, p: &[f64; 3]) -> [f64; 6] {
+    let (x, y, z) = (p[0], p[1], p[2]);
+    let z2 = z * z;
+    let xy = x * y;
+    [
+        fgx / z,
+        fgy / z,
+        -(fgx * x + fgy * y) / z2,
+        -(fgx * xy + fgy * (z2 + y * y)) / z2,
+        (fgx * (z2 + x * x) + fgy * xy) / z2,
+        (-fgx * y + fgy * x) / z,
+    ]
+}
+
+#[inline]
+fn to_f64<A: Float>(v: A) -> f64 {
+    NumCast::from(v).unwrap()
+}
+
+#[inline]
+fn sample<A: Float>(image: &ArrayView2<'_, A>, ux: f64, uy: f64) -> f64 {
+    to_f64(interpolate_xy(image, NumCast::from(ux).unwrap(), NumCast::from(uy).unwrap()))
+}
+
+fn accumulate_range<A: Float>(
+    rotation: &[[f64; 3]; 3],
+    translation: &[f64; 3],
+    points0: &ArrayView2<'_, A>,
+    intensities0: &ArrayView1<'_, A>,
+    image1: &ArrayView2<'_, A>,
+    gx1: &ArrayView2<'_, A>,
+    gy1: &ArrayView2<'_, A>,
+    camera_params1: &CameraParameters,
+    weights: Option<&ArrayView1<'_, A>>,
+    begin: usize,
+    end: usize,
+) -> NormalEquation {
+    let (fx, fy) = (camera_params1.focal_length[0], camera_params1.focal_length[1]);
+    let (ox, oy) = (camera_params1.offset[0], camera_params1.offset[1]);
+    let height = image1.shape()[0] as f64;
+    let width = image1.shape()[1] as f64;
+
+    let mut equation = NormalEquation::zeros();
+    for i in begin..end {
+        let p0 = [to_f64(points0[[i, 0]]), to_f64(points0[[i, 1]]), to_f64(points0[[i, 2]])];
+        let mut p1 = [0.; 3];
+        for k in 0..3 {
+            p1[k] = rotation[k][0] * p0[0] +
+                    rotation[k][1] * p0[1] +
+                    rotation[k][2] * p0[2] +
+                    translation[k];
+        }
+
+        if p1[2] <= 0. {
+            continue;
+        }
+
+        let ux = fx * p1[0] / p1[2] + ox;
+        let uy = fy * p1[1] / p1[2] + oy;
+        if !(0. <= ux && ux <= width - 1. && 0. <= uy && uy <= height - 1.) {
+            continue;
+        }
+
+        let w = match weights {
+            Some(weights) => to_f64(weights[i]),
+            None => 1.,
+        };
+
+        let r = to_f64(intensities0[i]) - sample(image1, ux, uy);
+        let fgx = fx * sample(gx1, ux, uy);
+        let fgy = fy * sample(gy1, ux, uy);
+        equation.add(&jacobian(fgx, fgy, &p1), r, w);
+    }
+    equation
+}
+
+// Warps points0 by transform10, samples image1 and its gradient at the
+// warped coordinates and accumulates the normal equation of
+// r = I0(u0) - I1(u1) in one pass without materializing the N x 6 Jacobian.
+// Points behind the camera or out of the image are skipped.
+// Inputs can be f32 to halve the memory traffic. Warping and the
+// accumulation are always done in f64.
+pub fn normal_equation<A: Float + Sync>(
+    transform10: &ArrayView2<'_, f64>,
+    points0: &ArrayView2<'_, A>,
+    intensities0: &ArrayView1<'_, A>,
+    image1: &ArrayView2<'_, A>,
+    gx1: &ArrayView2<'_, A>,
+    gy1: &ArrayView2<'_, A>,
+    camera_params1: &CameraParameters,
+    weights: Option<&ArrayView1<'_, A>>,
+) -> NormalEquation {
+    assert_eq!(points0.shape()[1], 3);
+    assert_eq!(points0.shape()[0], intensities0.shape()[0]);
+    assert_eq!(image1.shape(), gx1.shape());
+    assert_eq!(image1.shape(), gy1.shape());
+    if let Some(w) = weights {
+        assert_eq!(w.shape()[0], points0.shape()[0]);
+    }
+
+    let mut rotation = [[0.; 3]; 3];
+    let mut translation = [0.; 3];
+    for i in 0..3 {
+        for j in 0..3 {
+            rotation[i][j] = transform10[[i, j]];
+        }
+        translation[i] = transform10[[i, 3]];
+    }
+
+    let n = points0.shape()[0];
+    let n_chunks = (n + CHUNK_SIZE - 1) / CHUNK_SIZE;
+    let chunks: Vec<NormalEquation> = (0..n_chunks)
+        .into_par_iter()
+        .map(|c| {
+            let begin = c * CHUNK_SIZE;
+            let end = std::cmp::min(begin + CHUNK_SIZE, n);
+            accumulate_range(&rotation, &translation, points0, intensities0,
+                             image1, gx1, gy1, camera_params1, weights,
+                             begin, end)
+        })
+        .collect();
+
+    chunks
+        .iter()
+        .fold(NormalEquation::zeros(), |acc, e| acc.merge(e))
+        .symmetrize()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use ndarray::{arr1, arr2, Array, Array1, Array2};
+
+    fn naive(
+        transform10: &Array2<f64>,
+        points0: &Array2<f64>,
+        intensities0: &Array1<f64>,
+        image1: &Array2<f64>,
+        gx1: &Array2<f64>,
+        gy1: &Array2<f64>,
+        camera_params1: &CameraParameters,
+        weights: &Array1<f64>,
+    ) -> NormalEquation {
+        let mut equation = NormalEquation::zeros();
+        let (fx, fy) = (camera_params1.focal_length[0], camera_params1.focal_length[1]);
+        for i in 0..points0.shape()[0] {
+            let p0 = points0.row(i);
+            let p1 = transform10.slice(s![0..3, 0..3]).dot(&p0)
+                   + transform10.slice(s![0..3, 3]);
+            if p1[2] <= 0. {
+                continue;
+            }
+            let ux = fx * p1[0] / p1[2] + camera_params1.offset[0];
+            let uy = fy * p1[1] / p1[2] + camera_params1.offset[1];
+            if ux < 0. || ux > (image1.shape()[1] - 1) as f64 ||
+               uy < 0. || uy > (image1.shape()[0] - 1) as f64 {
+                continue;
+            }
+            let r = intensities0[i] - interpolate_xy(&image1.view(), ux, uy);
+            let fgx = fx * interpolate_xy(&gx1.view(), ux, uy);
+            let fgy = fy * interpolate_xy(&gy1.view(), ux, uy);
+            let j = jacobian(fgx, fgy, &[p1[0], p1[1], p1[2]]);
+            let w = weights[i];
+            for a in 0..6 {
+                equation.jtwr[a] += w * j[a] * r;
+                for b in 0..6 {
+                    equation.jtwj[a][b] += w * j[a] * j[b];
+                }
+            }
+            equation.error += w * r * r;
+            equation.count += 1;
+        }
+        equation
+    }
+
+    #[test]
+    fn test_normal_equation() {
+        let (height, width) = (40, 50);
+        let image1 = Array::from_shape_fn((height, width), |(y, x)| {
+            ((x as f64) / 3.).sin() * ((y as f64) / 5.).cos()
+        });
+        let gx1 = Array::from_shape_fn((height, width), |(y, x)| {
+            ((x as f64) / 3.).cos() * ((y as f64) / 5.).cos() / 3.
+        });
+        let gy1 = Array::from_shape_fn((height, width), |(y, x)| {
+            -((x as f64) / 3.).sin() * ((y as f64) / 5.).sin() / 5.
+        });
+
+        let n = 10000;  // more than CHUNK_SIZE
+        let points0 = Array::from_shape_fn((n, 3), |(i, k)| {
+            let t = i as f64;
+            match k {
+                0 => (t * 0.37).sin() * 2.,
+                1 => (t * 0.11).cos() * 2.,
+                // some points are behind the camera
+                _ => (t * 0.07).sin() * 3. + 2.5,
+            }
+        });
+        let intensities0 = Array::from_shape_fn(n, |i| ((i as f64) * 0.3).sin());
+        let weights = Array::from_shape_fn(n, |i| ((i as f64) * 0.5).cos().abs());
+
+        // rotation around the y axis and a translation
+        let (c, s) = (0.1f64.cos(), 0.1f64.sin());
+        let transform10 = arr2(&[[c, 0., s, 0.1],
+                                 [0., 1., 0., -0.2],
+                                 [-s, 0., c, 0.3],
+                                 [0., 0., 0., 1.]]);
+
+        let camera_params1 = CameraParameters::new((20., 25.), (25., 20.));
+
+        let expected = naive(&transform10, &points0, &intensities0,
+                             &image1, &gx1, &gy1, &camera_params1, &weights);
+        let equation = normal_equation(
+            &transform10.view(), &points0.view(), &intensities0.view(),
+            &image1.view(), &gx1.view(), &gy1.view(),
+            &camera_params1, Some(&weights.view())
+        );
+
+        assert!(equation.count > 0);
+        assert!(equation.count < n);
+        assert_eq!(equation.count, expected.count);
+        assert!((equation.error - expected.error).abs() < 1e-8);
+        for a in 0..6 {
+            assert!((equation.jtwr[a] - expected.jtwr[a]).abs() < 1e-8);
+            for b in 0..6 {
+                assert!((equation.jtwj[a][b] - expected.jtwj[a][b]).abs() < 1e-8);
+            }
+        }
+
+        // all weights are one if not given
+        let ones = Array::ones(n);
+        let expected = naive(&transform10, &points0, &intensities0,
+                             &image1, &gx1, &gy1, &camera_params1, &ones);
+        let equation = normal_equation(
+            &transform10.view(), &points0.view(), &intensities0.view(),
+            &image1.view(), &gx1.view(), &gy1.view(),
+            &camera_params1, None
+        );
+        assert_eq!(equation.count, expected.count);
+        assert!((equation.error - expected.error).abs() < 1e-8);
+    }
+
+    #[test]
+    fn test_no_valid_points() {
+        let image1 = Array::zeros((10, 10));
+        let points0 = arr2(&[[0., 0., -1.], [100., 0., 1.]]);
+        let intensities0 = arr1(&[0., 0.]);
+        let transform10 = Array::eye(4);
+        let camera_params1 = CameraParameters::new((10., 10.), (5., 5.));
+        let equation = normal_equation(
+            &transform10.view(), &points0.view(), &intensities0.view(),
+            &image1.view(), &image1.view(), &image1.view(),
+            &camera_params1, None
+        );
+        assert_eq!(equation, NormalEquation::zeros());
+    }
+
+    #[test]
+    fn test_normal_equation_f32() {
+        let (height, width) = (20, 30);
+        let image1 = Array::from_shape_fn((height, width), |(y, x)| {
+            ((x as f64) / 3.).sin() * ((y as f64) / 5.).cos()
+        });
+        let gx1 = Array::from_shape_fn((height, width), |(y, x)| {
+            ((x as f64) / 3.).cos() * ((y as f64) / 5.).cos() / 3.
+        });
+        let gy1 = Array::from_shape_fn((height, width), |(y, x)| {
+            -((x as f64) / 3.).sin() * ((y as f64) / 5.).sin() / 5.
+        });
+        let points0 = Array::from_shape_fn((500, 3), |(i, k)| {
+            let t = i as f64;
+            match k {
+                0 => (t * 0.37).sin(),
+                1 => (t * 0.11).cos(),
+                _ => 2. + (t * 0.07).sin(),
+            }
+        });
+        let intensities0 = Array::from_shape_fn(500, |i| ((i as f64) * 0.3).sin());
+        let transform10 = arr2(&[[1., 0., 0., 0.1],
+                                 [0., 1., 0., -0.1],
+                                 [0., 0., 1., 0.2],
+                                 [0., 0., 0., 1.]]);
+        let camera_params1 = CameraParameters::new((10., 12.), (15., 10.));
+
+        let expected = normal_equation(
+            &transform10.view(), &points0.view(), &intensities0.view(),
+            &image1.view(), &gx1.view(), &gy1.view(), &camera_params1, None
+        );
+
+        let f = |a: &Array2<f64>| a.mapv(|v| v as f32);
+        let (image1, gx1, gy1, points0) = (f(&image1), f(&gx1), f(&gy1), f(&points0));
+        let intensities0 = intensities0.mapv(|v| v as f32);
+        let equation = normal_equation(
+            &transform10.view(), &points0.view(), &intensities0.view(),
+            &image1.view(), &gx1.view(), &gy1.view(), &camera_params1, None
+        );
+
+        assert!(expected.count > 0);
+        assert_eq!(equation.count, expected.count);
+        assert!((equation.error - expected.error).abs() < 1e-3 * expected.error);
+        for a in 0..6 {
+            let scale = expected.jtwj[a][a].abs().max(1.);
+            assert!((equation.jtwr[a] - expected.jtwr[a]).abs() < 1e-3 * scale);
+            for b in 0..6 {
+                assert!((equation.jtwj[a][b] - expected.jtwj[a][b]).abs() < 1e-3 * scale);
+            }
+        }
+    }
+}
@@ -1,28 +1,128 @@
-use ndarray::{arr2, Array, Array1, Array2, ArrayBase, Data, Ix1, Ix2};
-use crate::convolution::convolve2d;
+use ndarray::{Array, Array1, Array2, ArrayBase, Data, Ix1, Ix2};
+use rayon::prelude::*;
+
+// rows computed by one task
+const ROWS_PER_BLOCK: usize = 32;
+
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum Border {
+    // the outermost pixels of the results are 0
+    Zero,
+    // pixels outside the image are the nearest edge pixels
+    // (the same as the "reflect" mode of scipy.ndimage)
+    Reflect,
+}
+
+fn neighbor_rows(y: usize, height: usize) -> (usize, usize) {
+    (y.saturating_sub(1), std::cmp::min(y + 1, height - 1))
+}
+
+// Sobel derivatives of one row from the rows above / at / below it.
+// The kernel is separated into [1, 2, 1] and [-1, 0, 1] so that
+// every input pixel is read once per output row
+fn sobel_row(
+    above: &[f64],
+    center: &[f64],
+    below: &[f64],
+    border: Border,
+    scale: f64,
+    smooth: &mut [f64],
+    diff: &mut [f64],
+    gx: &mut [f64],
+    gy: &mut [f64],
+) {
+    let width = center.len();
+    for x in 0..width {
+        smooth[x] = above[x] + 2. * center[x] + below[x];
+        diff[x] = below[x] - above[x];
+    }
+
+    for x in 1..width.saturating_sub(1) {
+        gx[x] = scale * (smooth[x + 1] - smooth[x - 1]);
+        gy[x] = scale * (diff[x - 1] + 2. * diff[x] + diff[x + 1]);
+    }
+
+    match border {
+        Border::Zero => {
+            gx[0] = 0.;
+            gy[0] = 0.;
+            gx[width - 1] = 0.;
+            gy[width - 1] = 0.;
+        }
+        Border::Reflect => {
+            let l = std::cmp::min(1, width - 1);
+            gx[0] = scale * (smooth[l] - smooth[0]);
+            gy[0] = scale * (3. * diff[0] + diff[l]);
+            let (r, rl) = (width - 1, width.saturating_sub(2));
+            gx[r] = scale * (smooth[r] - smooth[rl]);
+            gy[r] = scale * (diff[rl] + 3. * diff[r]);
+        }
+    }
+}
+
+// Computes the Sobel derivatives along x and y in one pass.
+// gx is the correlation with scale * [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
+// and gy is the correlation with its transpose,
+// which are the same as scipy.ndimage.sobel if scale = 1.
+// Blocks of rows are processed in parallel
+pub fn sobel<S: Data<Elem = f64>>(
+    map: &ArrayBase<S, Ix2>,
+    border: Border,
+    scale: f64,
+) -> (Array2<f64>, Array2<f64>) {
+    let (height, width) = (map.shape()[0], map.shape()[1]);
+    let map = map.as_standard_layout();
+    let data = map.as_slice().unwrap();
+
+    let mut gx = vec![0.; height * width];
+    let mut gy = vec![0.; height * width];
+    if height > 0 && width > 0 {
+        let block_size = ROWS_PER_BLOCK * width;
+        gx.par_chunks_mut(block_size)
+            .zip(gy.par_chunks_mut(block_size))
+            .enumerate()
+            .for_each(|(block, (gx, gy))| {
+                let mut smooth = vec![0.; width];
+                let mut diff = vec![0.; width];
+                let begin = block * ROWS_PER_BLOCK;
+                let rows = gx.chunks_mut(width).zip(gy.chunks_mut(width));
+                for (i, (gx, gy)) in rows.enumerate() {
+                    let y = begin + i;
+                    if border == Border::Zero && (y == 0 || y == height - 1) {
+                        continue;  // already 0
+                    }
+                    let (ya, yb) = neighbor_rows(y, height);
+                    sobel_row(&data[ya * width..(ya + 1) * width],
+                              &data[y * width..(y + 1) * width],
+                              &data[yb * width..(yb + 1) * width],
+                              border, scale, &mut smooth, &mut diff, gx, gy);
+                }
+            });
+    }
+
+    let gx = Array::from_shape_vec((height, width), gx).unwrap();
+    let gy = Array::from_shape_vec((height, width), gy).unwrap();
+    (gx, gy)
+}
 
 pub fn sobel_x<S: Data<Elem = f64>>(
     map: &ArrayBase<S, Ix2>,
 ) -> Array2<f64> {
-    let kernel = arr2(
-        &[[1., 0., -1.],
-          [2., 0., -2.],
-          [1., 0., -1.]]
-    );
-    let pad_shape = (1, 1);
-    convolve2d(map, &kernel, pad_shape)
+    // kernel = [[1, 0, -1],
+    //           [2, 0, -2],
+    //           [1, 0, -1]]
+    let (gx, _) = sobel(map, Border::Zero, -1.);
+    gx
 }
 
 pub fn sobel_y<S: Data<Elem = f64>>(
     map: &ArrayBase<S, Ix2>,
 ) -> Array2<f64> {
-    let kernel = arr2(
-        &[[1., 2., 1.],
-          [0., 0., 0.],
-          [-1., -2., -1.]]
-    );
-    let pad_shape = (1, 1);
-    convolve2d(map, &kernel, pad_shape)
+    // kernel = [[1, 2, 1],
+    //           [0, 0, 0],
+    //           [-1, -2, -1]]
+    let (_, gy) = sobel(map, Border::Zero, -1.);
+    gy
 }
 
 pub fn gradient1d<S: Data<Elem = f64>>(x: &ArrayBase<S, Ix1>) -> Array1<f64> {
@@ -37,7 +137,8 @@ pub fn gradient1d<S: Data<Elem = f64>>(x: &ArrayBase<S, Ix1>) -> Array1<f64> {
 #[cfg(test)]
 mod tests {
     use super::*;
-    use ndarray::arr1;
+    use crate::convolution::convolve2d;
+    use ndarray::{arr1, arr2};
 
     #[test]
     fn test_sobel_x() {
@@ -83,4 +184,50 @@ mod tests {
         let expected = arr1(&[1. - (-1.), 0. - 1., 3. - 0., -2. - 3.]);
         assert_eq!(gradient1d(&intensities), expected);
     }
+
+    // reference implementation with explicit 3x3 kernels
+    fn sobel_naive(map: &Array2<f64>, border: Border) -> (Array2<f64>, Array2<f64>) {
+        let kx = arr2(
+            &[[-1., 0., 1.],
+              [-2., 0., 2.],
+              [-1., 0., 1.]]
+        );
+        let ky = kx.t().to_owned();
+        let (height, width) = (map.shape()[0], map.shape()[1]);
+        match border {
+            Border::Zero => (convolve2d(map, &kx, (1, 1)), convolve2d(map, &ky, (1, 1))),
+            Border::Reflect => {
+                let padded = Array::from_shape_fn((height + 2, width + 2), |(y, x)| {
+                    let y = std::cmp::min(y.saturating_sub(1), height - 1);
+                    let x = std::cmp::min(x.saturating_sub(1), width - 1);
+                    map[[y, x]]
+                });
+                let gx = convolve2d(&padded, &kx, (0, 0));
+                let gy = convolve2d(&padded, &ky, (0, 0));
+                (gx.slice(s![0..height, 0..width]).to_owned(),
+                 gy.slice(s![0..height, 0..width]).to_owned())
+            }
+        }
+    }
+
+    #[test]
+    fn test_sobel() {
+        // spans several row blocks
+        let map = Array::from_shape_fn((70, 13), |(y, x)| {
+            ((3 * x + 7 * y) % 11) as f64 - 0.5 * ((x * y) % 5) as f64
+        });
+
+        for &border in [Border::Zero, Border::Reflect].iter() {
+            let (gx, gy) = sobel(&map, border, 1.);
+            let (ex, ey) = sobel_naive(&map, border);
+            assert_eq!(gx, ex);
+            assert_eq!(gy, ey);
+        }
+
+        // transposed input is not contiguous
+        let (gx, gy) = sobel(&map.t(), Border::Reflect, 0.5);
+        let (ex, ey) = sobel_naive(&map.t().to_owned(), Border::Reflect);
+        assert_eq!(gx, 0.5 * ex);
+        assert_eq!(gy, 0.5 * ey);
+    }
 }
@@ -8,7 +8,7 @@ pub trait ImageRange<D, OutputType> {
 }
 
 #[inline]
-fn is_in_range<A: Float>(x: A, y: A, image_shape: &[usize]) -> bool {
+pub fn is_in_range<A: Float>(x: A, y: A, image_shape: &[usize]) -> bool {
     let h = image_shape[0] as f64;
     let w = image_shape[1] as f64;
     let x = NumCast::from(x).unwrap();
@@ -10,8 +10,12 @@ fn interpolate<A: Float>(
     image: &ArrayView2<'_, A>,
     coordinate: &ArrayView1<'_, A>
 ) -> A {
-    let cx = coordinate[0];
-    let cy = coordinate[1];
+    interpolate_xy(image, coordinate[0], coordinate[1])
+}
+
+// bilinear interpolation at (cx, cy) without allocating a coordinate array
+#[inline]
+pub fn interpolate_xy<A: Float>(image: &ArrayView2<'_, A>, cx: A, cy: A) -> A {
     let lx = cx.floor();
     let ly = cy.floor();
     let lxi: usize= NumCast::from(lx).unwrap();
@@ -9,6 +9,7 @@ extern crate test;
 pub mod camera;
 pub mod cmp;
 pub mod convolution;
+pub mod dvo;
 pub mod gradient;
 pub mod homogeneous;
 pub mod image_range;
@@ -1,42 +1,71 @@
 use crate::homogeneous::Homogeneous;
-use ndarray::{Array, Array1, ArrayBase, ArrayView1, Data, Ix1, Ix2};
+use ndarray::{Array, Array1, ArrayBase, ArrayView1, Data, Ix1, Ix2,
+              LinalgScalar, ScalarOperand};
+use num::NumCast;
+use num_traits::float::Float;
 
 static EPSILON: f64 = 1e-16;
 
+// fixed-size projection of a single point. does not allocate
+#[inline]
+pub fn project_xy(p: &[f64; 3]) -> [f64; 2] {
+    let z = p[2] + EPSILON;
+    [p[0] / z, p[1] / z]
+}
+
+#[inline]
+pub fn inv_project_xy(x: &[f64; 2], depth: f64) -> [f64; 3] {
+    [x[0] * depth, x[1] * depth, depth]
+}
+
 pub trait Projection<D, DepthType> {
-    fn project(&self) -> Array<f64, D>;
-    fn inv_project(&self, depth: DepthType) -> Array<f64, D>;
+    type Elem;
+    fn project(&self) -> Array<Self::Elem, D>;
+    fn inv_project(&self, depth: DepthType) -> Array<Self::Elem, D>;
 }
 
-fn project_impl(x: &ArrayView1<'_, f64>) -> Array1<f64> {
-    let z = x[2] + EPSILON;
+fn project_impl<A>(x: &ArrayView1<'_, A>) -> Array1<A>
+where
+    A: Float + LinalgScalar + ScalarOperand,
+{
+    let epsilon: A = NumCast::from(EPSILON).unwrap();
+    let z = x[2] + epsilon;
     &x.slice(s![0..2]) / z
 }
 
-fn inv_project_impl(x: &ArrayView1<'_, f64>, depth: f64) -> Array1<f64> {
+fn inv_project_impl<A>(x: &ArrayView1<'_, A>, depth: A) -> Array1<A>
+where
+    A: Float + LinalgScalar + ScalarOperand,
+{
     x.to_homogeneous() * depth
 }
 
-impl<S> Projection<Ix1, f64> for ArrayBase<S, Ix1>
+impl<A, S> Projection<Ix1, A> for ArrayBase<S, Ix1>
 where
-    S: Data<Elem = f64>,
+    S: Data<Elem = A>,
+    A: Float + LinalgScalar + ScalarOperand,
 {
-    fn project(&self) -> Array<f64, Ix1> {
+    type Elem = A;
+
+    fn project(&self) -> Array<A, Ix1> {
         assert_eq!(self.shape()[0], 3, "Input array length must be 3");
         project_impl(&self.view())
     }
 
-    fn inv_project(&self, depth: f64) -> Array<f64, Ix1> {
+    fn inv_project(&self, depth: A) -> Array<A, Ix1> {
         inv_project_impl(&self.view(), depth)
     }
 }
 
-impl<S1, S2> Projection<Ix2, &ArrayBase<S2, Ix1>> for ArrayBase<S1, Ix2>
+impl<A, S1, S2> Projection<Ix2, &ArrayBase<S2, Ix1>> for ArrayBase<S1, Ix2>
 where
-    S1: Data<Elem = f64>,
-    S2: Data<Elem = f64>
+    S1: Data<Elem = A>,
+    S2: Data<Elem = A>,
+    A: Float + LinalgScalar + ScalarOperand,
 {
-    fn project(&self) -> Array<f64, Ix2> {
+    type Elem = A;
+
+    fn project(&self) -> Array<A, Ix2> {
         assert_eq!(self.shape()[1], 3, "Input array shape must be (N, 3)");
 
         let n = self.shape()[0];
@@ -48,7 +77,7 @@ where
         us
     }
 
-    fn inv_project(&self, depths: &ArrayBase<S2, Ix1>) -> Array<f64, Ix2> {
+    fn inv_project(&self, depths: &ArrayBase<S2, Ix1>) -> Array<A, Ix2> {
         let n = self.shape()[0];
         let mut ps = Array::zeros((n, 3));
         for i in 0..n {
@@ -98,4 +127,14 @@ mod tests {
         assert_eq!(Projection::inv_project(&x, depth),
                    arr1(&[1., 4., 2.]));
     }
+
+    #[test]
+    fn test_projection_f32() {
+        let points = arr2(&[[1f32, 4., 2.], [-1., 3., 5.]]);
+        let xs = Projection::<Ix2, &Array<f32, Ix1>>::project(&points);
+        assert_eq!(xs, arr2(&[[0.5f32, 2.], [-0.2, 0.6]]));
+
+        let depths = arr1(&[2f32, 5.]);
+        assert_eq!(Projection::inv_project(&xs, &depths), points);
+    }
 }
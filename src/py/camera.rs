@@ -1,8 +1,26 @@
 use numpy::{IntoPyArray, PyArray1};
-use pyo3::prelude::{pyclass, pymethods, pymodule, Py, Python, PyObject, PyModule, PyResult};
+use pyo3::prelude::{pyclass, pymethods, pymodule, FromPyObject, Py, Python, PyObject,
+                    PyModule, PyResult};
+use pyo3::types::PyAny;
 use pyo3::type_object::PyTypeObject;
 use crate::camera::CameraParameters;
 
+pub fn camera_params_from_py(camera_params: &PyAny) -> PyResult<CameraParameters> {
+    let focal_length = camera_params.getattr("focal_length")?;
+    let offset = camera_params.getattr("offset")?;
+
+    let focal_length: &PyArray1<f64> = FromPyObject::extract(focal_length)?;
+    let offset: &PyArray1<f64> = FromPyObject::extract(offset)?;
+
+    let focal_length = focal_length.as_array();
+    let offset = offset.as_array();
+
+    Ok(CameraParameters::new(
+        (focal_length[0], focal_length[1]),
+        (offset[0], offset[1])
+    ))
+}
+
 #[pyclass]
 #[derive(Clone)]
 pub struct PyCameraParameters {
@@ -0,0 +1,84 @@
+use crate::dvo;
+use super::camera::camera_params_from_py;
+use ndarray::Array;
+use num_traits::float::Float;
+use numpy::{Element, IntoPyArray, PyArray1, PyArray2};
+use pyo3::types::PyAny;
+use pyo3::prelude::{pyfunction, pymodule, Py, PyModule, PyResult, Python};
+use pyo3::wrap_pyfunction;
+
+fn normal_equation_impl<A: Float + Element + Sync>(
+    py: Python<'_>,
+    transform10: &PyArray2<f64>,
+    points0: &PyArray2<A>,
+    intensities0: &PyArray1<A>,
+    image1: &PyArray2<A>,
+    gx1: &PyArray2<A>,
+    gy1: &PyArray2<A>,
+    camera_params1: &PyAny,
+    weights: Option<&PyArray1<A>>,
+) -> PyResult<(Py<PyArray2<f64>>, Py<PyArray1<f64>>, f64, usize)> {
+    let camera_params1 = camera_params_from_py(camera_params1)?;
+    let transform10 = transform10.as_array();
+    let points0 = points0.as_array();
+    let intensities0 = intensities0.as_array();
+    let image1 = image1.as_array();
+    let gx1 = gx1.as_array();
+    let gy1 = gy1.as_array();
+    let weights = weights.map(|w| w.as_array());
+
+    let equation = py.allow_threads(|| {
+        dvo::normal_equation(&transform10, &points0, &intensities0,
+                             &image1, &gx1, &gy1, &camera_params1,
+                             weights.as_ref())
+    });
+
+    let jtwj = Array::from_shape_fn((6, 6), |(i, j)| equation.jtwj[i][j]);
+    let jtwr = Array::from_shape_fn(6, |i| equation.jtwr[i]);
+    Ok((jtwj.into_pyarray(py).to_owned(),
+        jtwr.into_pyarray(py).to_owned(),
+        equation.error,
+        equation.count))
+}
+
+#[pyfunction]
+fn normal_equation(
+    py: Python<'_>,
+    transform10: &PyArray2<f64>,
+    points0: &PyArray2<f64>,
+    intensities0: &PyArray1<f64>,
+    image1: &PyArray2<f64>,
+    gx1: &PyArray2<f64>,
+    gy1: &PyArray2<f64>,
+    camera_params1: &PyAny,
+    weights: Option<&PyArray1<f64>>,
+) -> PyResult<(Py<PyArray2<f64>>, Py<PyArray1<f64>>, f64, usize)> {
+    normal_equation_impl(py, transform10, points0, intensities0,
+                         image1, gx1, gy1, camera_params1, weights)
+}
+
+// same as 'normal_equation' but points, intensities and images are f32.
+// the transform and the returned system are f64
+#[pyfunction]
+fn normal_equation_f32(
+    py: Python<'_>,
+    transform10: &PyArray2<f64>,
+    points0: &PyArray2<f32>,
+    intensities0: &PyArray1<f32>,
+    image1: &PyArray2<f32>,
+    gx1: &PyArray2<f32>,
+    gy1: &PyArray2<f32>,
+    camera_params1: &PyAny,
+    weights: Option<&PyArray1<f32>>,
+) -> PyResult<(Py<PyArray2<f64>>, Py<PyArray1<f64>>, f64, usize)> {
+    normal_equation_impl(py, transform10, points0, intensities0,
+                         image1, gx1, gy1, camera_params1, weights)
+}
+
+#[pymodule(dvo)]
+fn dvo_module(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
+    m.add_wrapped(wrap_pyfunction!(normal_equation))?;
+    m.add_wrapped(wrap_pyfunction!(normal_equation_f32))?;
+
+    Ok(())
+}
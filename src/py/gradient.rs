@@ -0,0 +1,30 @@
+use numpy::{IntoPyArray, PyArray2};
+use pyo3::prelude::{pyfunction, pymodule, Py, PyModule, PyResult, Python};
+use pyo3::types::PyTuple;
+use pyo3::wrap_pyfunction;
+use crate::gradient::{self, Border};
+
+#[pyfunction]
+fn sobel<'a>(
+    py: Python<'a>,
+    image: &PyArray2<f64>,
+    scale: Option<f64>,
+) -> &'a PyTuple {
+    let image = image.as_array();
+    let (gx, gy) = py.allow_threads(|| {
+        gradient::sobel(&image, Border::Reflect, scale.unwrap_or(1.))
+    });
+
+    let ret: Vec<Py<PyArray2<f64>>> = vec![
+        gx.into_pyarray(py).to_owned(),
+        gy.into_pyarray(py).to_owned(),
+    ];
+    PyTuple::new(py, ret)
+}
+
+#[pymodule(gradient)]
+fn gradient_module(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
+    m.add_wrapped(wrap_pyfunction!(sobel))?;
+
+    Ok(())
+}
@@ -12,9 +12,9 @@ fn to_homogeneous_vec(py: Python<'_>, x: &PyArray1<f64>) -> Py<PyArray1<f64>> {
 
 #[pyfunction]
 fn to_homogeneous_vecs(py: Python<'_>, xs: &PyArray2<f64>) -> Py<PyArray2<f64>> {
-    Homogeneous::to_homogeneous(&xs.as_array())
-        .into_pyarray(py)
-        .to_owned()
+    let xs = xs.as_array();
+    let ys = py.allow_threads(|| Homogeneous::to_homogeneous(&xs));
+    ys.into_pyarray(py).to_owned()
 }
 
 #[pyfunction]
@@ -27,10 +27,9 @@ fn from_homogeneous_vec(py: Python<'_>, x: &PyArray1<f64>) -> Py<PyArray1<f64>>
 
 #[pyfunction]
 fn from_homogeneous_vecs(py: Python<'_>, xs: &PyArray2<f64>) -> Py<PyArray2<f64>> {
-    Homogeneous::from_homogeneous(&xs.as_array())
-        .to_owned()
-        .into_pyarray(py)
-        .to_owned()
+    let xs = xs.as_array();
+    let ys = py.allow_threads(|| Homogeneous::from_homogeneous(&xs).to_owned());
+    ys.into_pyarray(py).to_owned()
 }
 
 #[pymodule(homogeneous)]
@@ -9,14 +9,32 @@ fn interpolation(
     image: &PyArray2<f64>,
     coordinates: &PyArray2<f64>,
 ) -> Py<PyArray1<f64>> {
-    Interpolation::interpolate(&image.as_array(), &coordinates.as_array())
-        .into_pyarray(py)
-        .to_owned()
+    let image = image.as_array();
+    let coordinates = coordinates.as_array();
+    let intensities = py.allow_threads(|| {
+        Interpolation::interpolate(&image, &coordinates)
+    });
+    intensities.into_pyarray(py).to_owned()
+}
+
+#[pyfunction]
+fn interpolation_f32(
+    py: Python<'_>,
+    image: &PyArray2<f32>,
+    coordinates: &PyArray2<f32>,
+) -> Py<PyArray1<f32>> {
+    let image = image.as_array();
+    let coordinates = coordinates.as_array();
+    let intensities = py.allow_threads(|| {
+        Interpolation::interpolate(&image, &coordinates)
+    });
+    intensities.into_pyarray(py).to_owned()
 }
 
 #[pymodule(interpolation)]
 fn interpolation_module(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_wrapped(wrap_pyfunction!(interpolation))?;
+    m.add_wrapped(wrap_pyfunction!(interpolation_f32))?;
 
     Ok(())
 }
@@ -1,4 +1,6 @@
 pub mod camera;
+pub mod dvo;
+pub mod gradient;
 pub mod homogeneous;
 pub mod interpolation;
 pub mod projection;
@@ -13,9 +13,11 @@ fn project_vec(py: Python<'_>, x: &PyArray1<f64>) -> Py<PyArray1<f64>> {
 
 #[pyfunction]
 fn project_vecs(py: Python<'_>, xs: &PyArray2<f64>) -> Py<PyArray2<f64>> {
-    Projection::<Ix2, &Array<f64, Ix1>>::project(&xs.as_array())
-        .into_pyarray(py)
-        .to_owned()
+    let xs = xs.as_array();
+    let projected = py.allow_threads(|| {
+        Projection::<Ix2, &Array<f64, Ix1>>::project(&xs)
+    });
+    projected.into_pyarray(py).to_owned()
 }
 
 #[pyfunction]
@@ -35,9 +37,31 @@ fn inv_project_vecs(
     xs: &PyArray2<f64>,
     depths: &PyArray1<f64>,
 ) -> Py<PyArray2<f64>> {
-    Projection::inv_project(&xs.as_array(), &depths.as_array())
-        .into_pyarray(py)
-        .to_owned()
+    let xs = xs.as_array();
+    let depths = depths.as_array();
+    let points = py.allow_threads(|| Projection::inv_project(&xs, &depths));
+    points.into_pyarray(py).to_owned()
+}
+
+#[pyfunction]
+fn project_vecs_f32(py: Python<'_>, xs: &PyArray2<f32>) -> Py<PyArray2<f32>> {
+    let xs = xs.as_array();
+    let projected = py.allow_threads(|| {
+        Projection::<Ix2, &Array<f32, Ix1>>::project(&xs)
+    });
+    projected.into_pyarray(py).to_owned()
+}
+
+#[pyfunction]
+fn inv_project_vecs_f32(
+    py: Python<'_>,
+    xs: &PyArray2<f32>,
+    depths: &PyArray1<f32>,
+) -> Py<PyArray2<f32>> {
+    let xs = xs.as_array();
+    let depths = depths.as_array();
+    let points = py.allow_threads(|| Projection::inv_project(&xs, &depths));
+    points.into_pyarray(py).to_owned()
 }
 
 #[pymodule(projection)]
@@ -46,6 +70,8 @@ fn projection_module(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_wrapped(wrap_pyfunction!(project_vecs))?;
     m.add_wrapped(wrap_pyfunction!(inv_project_vec))?;
     m.add_wrapped(wrap_pyfunction!(inv_project_vecs))?;
+    m.add_wrapped(wrap_pyfunction!(project_vecs_f32))?;
+    m.add_wrapped(wrap_pyfunction!(inv_project_vecs_f32))?;
 
     Ok(())
 }
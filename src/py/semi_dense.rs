@@ -1,36 +1,26 @@
-use crate::camera::CameraParameters;
+use std::sync::{Arc, Mutex};
+
 use crate::semi_dense::age;
-use crate::semi_dense::{Flag, Frame, Hypothesis, Params, VarianceCoefficients};
-use crate::semi_dense::gradient::ImageGradient;
+use crate::semi_dense::fusion;
+use crate::semi_dense::{Flag, Frame, Hypothesis, PairContext, Params,
+                        ReferenceFrames, UpdateStats, VarianceCoefficients};
+use crate::semi_dense::flag::N_FLAGS;
 use crate::semi_dense::hypothesis;
 use crate::semi_dense::numeric::Inverse;
 use crate::semi_dense::propagation;
-// use crate::semi_dense::regularization;
+use crate::semi_dense::regularization;
 use crate::semi_dense::semi_dense;
 use crate::warp::PerspectiveWarp;
-use super::camera::PyCameraParameters;
-use ndarray::arr1;
-use numpy::{IntoPyArray, PyArray1, PyArray2};
-use pyo3::types::{PyAny, PyList, PyTuple};
-use pyo3::prelude::{pyfunction, pymodule, PyModule, PyResult,
+use super::camera::{camera_params_from_py, PyCameraParameters};
+use ndarray::{ArrayBase, Data, Dimension};
+use numpy::{IntoPyArray, PyArray, PyArray1, PyArray2};
+use numpy::npyffi::NPY_ARRAY_WRITEABLE;
+use pyo3::types::{PyAny, PyDict, PyList, PyTuple};
+use pyo3::prelude::{pyfunction, pymodule, PyModule, PyResult, PyRef,
                     Py, Python, pymethods, ToPyObject, PyObject, FromPyObject};
+use pyo3::exceptions::{RuntimeError, ValueError};
 use pyo3::wrap_pyfunction;
-
-fn camera_params_from_py(camera_params: &PyAny) -> PyResult<CameraParameters> {
-    let focal_length = camera_params.getattr("focal_length")?;
-    let offset = camera_params.getattr("offset")?;
-
-    let focal_length: &PyArray1<f64> = FromPyObject::extract(focal_length)?;
-    let offset: &PyArray1<f64> = FromPyObject::extract(offset)?;
-
-    let focal_length = focal_length.as_array();
-    let offset = offset.as_array();
-
-    Ok(CameraParameters::new(
-        (focal_length[0], focal_length[1]),
-        (offset[0], offset[1])
-    ))
-}
+use rayon::{ThreadPool, ThreadPoolBuilder};
 
 #[pyfunction]
 fn increment_age(
@@ -41,12 +31,15 @@ fn increment_age(
     transform10: &PyArray2<f64>,
     depth_map0: &PyArray2<f64>,
 ) -> PyResult<Py<PyArray2<usize>>> {
-    let age = age::increment_age(
-        &age_map0.as_array(),
-        &camera_params_from_py(camera_params0)?,
-        &camera_params_from_py(camera_params1)?,
-        &transform10.as_array(), &depth_map0.as_array()
-    );
+    let camera_params0 = camera_params_from_py(camera_params0)?;
+    let camera_params1 = camera_params_from_py(camera_params1)?;
+    let age_map0 = age_map0.as_array();
+    let transform10 = transform10.as_array();
+    let depth_map0 = depth_map0.as_array();
+    let age = py.allow_threads(|| {
+        age::increment_age(&age_map0, &camera_params0, &camera_params1,
+                           &transform10, &depth_map0)
+    });
     Ok(age.into_pyarray(py).to_owned())
 }
 
@@ -59,11 +52,12 @@ impl Frame {
         image: &PyArray2<f64>,
         transform: &PyArray2<f64>,
     ) -> PyResult<Self> {
-        Ok(Frame {
-            camera_params: camera_params_from_py(camera_params)?,
-            image: image.as_array().to_owned(),
-            transform: transform.as_array().to_owned()
-        })
+        // the image is copied only here. Python may modify or free its array
+        Ok(Frame::from_arrays(
+            camera_params_from_py(camera_params)?,
+            image.as_array().to_owned(),
+            transform.as_array().to_owned()
+        ))
     }
 
     #[getter]
@@ -75,9 +69,10 @@ impl Frame {
         PyCameraParameters::new(py, (fx, fy), (ox, oy))
     }
 
+    // returns a copy because the buffer is shared with the other clones
     #[getter]
     fn image(&self, py: Python<'_>) -> Py<PyArray2<f64>> {
-        let image = self.image.to_owned();
+        let image = self.image.as_ref().clone();
         image.into_pyarray(py).to_owned()
     }
 
@@ -88,6 +83,57 @@ impl Frame {
     }
 }
 
+#[pymethods]
+impl ReferenceFrames {
+    #[new]
+    pub fn new_(capacity: usize) -> Self {
+        ReferenceFrames::new(capacity)
+    }
+
+    // returns the id of the pushed frame
+    #[name = "push"]
+    fn push_(&mut self, frame: &Frame) -> usize {
+        self.push(frame.clone())
+    }
+
+    // returns the number of dropped frames
+    #[name = "evict_unreferenced"]
+    fn evict_unreferenced_(&mut self, age_map: &PyArray2<usize>) -> usize {
+        self.evict_unreferenced(&age_map.as_array())
+    }
+
+    #[getter(capacity)]
+    fn capacity_(&self) -> usize {
+        self.capacity()
+    }
+
+    #[getter]
+    fn n_frames(&self) -> usize {
+        self.len()
+    }
+
+    #[getter(newest_id)]
+    fn newest_id_(&self) -> Option<usize> {
+        self.newest_id()
+    }
+
+    #[getter(oldest_id)]
+    fn oldest_id_(&self) -> Option<usize> {
+        self.oldest_id()
+    }
+
+    // in bytes
+    #[name = "memory_usage"]
+    fn memory_usage_(&self) -> usize {
+        self.memory_usage()
+    }
+
+    #[getter]
+    fn frames(&self) -> Vec<Frame> {
+        self.to_vec()
+    }
+}
+
 #[pymethods]
 impl Params {
     #[new]
@@ -98,12 +144,18 @@ impl Params {
         photo_coeff: f64,
         ref_step_size: f64,
         min_gradient: f64,
+        subpixel: Option<bool>,
+        coarse_step_factor: Option<usize>,
+        min_image_gradient: Option<f64>,
     ) -> Self {
         Params {
             inv_depth_range: (max_depth.inv(), min_depth.inv()),
             var_coeffs: VarianceCoefficients { geo: geo_coeff, photo: photo_coeff },
             ref_step_size: ref_step_size,
-            min_gradient: min_gradient
+            min_gradient: min_gradient,
+            subpixel: subpixel.unwrap_or(false),
+            coarse_step_factor: coarse_step_factor.unwrap_or(1),
+            min_image_gradient: min_image_gradient.unwrap_or(0.)
         }
     }
 }
@@ -111,6 +163,7 @@ impl Params {
 enum Ret {
     I64(Py<PyArray2<i64>>),
     F64(Py<PyArray2<f64>>),
+    Dict(PyObject),
 }
 
 impl ToPyObject for Ret {
@@ -118,10 +171,41 @@ impl ToPyObject for Ret {
         match self {
             Ret::I64(v) => return v.to_object(py),
             Ret::F64(v) => return v.to_object(py),
+            Ret::Dict(v) => return v.clone_ref(py),
         }
     }
 }
 
+const FLAGS: [Flag; N_FLAGS] = [
+    Flag::Success,
+    Flag::HypothesisOutOfSerchRange,
+    Flag::KeyOutOfRange,
+    Flag::RefCloseOutOfRange,
+    Flag::RefFarOutOfRange,
+    Flag::RefEpipolarTooShort,
+    Flag::InsufficientGradient,
+    Flag::NegativePriorDepth,
+    Flag::NegativeRefDepth,
+    Flag::NotProcessed,
+];
+
+// flag counts are keyed by the integer values of the flags,
+// which are the values of tadataka.vo.semi_dense.flag.ResultFlag
+fn stats_to_dict(py: Python<'_>, stats: &UpdateStats) -> PyResult<PyObject> {
+    let flag_counts = PyDict::new(py);
+    for flag in FLAGS.iter() {
+        flag_counts.set_item(*flag as i64, stats.count(*flag))?;
+    }
+
+    let dict = PyDict::new(py);
+    dict.set_item("flag_counts", flag_counts)?;
+    dict.set_item("n_attempted", stats.n_attempted)?;
+    dict.set_item("n_succeeded", stats.n_succeeded)?;
+    dict.set_item("n_age_clamped", stats.n_age_clamped)?;
+    dict.set_item("elapsed", stats.elapsed.as_secs_f64())?;
+    Ok(dict.to_object(py))
+}
+
 // interface for debug
 #[pyfunction]
 fn estimate_debug_<'a>(
@@ -133,8 +217,6 @@ fn estimate_debug_<'a>(
     refframe: &Frame,
     params: &Params,
 ) -> (f64, f64, i64) {
-    let image_grad = ImageGradient::new(&keyframe.image);
-
     let result = hypothesis::check_args(prior_depth.inv(),
                                         prior_variance, params.inv_depth_range);
     if let Err(flag) = result {
@@ -145,44 +227,220 @@ fn estimate_debug_<'a>(
                                 params.inv_depth_range);
 
     let u_key = u_key.as_array();
-    let u_key = arr1(&[u_key[0] as f64, u_key[1] as f64]);
+    let u_key = [u_key[0] as f64, u_key[1] as f64];
+    let context = PairContext::new(keyframe, refframe);
     let result = semi_dense::estimate(&u_key, &prior,
-                                      keyframe, refframe, &image_grad, params);
+                                      keyframe, refframe, &context, params,
+                                      &mut semi_dense::Scratch::new());
     match result {
         Err(flag) => return (prior_depth, prior_variance, flag as i64),
         Ok(h) => return (h.inv_depth.inv(), h.variance, Flag::Success as i64),
     };
 }
 
+// Pools for the 'n_threads' argument of 'update_depth', which is called
+// once per frame. They are built once per number of threads and kept
+static THREAD_POOLS: Mutex<Vec<(usize, Arc<ThreadPool>)>> = Mutex::new(Vec::new());
+
+fn thread_pool(n_threads: usize) -> PyResult<Arc<ThreadPool>> {
+    let mut pools = THREAD_POOLS.lock().unwrap_or_else(|e| e.into_inner());
+    if let Some((_, pool)) = pools.iter().find(|(n, _)| *n == n_threads) {
+        return Ok(pool.clone());
+    }
+    let pool = ThreadPoolBuilder::new()
+        .num_threads(n_threads)
+        .build()
+        .map_err(|e| RuntimeError::py_err(format!("Failed to build a thread pool: {}", e)))?;
+    let pool = Arc::new(pool);
+    pools.push((n_threads, pool.clone()));
+    Ok(pool)
+}
+
+// Addresses [begin, end) spanned by the elements of 'array'
+fn memory_range<S: Data, D: Dimension>(array: &ArrayBase<S, D>) -> (usize, usize) {
+    if array.len() == 0 {
+        return (0, 0);
+    }
+    let item_size = std::mem::size_of::<S::Elem>() as isize;
+    let begin = array.as_ptr() as isize;
+    let (mut low, mut high) = (begin, begin);
+    for (&n, &stride) in array.shape().iter().zip(array.strides().iter()) {
+        let offset = (n as isize - 1) * stride * item_size;
+        if offset < 0 {
+            low += offset;
+        } else {
+            high += offset;
+        }
+    }
+    (low as usize, (high + item_size) as usize)
+}
+
+fn may_share_memory(a: (usize, usize), b: (usize, usize)) -> bool {
+    a.0 < a.1 && b.0 < b.1 && a.0 < b.1 && b.0 < a.1
+}
+
+fn is_writeable<T, D>(array: &PyArray<T, D>) -> bool {
+    unsafe { (*array.as_array_ptr()).flags & NPY_ARRAY_WRITEABLE != 0 }
+}
+
+// Shapes are checked before the GIL is released since a panic in
+// the native code cannot be turned into an exception
+fn check_shape(
+    name: &str,
+    shape: &[usize],
+    expected_name: &str,
+    expected: &[usize],
+) -> PyResult<()> {
+    if shape != expected {
+        return Err(ValueError::py_err(format!(
+            "'{}' has shape {:?} but '{}' has shape {:?}",
+            name, shape, expected_name, expected
+        )));
+    }
+    Ok(())
+}
+
+// Outputs are written while the inputs are read, so they have to be
+// writeable arrays of the shape of the age map that share memory
+// neither with the inputs nor with each other
+fn check_outputs(
+    shape: &[usize],
+    inputs: &[(&str, (usize, usize))],
+    outputs: &[(&str, &[usize], bool, (usize, usize))],
+) -> PyResult<()> {
+    let mut checked = inputs.to_vec();
+    for &(name, output_shape, writeable, range) in outputs.iter() {
+        check_shape(name, output_shape, "age_map", shape)?;
+        if !writeable {
+            return Err(ValueError::py_err(format!("'{}' is not writeable", name)));
+        }
+        for &(other, other_range) in checked.iter() {
+            if may_share_memory(range, other_range) {
+                return Err(ValueError::py_err(format!(
+                    "'{}' shares memory with '{}'", name, other
+                )));
+            }
+        }
+        checked.push((name, range));
+    }
+    Ok(())
+}
+
+// 'refframes' is a list of frames from the oldest to the newest
+// or a ReferenceFrames.
+// Maps are read through views of the given NumPy arrays without copying.
+// If 'out_depth', 'out_variance' and 'out_flag' are given, the results are
+// written into them and they are returned instead of new arrays.
+// ValueError is raised if they do not have the shape of 'age_map', are not
+// writeable or share memory with the input maps or each other
 #[pyfunction]
 fn update_depth<'a>(
     py: Python<'a>,
     keyframe: &Frame,
-    refframe_pylist: &PyList,
+    refframes: &PyAny,
     age_map: &PyArray2<usize>,
     prior_depth: &PyArray2<f64>,
     prior_variance: &PyArray2<f64>,
     params: &Params,
+    n_threads: Option<usize>,
+    progress: Option<PyObject>,
+    return_stats: Option<bool>,
+    out_depth: Option<&'a PyArray2<f64>>,
+    out_variance: Option<&'a PyArray2<f64>>,
+    out_flag: Option<&'a PyArray2<i64>>,
 ) -> PyResult<&'a PyTuple> {
-    let mut refframes = Vec::new();
-    for f in refframe_pylist {
-        let c = Frame::extract(f).unwrap();
-        refframes.push(c);
+    // frames share their image buffers so this does not copy images
+    let refframes = match refframes.extract::<PyRef<ReferenceFrames>>() {
+        Ok(store) => (*store).clone(),
+        Err(_) => {
+            let mut frames = Vec::new();
+            for f in refframes.downcast::<PyList>()? {
+                frames.push(Frame::extract(f)?);
+            }
+            ReferenceFrames::from_vec(frames)
+        }
+    };
+
+    let age_map = age_map.as_array();
+    let prior_depth = prior_depth.as_array();
+    let prior_variance = prior_variance.as_array();
+    let shape = (age_map.shape()[0], age_map.shape()[1]);
+
+    check_shape("prior_depth", prior_depth.shape(), "age_map", age_map.shape())?;
+    check_shape("prior_variance", prior_variance.shape(), "age_map", age_map.shape())?;
+    check_shape("keyframe image", keyframe.image.shape(), "age_map", age_map.shape())?;
+    for frame in refframes.iter() {
+        check_shape("refframe image", frame.image.shape(), "age_map", age_map.shape())?;
+    }
+    let inputs = [
+        ("age_map", memory_range(&age_map)),
+        ("prior_depth", memory_range(&prior_depth)),
+        ("prior_variance", memory_range(&prior_variance)),
+    ];
+    let mut outputs = Vec::new();
+    if let Some(out) = out_depth {
+        outputs.push(("out_depth", out.shape(), is_writeable(out),
+                      memory_range(&out.as_array())));
     }
+    if let Some(out) = out_variance {
+        outputs.push(("out_variance", out.shape(), is_writeable(out),
+                      memory_range(&out.as_array())));
+    }
+    if let Some(out) = out_flag {
+        outputs.push(("out_flag", out.shape(), is_writeable(out),
+                      memory_range(&out.as_array())));
+    }
+    check_outputs(age_map.shape(), &inputs, &outputs)?;
+
+    // the global pool, which uses all cores, if n_threads is not given or 0
+    let pool = match n_threads {
+        None | Some(0) => None,
+        Some(n) => Some(thread_pool(n)?),
+    };
+
+    let out_depth = out_depth.unwrap_or_else(|| PyArray2::zeros(py, shape, false));
+    let out_variance = out_variance.unwrap_or_else(|| PyArray2::zeros(py, shape, false));
+    let out_flag = out_flag.unwrap_or_else(|| PyArray2::zeros(py, shape, false));
+
+    // called from worker threads, so the GIL is acquired for each call.
+    // exceptions raised by the callback are printed and ignored
+    let callback = progress.map(|progress| {
+        move |n_processed: usize, n_rows: usize| {
+            let gil = Python::acquire_gil();
+            let py = gil.python();
+            if let Err(e) = progress.call1(py, (n_processed, n_rows)) {
+                e.print(py);
+            }
+        }
+    });
+    let callback = callback.as_ref().map(|f| f as &(dyn Fn(usize, usize) + Sync));
 
-    let (flag_map, depth_map, variance_map) = semi_dense::update_depth(
-        keyframe,
-        &refframes,
-        &age_map.as_array().to_owned(),
-        &prior_depth.as_array().to_owned(),
-        &prior_variance.as_array().to_owned(),
-        &params
-    );
+    let mut depth_map = out_depth.as_array_mut();
+    let mut variance_map = out_variance.as_array_mut();
+    let mut flag_map = out_flag.as_array_mut();
+    let stats = py.allow_threads(|| {
+        semi_dense::update_depth_into(
+            keyframe,
+            &refframes,
+            &age_map,
+            &prior_depth,
+            &prior_variance,
+            &params,
+            pool.as_ref().map(|pool| pool.as_ref()),
+            callback,
+            &mut flag_map,
+            &mut depth_map,
+            &mut variance_map
+        )
+    });
 
     let mut ret = Vec::new();
-    ret.push(Ret::F64(depth_map.into_pyarray(py).to_owned()));
-    ret.push(Ret::F64(variance_map.into_pyarray(py).to_owned()));
-    ret.push(Ret::I64(flag_map.into_pyarray(py).to_owned()));
+    ret.push(Ret::F64(out_depth.to_owned()));
+    ret.push(Ret::F64(out_variance.to_owned()));
+    ret.push(Ret::I64(out_flag.to_owned()));
+    if return_stats.unwrap_or(false) {
+        ret.push(Ret::Dict(stats_to_dict(py, &stats)?));
+    }
     Ok(PyTuple::new(py, ret))
 }
 
@@ -202,14 +460,20 @@ fn propagate<'a>(
     let camera_params0 = camera_params_from_py(camera_params0)?;
     let camera_params1 = camera_params_from_py(camera_params1)?;
     let warp10 = PerspectiveWarp::new(&transform10, &camera_params0, &camera_params1);
-    let (depth_map1, variance_map1) = propagation::propagate(
-        &warp10,
-        &depth_map0.as_array().to_owned(),
-        &variance_map0.as_array().to_owned(),
-        default_depth,
-        default_variance,
-        uncertaintity_bias
-    );
+    let depth_map0 = depth_map0.as_array();
+    let variance_map0 = variance_map0.as_array();
+    check_shape("variance_map0", variance_map0.shape(),
+                "depth_map0", depth_map0.shape())?;
+    let (depth_map1, variance_map1) = py.allow_threads(|| {
+        propagation::propagate(
+            &warp10,
+            &depth_map0,
+            &variance_map0,
+            default_depth,
+            default_variance,
+            uncertaintity_bias
+        )
+    });
 
     let mut ret = Vec::new();
     ret.push(depth_map1.into_pyarray(py).to_owned());
@@ -217,30 +481,106 @@ fn propagate<'a>(
     Ok(PyTuple::new(py, ret))
 }
 
-// #[pyfunction]
-// fn regularize<'a>(
-//     py: Python<'a>,
-//     depth_map: &PyArray2<f64>,
-//     variance_map: &PyArray2<f64>,
-//     flag_map: &PyArray2<i64>,
-// ) -> Py<PyArray2<f64>> {
-//     let regularized = regularization::regularize(
-//         &depth_map.as_array().to_owned(),
-//         &variance_map.as_array().to_owned(),
-//         &flag_map.as_array().to_owned()
-//     );
-//     regularized.into_pyarray(py).to_owned()
-// }
+#[pyfunction]
+fn propagate_with_age<'a>(
+    py: Python<'a>,
+    age_map0: &PyArray2<usize>,
+    transform10: &PyArray2<f64>,
+    camera_params0: &PyAny,
+    camera_params1: &PyAny,
+    depth_map0: &PyArray2<f64>,
+    variance_map0: &PyArray2<f64>,
+    default_depth: f64,
+    default_variance: f64,
+    uncertaintity_bias: f64,
+) -> PyResult<&'a PyTuple> {
+    let transform10 = transform10.as_array();
+    let camera_params0 = camera_params_from_py(camera_params0)?;
+    let camera_params1 = camera_params_from_py(camera_params1)?;
+    let warp10 = PerspectiveWarp::new(&transform10, &camera_params0, &camera_params1);
+    let age_map0 = age_map0.as_array();
+    let depth_map0 = depth_map0.as_array();
+    let variance_map0 = variance_map0.as_array();
+    check_shape("depth_map0", depth_map0.shape(),
+                "age_map0", age_map0.shape())?;
+    check_shape("variance_map0", variance_map0.shape(),
+                "age_map0", age_map0.shape())?;
+    let (age_map1, depth_map1, variance_map1) = py.allow_threads(|| {
+        propagation::propagate_with_age(
+            &warp10,
+            &age_map0,
+            &depth_map0,
+            &variance_map0,
+            default_depth,
+            default_variance,
+            uncertaintity_bias
+        )
+    });
+
+    let ret: Vec<PyObject> = vec![
+        age_map1.into_pyarray(py).to_object(py),
+        depth_map1.into_pyarray(py).to_object(py),
+        variance_map1.into_pyarray(py).to_object(py),
+    ];
+    Ok(PyTuple::new(py, ret))
+}
+
+#[pyfunction]
+fn regularize(
+    py: Python<'_>,
+    depth_map: &PyArray2<f64>,
+    variance_map: &PyArray2<f64>,
+    flag_map: &PyArray2<i64>,
+) -> PyResult<Py<PyArray2<f64>>> {
+    let depth_map = depth_map.as_array();
+    let variance_map = variance_map.as_array();
+    let flag_map = flag_map.as_array();
+    check_shape("variance_map", variance_map.shape(),
+                "depth_map", depth_map.shape())?;
+    check_shape("flag_map", flag_map.shape(), "depth_map", depth_map.shape())?;
+    let regularized = py.allow_threads(|| {
+        regularization::regularize(&depth_map, &variance_map, &flag_map)
+    });
+    Ok(regularized.into_pyarray(py).to_owned())
+}
+
+#[pyfunction]
+fn fusion_arrays<'a>(
+    py: Python<'a>,
+    mu1: &PyArray2<f64>,
+    mu2: &PyArray2<f64>,
+    var1: &PyArray2<f64>,
+    var2: &PyArray2<f64>,
+) -> PyResult<&'a PyTuple> {
+    let mu1 = mu1.as_array();
+    let mu2 = mu2.as_array();
+    let var1 = var1.as_array();
+    let var2 = var2.as_array();
+    check_shape("mu2", mu2.shape(), "mu1", mu1.shape())?;
+    check_shape("var1", var1.shape(), "mu1", mu1.shape())?;
+    check_shape("var2", var2.shape(), "mu1", mu1.shape())?;
+    let (mu, var) = py.allow_threads(|| {
+        fusion::fusion_arrays(&mu1, &mu2, &var1, &var2)
+    });
+
+    let mut ret = Vec::new();
+    ret.push(mu.into_pyarray(py).to_owned());
+    ret.push(var.into_pyarray(py).to_owned());
+    Ok(PyTuple::new(py, ret))
+}
 
 #[pymodule(semi_dense)]
 fn semi_dense_module(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_class::<Frame>()?;
     m.add_class::<Params>()?;
+    m.add_class::<ReferenceFrames>()?;
     m.add_wrapped(wrap_pyfunction!(estimate_debug_))?;
     m.add_wrapped(wrap_pyfunction!(increment_age))?;
     m.add_wrapped(wrap_pyfunction!(update_depth))?;
     m.add_wrapped(wrap_pyfunction!(propagate))?;
-    // m.add_wrapped(wrap_pyfunction!(regularize))?;
+    m.add_wrapped(wrap_pyfunction!(propagate_with_age))?;
+    m.add_wrapped(wrap_pyfunction!(regularize))?;
+    m.add_wrapped(wrap_pyfunction!(fusion_arrays))?;
 
     Ok(())
 }
@@ -9,9 +9,12 @@ fn transform(
     transform10: &PyArray2<f64>,
     points0: &PyArray2<f64>,
 ) -> Py<PyArray2<f64>> {
-    Transform::transform(&transform10.as_array(), &points0.as_array())
-        .into_pyarray(py)
-        .to_owned()
+    let transform10 = transform10.as_array();
+    let points0 = points0.as_array();
+    let points1 = py.allow_threads(|| {
+        Transform::transform(&transform10, &points0)
+    });
+    points1.into_pyarray(py).to_owned()
 }
 
 #[pymodule(transform)]
@@ -55,21 +55,39 @@ fn warp_vecs<'a>(
     xs: &PyArray2<f64>,
     depths: &PyArray1<f64>,
 ) -> Py<PyTuple> {
-    let (xs1, depths1) = Warp::warp(
-        &transform10.as_array(),
-        &xs.as_array(),
-        &depths.as_array()
-    );
+    let transform10 = transform10.as_array();
+    let xs = xs.as_array();
+    let depths = depths.as_array();
+    let (xs1, depths1) = py.allow_threads(|| {
+        Warp::warp(&transform10, &xs, &depths)
+    });
     let mut ret = Vec::new();
     ret.push(Ret2D::X(xs1.into_pyarray(py).to_owned()));
     ret.push(Ret2D::DEPTH(depths1.into_pyarray(py).to_owned()));
     FromPy::from_py(PyTuple::new(py, ret), py)
 }
 
+#[pyfunction]
+fn warp_vecs_f32<'a>(
+    py: Python<'a>,
+    transform10: &PyArray2<f32>,
+    xs: &PyArray2<f32>,
+    depths: &PyArray1<f32>,
+) -> (Py<PyArray2<f32>>, Py<PyArray1<f32>>) {
+    let transform10 = transform10.as_array();
+    let xs = xs.as_array();
+    let depths = depths.as_array();
+    let (xs1, depths1) = py.allow_threads(|| {
+        Warp::warp(&transform10, &xs, &depths)
+    });
+    (xs1.into_pyarray(py).to_owned(), depths1.into_pyarray(py).to_owned())
+}
+
 #[pymodule(warp)]
 fn warp_module(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_wrapped(wrap_pyfunction!(warp_vecs))?;
     m.add_wrapped(wrap_pyfunction!(warp_vec))?;
+    m.add_wrapped(wrap_pyfunction!(warp_vecs_f32))?;
 
     Ok(())
 }
@@ -0,0 +1,67 @@
+use ndarray::Array2;
+use ndarray_linalg::solve::Inverse;
+
+use crate::transform::{to_matrix4, Matrix4};
+use super::epipolar::calc_key_epipole;
+use super::frame::Frame;
+
+// Quantities that depend only on the (keyframe, refframe) pair.
+// They are computed once per pair and shared by all pixels
+pub struct PairContext {
+    pub transform_rk: Matrix4,
+    pub t_rk: [f64; 3],
+    pub e_key: [f64; 2],
+}
+
+fn calc_transform_rk(
+    transform_wk: &Array2<f64>,
+    transform_wr: &Array2<f64>,
+) -> Array2<f64> {
+    let transform_rw = transform_wr.inv().unwrap();
+    transform_rw.dot(transform_wk)
+}
+
+impl PairContext {
+    pub fn new(keyframe: &Frame, refframe: &Frame) -> Self {
+        let transform_wk = &keyframe.transform;
+        let transform_wr = &refframe.transform;
+        let transform_rk = to_matrix4(&calc_transform_rk(transform_wk, transform_wr));
+        let t_rk = [transform_rk[0][3], transform_rk[1][3], transform_rk[2][3]];
+        PairContext {
+            transform_rk: transform_rk,
+            t_rk: t_rk,
+            e_key: calc_key_epipole(transform_wk, transform_wr),
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use ndarray::arr2;
+
+    #[test]
+    fn test_calc_transform_rk() {
+        let transform_wk = arr2(
+            &[[1., 0., 0., -2.],
+              [0., 1., 0., 0.],
+              [0., 0., 1., 7.],
+              [0., 0., 0., 1.]]
+        );
+
+        let transform_wr = arr2(
+            &[[1., 0., 0., 6.],
+              [0., 1., 0., 0.],
+              [0., 0., 1., 7.],
+              [0., 0., 0., 1.]]
+        );
+
+        assert_eq!(
+            calc_transform_rk(&transform_wk, &transform_wr),
+            arr2(&[[1., 0., 0., -8.],
+                   [0., 1., 0., 0.],
+                   [0., 0., 1., 0.],
+                   [0., 0., 0., 1.]])
+        );
+    }
+}
@@ -1,25 +1,24 @@
-use crate::projection::Projection;
-use ndarray::{Array1, Array2, ArrayView1};
+use crate::projection::inv_project_xy;
+use crate::transform::Matrix4;
 use super::numeric::{Inv, Inverse};
-use crate::triangulation::calc_depth0;
+use crate::triangulation::calc_depth0_xy;
 
 pub fn calc_ref_depth(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
     depth_key: f64,
 ) -> f64 {
-    let p_key = Projection::inv_project(x_key, depth_key);
-    let r_rk_z: ArrayView1<'_, f64> = transform_rk.slice(s![2, 0..3]);
-    let t_rk_z: f64 = transform_rk[[2, 3]];
-    r_rk_z.dot(&p_key) + t_rk_z
+    let p_key = inv_project_xy(x_key, depth_key);
+    let r = &transform_rk[2];
+    r[0] * p_key[0] + r[1] * p_key[1] + r[2] * p_key[2] + r[3]
 }
 
 pub fn calc_key_depth(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
-    x_ref: &ArrayView1<'_, f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
+    x_ref: &[f64; 2],
 ) -> f64 {
-    calc_depth0(transform_rk, x_key, x_ref)
+    calc_depth0_xy(transform_rk, x_key, x_ref)
 }
 
 pub fn depth_search_range(inv_depth_range: &(Inv, Inv)) -> (f64, f64) {
@@ -32,18 +31,17 @@ pub fn depth_search_range(inv_depth_range: &(Inv, Inv)) -> (f64, f64) {
 #[cfg(test)]
 mod tests {
     use super::*;
-    use ndarray::{arr1, arr2};
 
     #[test]
     fn test_calc_inv_depth() {
         let depth_key = 4.0;
-        let x_key = arr1(&[0.5, 2.0]);
-        let transform_rk = arr2(&[
+        let x_key = [0.5, 2.0];
+        let transform_rk = [
             [0., 0., 1., 3.],
             [0., 1., 0., 2.],
             [-1., 0., 0., 4.],
             [0., 0., 0., 1.],
-        ]);
+        ];
         assert_eq!(
             calc_ref_depth(&transform_rk, &x_key, depth_key),
             -2.0 + 4.0
@@ -1,56 +1,105 @@
-use crate::vector::normalize;
+use crate::vector::normalize2;
 use crate::projection::Projection;
 use crate::transform::{get_rotation, get_translation, inv_transform};
-use ndarray::{arr1, Array, Array1, Array2};
-use ndarray_linalg::Norm;
+use ndarray::Array2;
 
 static EPSILON: f64 = 1e-16;
 
 pub fn calc_key_epipole(
     transform_wk: &Array2<f64>,
     transform_wr: &Array2<f64>,
-) -> Array1<f64> {
+) -> [f64; 2] {
     let t_wk = get_translation(transform_wk);
     let t_wr = get_translation(transform_wr);
     let transform_kw = inv_transform(transform_wk);
     let rot_kw = get_rotation(&transform_kw);
     let p_key = rot_kw.dot(&(&t_wr - &t_wk));
     let e_key = Projection::project(&p_key);
-    e_key
+    [e_key[0], e_key[1]]
 }
 
+// number of samples taken along the epipolar line on the keyframe
+pub const N_KEY_SAMPLES: usize = 5;
+
 pub fn key_coordinates(
-    epipolar_direction: &Array1<f64>,
-    x_key: &Array1<f64>,
+    epipolar_direction: &[f64; 2],
+    x_key: &[f64; 2],
     step_size: f64,
-) -> Array2<f64> {
-    let sampling_steps = arr1(&[-2., -1., 0., 1., 2.]);
-    let direction = normalize(&epipolar_direction);
-    let n = sampling_steps.shape()[0];
-    let mut coordinates = Array::zeros((n, 2));
+) -> [[f64; 2]; N_KEY_SAMPLES] {
+    let sampling_steps = [-2., -1., 0., 1., 2.];
+    let direction = normalize2(epipolar_direction);
+    let mut coordinates = [[0.; 2]; N_KEY_SAMPLES];
     for (i, step) in sampling_steps.iter().enumerate() {
-        let c = x_key + &(step_size * step * &direction);
-        coordinates.row_mut(i).assign(&c);
+        coordinates[i] = [x_key[0] + step_size * step * direction[0],
+                          x_key[1] + step_size * step * direction[1]];
     }
     coordinates
 }
 
+// Fills 'xs' with points from x_min along 'direction' at intervals of
+// step_size. 'xs' is cleared first so that a buffer can be reused
 pub fn ref_coordinates(
-    x_min: &Array1<f64>,
-    direction: &Array1<f64>,
+    x_min: &[f64; 2],
+    direction: &[f64; 2],
     step_size: f64,
-) -> Array2<f64> {
-    let norm = direction.norm();
-    let direction = direction / (norm + EPSILON);
+    xs: &mut Vec<[f64; 2]>,
+) {
+    let norm = (direction[0] * direction[0] + direction[1] * direction[1]).sqrt();
+    let direction = [direction[0] / (norm + EPSILON), direction[1] / (norm + EPSILON)];
 
     let n = (norm / step_size) as usize;
 
-    let mut xs = Array::zeros((n, 2));
+    xs.clear();
     for i in 0..n {
-        let x = x_min + &((i as f64) * step_size * &direction);
-        xs.row_mut(i).assign(&x);
+        let s = (i as f64) * step_size;
+        xs.push([x_min[0] + s * direction[0], x_min[1] + s * direction[1]]);
+    }
+}
+
+// distance kept from the image border by 'clip_segment' so that
+// rounding errors of the samples do not put them out of the image
+static CLIP_MARGIN: f64 = 1e-9;
+
+// Returns the range [t0, t1] of t in [0, 1] where u0 + t * (u1 - u0)
+// is in the image (Liang-Barsky clipping).
+// None if the segment does not cross the image
+pub fn clip_segment(
+    u0: &[f64; 2],
+    u1: &[f64; 2],
+    image_shape: &[usize],
+) -> Option<(f64, f64)> {
+    let (h, w) = (image_shape[0] as f64, image_shape[1] as f64);
+    let d = [u1[0] - u0[0], u1[1] - u0[1]];
+    let (min, max_x, max_y) = (CLIP_MARGIN, w - 1. - CLIP_MARGIN, h - 1. - CLIP_MARGIN);
+
+    // the point is in the image if p * t <= q for all (p, q)
+    let constraints = [
+        (-d[0], u0[0] - min),
+        (d[0], max_x - u0[0]),
+        (-d[1], u0[1] - min),
+        (d[1], max_y - u0[1]),
+    ];
+
+    let (mut t0, mut t1) = (0., 1.);
+    for &(p, q) in constraints.iter() {
+        if p == 0. {
+            if q < 0. {
+                return None;  // parallel to the border and outside
+            }
+            continue;
+        }
+        let r = q / p;
+        if p < 0. {
+            t0 = f64::max(t0, r);
+        } else {
+            t1 = f64::min(t1, r);
+        }
+    }
+
+    if t0 > t1 {
+        return None;
     }
-    xs
+    Some((t0, t1))
 }
 
 #[cfg(test)]
@@ -75,7 +124,7 @@ mod tests {
         );
 
         let e_key = calc_key_epipole(&transform_wk, &transform_wr);
-        assert_eq!(e_key, arr1(&[0.3, 0.3]));
+        assert_eq!(e_key, [0.3, 0.3]);
 
         // rotate pi / 2 around the y-axis
         let transform_wk = arr2(
@@ -94,7 +143,7 @@ mod tests {
         );
 
         let e_key = calc_key_epipole(&transform_wk, &transform_wr);
-        assert_eq!(e_key, arr1(&[0.5, 0.]));
+        assert_eq!(e_key, [0.5, 0.]);
 
         // rotate pi around the y-axis
         let transform_wk = arr2(
@@ -113,22 +162,22 @@ mod tests {
         );
 
         let e_key = calc_key_epipole(&transform_wk, &transform_wr);
-        assert_eq!(e_key, arr1(&[-2., 0.]));
+        assert_eq!(e_key, [-2., 0.]);
     }
 
     #[test]
     fn test_key_coordinates() {
-        let x_key = arr1(&[7., 8.]);
-        let direction = arr1(&[9., 12.]);
+        let x_key = [7., 8.];
+        let direction = [9., 12.];
         let step_size = 5.;
 
-        let expected = arr2(&[
+        let expected = [
             [7. - 2. * 3., 8. - 2. * 4.],
             [7. - 1. * 3., 8. - 1. * 4.],
             [7. - 0. * 3., 8. - 0. * 4.],
             [7. + 1. * 3., 8. + 1. * 4.],
             [7. + 2. * 3., 8. + 2. * 4.],
-        ]);
+        ];
         assert_eq!(
             key_coordinates(&direction, &x_key, step_size),
             expected
@@ -138,11 +187,14 @@ mod tests {
     #[test]
     fn test_ref_coordinates() {
         let search_step = 5.0;
-        let x_min = arr1(&[-15.0, -20.0]);
-        let x_max = arr1(&[15.0, 20.0]);
-        let xs = ref_coordinates(&x_min, &(&x_max-&x_min), search_step);
-
-        let xs_true = arr2(&[
+        let x_min = [-15.0, -20.0];
+        let x_max = [15.0, 20.0];
+        let direction = [x_max[0] - x_min[0], x_max[1] - x_min[1]];
+        // the buffer is cleared before filled
+        let mut xs = vec![[1., 1.]; 3];
+        ref_coordinates(&x_min, &direction, search_step, &mut xs);
+
+        let xs_true = vec![
             [-15., -20.],
             [-12., -16.],
             [-9., -12.],
@@ -153,7 +205,30 @@ mod tests {
             [6., 8.],
             [9., 12.],
             [12., 16.],
-        ]);
+        ];
         assert_eq!(xs, xs_true)
     }
+
+    #[test]
+    fn test_clip_segment() {
+        let shape = [11, 21];  // (height, width)
+
+        // inside
+        let (t0, t1) = clip_segment(&[2., 3.], &[8., 4.], &shape).unwrap();
+        assert_eq!((t0, t1), (0., 1.));
+
+        // crosses the left and right borders
+        let (t0, t1) = clip_segment(&[-10., 5.], &[30., 5.], &shape).unwrap();
+        approx::assert_abs_diff_eq!(t0, 10. / 40., epsilon = 1e-8);
+        approx::assert_abs_diff_eq!(t1, 30. / 40., epsilon = 1e-8);
+
+        // crosses the bottom border
+        let (t0, t1) = clip_segment(&[4., 5.], &[4., 15.], &shape).unwrap();
+        assert_eq!(t0, 0.);
+        approx::assert_abs_diff_eq!(t1, 0.5, epsilon = 1e-8);
+
+        // outside
+        assert_eq!(clip_segment(&[-1., 5.], &[-1., 15.], &shape), None);
+        assert_eq!(clip_segment(&[-10., -5.], &[30., -1.], &shape), None);
+    }
 }
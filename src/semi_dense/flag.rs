@@ -1,4 +1,4 @@
-#[derive(Debug)]
+#[derive(Clone, Copy, Debug)]
 #[derive(PartialEq)]
 pub enum Flag {
     Success = 0,
@@ -12,3 +12,12 @@ pub enum Flag {
     NegativeRefDepth = -8,
     NotProcessed = -9
 }
+
+pub const N_FLAGS: usize = 10;
+
+impl Flag {
+    // flags are numbered 0, -1, -2, ... so they can index arrays
+    pub fn index(self) -> usize {
+        -(self as i64) as usize
+    }
+}
@@ -1,11 +1,57 @@
+use std::sync::Arc;
+
 use crate::camera::CameraParameters;
 use ndarray::Array2;
 use pyo3::prelude::{pyclass, PyObject};
+use super::gradient::ImageGradient;
 
+// The image and its gradient are immutable and reference-counted so that
+// cloning a frame, for example to take it out of a Python list,
+// does not copy them
 #[pyclass]
 #[derive(Clone)]
 pub struct Frame {
     pub camera_params: CameraParameters,
-    pub image: Array2<f64>,
+    pub image: Arc<Array2<f64>>,
     pub transform: Array2<f64>,  // transform from frame to world
+    // computed once when the frame is created
+    pub gradient: Arc<ImageGradient>,
+}
+
+impl Frame {
+    pub fn from_arrays(
+        camera_params: CameraParameters,
+        image: Array2<f64>,
+        transform: Array2<f64>,
+    ) -> Self {
+        let gradient = Arc::new(ImageGradient::new(&image));
+        Frame {
+            camera_params: camera_params,
+            image: Arc::new(image),
+            transform: transform,
+            gradient: gradient,
+        }
+    }
+
+    // bytes held by the image, the gradient and the transform
+    pub fn memory_usage(&self) -> usize {
+        let n = self.image.len() + self.transform.len();
+        n * std::mem::size_of::<f64>() + self.gradient.memory_usage()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use ndarray::Array;
+
+    #[test]
+    fn test_clone_shares_buffers() {
+        let camera_params = CameraParameters::new((10., 10.), (5., 5.));
+        let image = Array::from_shape_fn((8, 10), |(y, x)| (x + y) as f64);
+        let frame = Frame::from_arrays(camera_params, image, Array::eye(4));
+        let clone = frame.clone();
+        assert!(Arc::ptr_eq(&frame.image, &clone.image));
+        assert!(Arc::ptr_eq(&frame.gradient, &clone.gradient));
+    }
 }
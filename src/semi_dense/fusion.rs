@@ -1,4 +1,5 @@
-use ndarray::{Array, Array2};
+use ndarray::{Array, Array2, ArrayBase, Data, Ix2};
+use rayon::prelude::*;
 
 pub fn fusion<T, U>(mu1: T, mu2: T, var1: U, var2: U) -> (T, U)
 where
@@ -10,34 +11,45 @@ where
     (mu, var)
 }
 
-pub fn fusion_arrays<T, U>(
-    mu1: &Array2<T>,
-    mu2: &Array2<T>,
-    var1: &Array2<U>,
-    var2: &Array2<U>,
+// Applies 'fusion' to every pixel. Rows are processed in parallel
+pub fn fusion_arrays<T, U, S1, S2>(
+    mu1: &ArrayBase<S1, Ix2>,
+    mu2: &ArrayBase<S1, Ix2>,
+    var1: &ArrayBase<S2, Ix2>,
+    var2: &ArrayBase<S2, Ix2>,
 ) -> (Array2<T>, Array2<U>)
 where
-    T: num::Float + From<U>,
-    U: num::Float {
+    T: num::Float + From<U> + Send + Sync,
+    U: num::Float + Send + Sync,
+    S1: Data<Elem = T> + Sync,
+    S2: Data<Elem = U> + Sync {
     let shape = mu1.shape();
     let (height, width) = (shape[0], shape[1]);
     assert_eq!(mu2.shape(), shape);
     assert_eq!(var1.shape(), shape);
     assert_eq!(var2.shape(), shape);
 
-    let mut mu = Array::zeros((height, width));
-    let mut var = Array::zeros((height, width));
-    for y in 0..height {
-        for x in 0..width {
-            let m1: T = mu1[[y, x]];
-            let m2: T = mu2[[y, x]];
-            let v1: U = var1[[y, x]];
-            let v2: U = var2[[y, x]];
-            let (m, v): (T, U) = fusion(m1, m2, v1, v2);
-            mu[[y, x]] = m;
-            var[[y, x]] = v;
-        }
+    let mut mu = vec![T::zero(); height * width];
+    let mut var = vec![U::zero(); height * width];
+    if width > 0 {
+        mu.par_chunks_mut(width)
+            .zip(var.par_chunks_mut(width))
+            .enumerate()
+            .for_each(|(y, (mu_row, var_row))| {
+                let rows = mu1.row(y).into_iter()
+                    .zip(mu2.row(y).into_iter())
+                    .zip(var1.row(y).into_iter())
+                    .zip(var2.row(y).into_iter());
+                for (x, (((&m1, &m2), &v1), &v2)) in rows.enumerate() {
+                    let (m, v): (T, U) = fusion(m1, m2, v1, v2);
+                    mu_row[x] = m;
+                    var_row[x] = v;
+                }
+            });
     }
+
+    let mu = Array::from_shape_vec((height, width), mu).unwrap();
+    let var = Array::from_shape_vec((height, width), var).unwrap();
     (mu, var)
 }
 
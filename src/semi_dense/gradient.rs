@@ -1,7 +1,8 @@
-use ndarray::{arr1, Array1, Array2, ArrayBase, Data, Ix1, Ix2};
-use crate::gradient::{sobel_x, sobel_y};
-use crate::interpolation::Interpolation;
+use ndarray::{Array2, ArrayBase, Data, Ix2};
+use crate::gradient::{sobel, Border};
+use crate::interpolation::interpolate_xy;
 
+#[derive(Clone)]
 pub struct ImageGradient {
     gx: Array2<f64>,
     gy: Array2<f64>
@@ -9,29 +10,41 @@ pub struct ImageGradient {
 
 impl ImageGradient {
     pub fn new<S: Data<Elem = f64>>(image: &ArrayBase<S, Ix2>) -> Self {
-        let gx = sobel_x(image);
-        let gy = sobel_y(image);
+        // the same signs as 'sobel_x' and 'sobel_y'
+        let (gx, gy) = sobel(image, Border::Zero, -1.);
         ImageGradient { gx: gx, gy: gy }
     }
 
-    pub fn get<S: Data<Elem = f64>>(
-        &self,
-        coordinate: &ArrayBase<S, Ix1>
-    ) -> Array1<f64> {
-        let gx = self.gx.interpolate(coordinate);
-        let gy = self.gy.interpolate(coordinate);
-        arr1(&[gx, gy])
+    pub fn get(&self, coordinate: &[f64; 2]) -> [f64; 2] {
+        let (x, y) = (coordinate[0], coordinate[1]);
+        let gx = interpolate_xy(&self.gx.view(), x, y);
+        let gy = interpolate_xy(&self.gy.view(), x, y);
+        [gx, gy]
+    }
+
+    // gradient magnitude at a pixel
+    #[inline]
+    pub fn magnitude(&self, x: usize, y: usize) -> f64 {
+        let (gx, gy) = (self.gx[[y, x]], self.gy[[y, x]]);
+        (gx * gx + gy * gy).sqrt()
+    }
+
+    // bytes held by gx and gy
+    pub fn memory_usage(&self) -> usize {
+        (self.gx.len() + self.gy.len()) * std::mem::size_of::<f64>()
     }
 }
 
 #[cfg(test)]
 mod tests {
     use super::*;
-    use ndarray::arr2;
+    use crate::interpolation::Interpolation;
+    use ndarray::{arr1, arr2};
 
-    fn run(grad: &ImageGradient, c: &Array1<f64>) {
-        let expected = arr1(&[grad.gx.interpolate(c), grad.gy.interpolate(c)]);
-        assert_eq!(grad.get(&c), expected);
+    fn run(grad: &ImageGradient, c: &[f64; 2]) {
+        let c_ = arr1(c);
+        let expected = [grad.gx.interpolate(&c_), grad.gy.interpolate(&c_)];
+        assert_eq!(grad.get(c), expected);
     }
 
     #[test]
@@ -46,7 +59,7 @@ mod tests {
               [0., 2., 1.],
               [1., 0., 1.]]
         );
-        let c = arr1(&[0.3, 1.2]);
+        let c = [0.3, 1.2];
         let grad = ImageGradient { gx: gx, gy: gy };
 
         run(&grad, &c);
@@ -1,48 +1,141 @@
-use ndarray::Array1;
-use ndarray_linalg::Norm;
-use crate::gradient::gradient1d;
-use crate::vector::normalize;
-
-fn calc_error(a: &Array1<f64>, b: &Array1<f64>) -> f64 {
-    let d = a.to_owned() - b;
-    d.dot(&d)
+#[inline]
+fn dot(a: &[f64], b: &[f64]) -> f64 {
+    a.iter().zip(b.iter()).map(|(x, y)| x * y).sum()
 }
 
-fn search_(sequence: &Array1<f64>, kernel: &Array1<f64>) -> usize {
-    let n = sequence.shape()[0];
-    let k = kernel.shape()[0];
+// divisor that normalizes a vector whose squared norm is 'squared_norm'.
+// a zero vector is left as it is as crate::vector::normalize does
+#[inline]
+fn divisor(squared_norm: f64) -> f64 {
+    if squared_norm <= 0. { 1. } else { squared_norm.sqrt() }
+}
+
+// Squared distance between the normalized window and the normalized kernel
+//   |w / |w| - k / |k||^2 = |w|^2 / |w|^2 - 2 w.k / (|w| |k|) + |k|^2 / |k|^2
+// computed from the squared norms and the dot product only
+#[inline]
+fn calc_error(window_sq: f64, kernel_sq: f64, kernel_norm: f64, wk: f64) -> f64 {
+    let window_norm = divisor(window_sq);
+    let window_sq = window_sq.max(0.);
+    window_sq / (window_norm * window_norm)
+        - 2. * wk / (window_norm * kernel_norm)
+        + kernel_sq / (kernel_norm * kernel_norm)
+}
 
-    let mut min_error = f64::INFINITY;
-    let mut argmin = 0;
+// Calls f(offset, error) for every window of the sequence.
+// The squared norm of the window is updated by a running sum so each
+// offset costs one dot product of the kernel size
+fn for_each_error<F: FnMut(usize, f64)>(sequence: &[f64], kernel: &[f64], mut f: F) {
+    let n = sequence.len();
+    let k = kernel.len();
+    assert!(k <= n);
+
+    let kernel_sq = dot(kernel, kernel);
+    let kernel_norm = divisor(kernel_sq);
+
+    let mut window_sq = dot(&sequence[0..k], &sequence[0..k]);
     for i in 0..n - k + 1 {
-        let e = calc_error(
-            &normalize(&sequence.slice(s![i..i + k])),
-            &normalize(&kernel)
-        );
-        if e < min_error {
-            min_error = e;
-            argmin = i;
+        if i > 0 {
+            let (a, b) = (sequence[i - 1], sequence[i + k - 1]);
+            window_sq += b * b - a * a;
         }
+        let wk = dot(&sequence[i..i + k], kernel);
+        f(i, calc_error(window_sq, kernel_sq, kernel_norm, wk));
     }
+}
 
-    argmin as usize
+// The window offset that minimizes the error and
+// the errors of the offsets on its left and right if they exist
+pub struct Minimum {
+    pub argmin: usize,
+    pub error: f64,
+    left: Option<f64>,
+    right: Option<f64>,
 }
 
-pub fn search(sequence: &Array1<f64>, kernel: &Array1<f64>) -> usize {
-    let argmin = search_(&sequence, &kernel);
-    let k = kernel.shape()[0];
+impl Minimum {
+    // Position of the minimum relative to 'argmin' estimated by fitting
+    // a parabola to the errors around it. The result is in [-0.5, 0.5]
+    pub fn subpixel_offset(&self) -> f64 {
+        let (left, right) = match (self.left, self.right) {
+            (Some(l), Some(r)) => (l, r),
+            _ => return 0.,  // the minimum is on the end
+        };
+        let denominator = left - 2. * self.error + right;
+        if denominator <= 0. {
+            return 0.;
+        }
+        let delta = 0.5 * (left - right) / denominator;
+        delta.max(-0.5).min(0.5)
+    }
+}
+
+pub fn find_minimum(sequence: &[f64], kernel: &[f64]) -> Minimum {
+    let mut m = Minimum { argmin: 0, error: f64::INFINITY, left: None, right: None };
+    let mut prev_error = None;
+    for_each_error(sequence, kernel, |i, e| {
+        if e < m.error {
+            m = Minimum { argmin: i, error: e, left: prev_error, right: None };
+        } else if i == m.argmin + 1 {
+            m.right = Some(e);
+        }
+        prev_error = Some(e);
+    });
+    m
+}
+
+// Fills 'candidates' with (error, offset) of the 'n' windows that have
+// the smallest errors in ascending order of error.
+// 'candidates' is cleared first so that a buffer can be reused
+pub fn find_candidates(
+    sequence: &[f64],
+    kernel: &[f64],
+    n: usize,
+    candidates: &mut Vec<(f64, usize)>,
+) {
+    candidates.clear();
+    for_each_error(sequence, kernel, |i, e| {
+        if candidates.len() == n && !(e < candidates[n - 1].0) {
+            return;
+        }
+        if candidates.len() == n {
+            candidates.pop();
+        }
+        // the first of equal errors comes first
+        let j = candidates.iter().position(|c| e < c.0).unwrap_or(candidates.len());
+        candidates.insert(j, (e, i));
+    });
+}
+
+pub fn search(sequence: &[f64], kernel: &[f64]) -> usize {
+    let argmin = find_minimum(sequence, kernel).argmin;
+    let k = kernel.len();
     let offset = (k / 2) as usize;
     argmin + offset
 }
 
-pub fn gradient(intensities: &Array1<f64>, step_size: f64) -> f64 {
-    gradient1d(&intensities).norm() / step_size
+// Same as 'search' but refines the position by fitting a parabola to
+// the errors around the minimum. The result is in [index - 0.5, index + 0.5]
+// where 'index' is the result of 'search'
+pub fn search_subpixel(sequence: &[f64], kernel: &[f64]) -> f64 {
+    let m = find_minimum(sequence, kernel);
+    let offset = (kernel.len() / 2) as usize;
+    (m.argmin + offset) as f64 + m.subpixel_offset()
+}
+
+// norm of the 1d gradient of the intensities divided by the step size
+pub fn gradient(intensities: &[f64], step_size: f64) -> f64 {
+    let mut s = 0.;
+    for i in 0..intensities.len() - 1 {
+        let d = intensities[i + 1] - intensities[i];
+        s += d * d;
+    }
+    s.sqrt() / step_size
 }
 
 #[cfg(test)]
 mod tests {
     use super::*;
-    use ndarray::arr1;
 
     #[test]
     fn test_intensity_search() {
@@ -51,25 +144,110 @@ mod tests {
         // argmin(errors) == 3
         // offset == 1 ( == len(intensities_key) // 2)
         // expected = argmin(errors) + offset == 4
-        let intensities_ref = arr1(&[-4., 3., 2., 4., -1., 3., 1.]);
-        let intensities_key = arr1(&[1., -1., 2.]);
+        let intensities_ref = [-4., 3., 2., 4., -1., 3., 1.];
+        let intensities_key = [1., -1., 2.];
         let index = search(&intensities_ref, &intensities_key);
         assert_eq!(index, 4);
 
         // argmin(errors) == 2
         // offset == 1 ( == len(intensities_key) // 2)
         // expected = argmin(errors) + offset == 3
-        let intensities_ref = arr1(&[-4., 3., 1., -1.]);
-        let intensities_key = arr1(&[1., -1.]);
+        let intensities_ref = [-4., 3., 1., -1.];
+        let intensities_key = [1., -1.];
         let index = search(&intensities_ref, &intensities_key);
         assert_eq!(index, 3);
 
         // argmin(errors) == 0
         // offset == 1 ( == len(intensities_key) // 2)
         // expected = argmin(errors) + offset == 1
-        let intensities_ref = arr1(&[1., -1., -4., 3.]);
-        let intensities_key = arr1(&[1., -1.]);
+        let intensities_ref = [1., -1., -4., 3.];
+        let intensities_key = [1., -1.];
         let index = search(&intensities_ref, &intensities_key);
         assert_eq!(index, 1);
     }
+
+    #[test]
+    fn test_gradient() {
+        // gradient1d = [3., -4.]
+        assert_eq!(gradient(&[1., 4., 0.], 2.), 5. / 2.);
+    }
+
+    // straightforward implementation of 'search'
+    fn search_naive(sequence: &[f64], kernel: &[f64]) -> usize {
+        let normalize = |v: &[f64]| -> Vec<f64> {
+            let n = v.iter().map(|e| e * e).sum::<f64>().sqrt();
+            let n = if n == 0. { 1. } else { n };
+            v.iter().map(|e| e / n).collect()
+        };
+        let k = kernel.len();
+        let kernel = normalize(kernel);
+        let mut argmin = 0;
+        let mut min_error = f64::INFINITY;
+        for i in 0..sequence.len() - k + 1 {
+            let window = normalize(&sequence[i..i + k]);
+            let e: f64 = window.iter().zip(kernel.iter())
+                .map(|(a, b)| (a - b) * (a - b)).sum();
+            if e < min_error {
+                min_error = e;
+                argmin = i;
+            }
+        }
+        argmin + k / 2
+    }
+
+    #[test]
+    fn test_intensity_search_naive() {
+        // shorter than the period of the sequence so no window repeats
+        let sequence: Vec<f64> = (0..110)
+            .map(|i| ((i * 37) % 23) as f64 - 11. + 0.1 * ((i * 7) % 5) as f64)
+            .collect();
+        for start in 0..15 {
+            let kernel = &sequence[start * 7..start * 7 + 5].to_vec();
+            assert_eq!(search(&sequence, kernel), search_naive(&sequence, kernel));
+        }
+
+        // zero windows and a zero kernel
+        let sequence = [0., 0., 0., 1., 2., 0., 0., 0.];
+        assert_eq!(search(&sequence, &[1., 2.]), search_naive(&sequence, &[1., 2.]));
+        assert_eq!(search(&sequence, &[0., 0.]), search_naive(&sequence, &[0., 0.]));
+    }
+
+    #[test]
+    fn test_intensity_search_subpixel() {
+        // samples of a smooth peak at 6.3
+        let sequence: Vec<f64> = (0..14)
+            .map(|i| 1. + f64::exp(-0.5 * (i as f64 - 6.3).powi(2)))
+            .collect();
+        let kernel: Vec<f64> = (0..5)
+            .map(|i| 1. + f64::exp(-0.5 * (i as f64 - 2.).powi(2)))
+            .collect();
+
+        let index = search(&sequence, &kernel);
+        assert_eq!(index, 6);
+        let x = search_subpixel(&sequence, &kernel);
+        assert!(6. < x && x <= 6.5);
+
+        // falls back to the integer index at the ends of the sequence
+        let sequence = [1., -1., -4., 3.];
+        assert_eq!(search_subpixel(&sequence, &[1., -1.]), 1.);
+    }
+
+    #[test]
+    fn test_find_candidates() {
+        let sequence: Vec<f64> = (0..110)
+            .map(|i| ((i * 37) % 23) as f64 - 11. + 0.1 * ((i * 7) % 5) as f64)
+            .collect();
+        let kernel = [3., -1., 2., 0.5, -4.];
+
+        let mut errors = Vec::new();
+        for_each_error(&sequence, &kernel, |i, e| errors.push((e, i)));
+        errors.sort_by(|a, b| a.partial_cmp(b).unwrap());
+
+        let mut candidates = Vec::new();
+        find_candidates(&sequence, &kernel, 4, &mut candidates);
+        assert_eq!(candidates, errors[0..4].to_vec());
+
+        let m = find_minimum(&sequence, &kernel);
+        assert_eq!((m.error, m.argmin), candidates[0]);
+    }
 }
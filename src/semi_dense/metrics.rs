@@ -0,0 +1,77 @@
+use std::time::Duration;
+use super::flag::{Flag, N_FLAGS};
+
+// Summary of one update_depth call
+#[derive(Clone, Debug, PartialEq)]
+pub struct UpdateStats {
+    // number of pixels per flag, indexed by Flag::index
+    pub flag_counts: [usize; N_FLAGS],
+    // pixels whose depth was searched along the epipolar line
+    pub n_attempted: usize,
+    // pixels whose depth was updated
+    pub n_succeeded: usize,
+    // pixels older than the oldest reference frame, estimated with it
+    pub n_age_clamped: usize,
+    pub elapsed: Duration,
+}
+
+impl UpdateStats {
+    pub fn new() -> Self {
+        UpdateStats {
+            flag_counts: [0; N_FLAGS],
+            n_attempted: 0,
+            n_succeeded: 0,
+            n_age_clamped: 0,
+            elapsed: Duration::from_secs(0),
+        }
+    }
+
+    pub fn add(&mut self, flag: Flag) {
+        self.flag_counts[flag.index()] += 1;
+        if flag == Flag::Success {
+            self.n_succeeded += 1;
+        }
+    }
+
+    pub fn count(&self, flag: Flag) -> usize {
+        self.flag_counts[flag.index()]
+    }
+
+    pub fn merge(mut self, other: &UpdateStats) -> Self {
+        for i in 0..N_FLAGS {
+            self.flag_counts[i] += other.flag_counts[i];
+        }
+        self.n_attempted += other.n_attempted;
+        self.n_succeeded += other.n_succeeded;
+        self.n_age_clamped += other.n_age_clamped;
+        self
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_update_stats() {
+        let mut a = UpdateStats::new();
+        a.add(Flag::Success);
+        a.add(Flag::NotProcessed);
+        a.n_attempted += 1;
+
+        let mut b = UpdateStats::new();
+        b.add(Flag::Success);
+        b.add(Flag::KeyOutOfRange);
+        b.n_attempted += 2;
+        b.n_age_clamped += 1;
+
+        let c = a.merge(&b);
+        assert_eq!(c.count(Flag::Success), 2);
+        assert_eq!(c.count(Flag::NotProcessed), 1);
+        assert_eq!(c.count(Flag::KeyOutOfRange), 1);
+        assert_eq!(c.count(Flag::InsufficientGradient), 0);
+        assert_eq!(c.n_attempted, 3);
+        assert_eq!(c.n_succeeded, 2);
+        assert_eq!(c.n_age_clamped, 1);
+    }
+}
@@ -1,4 +1,5 @@
 pub mod age;
+pub mod context;
 pub mod depth;
 pub mod epipolar;
 pub mod flag;
@@ -7,16 +8,21 @@ pub mod fusion;
 pub mod gradient;
 pub mod hypothesis;
 pub mod intensities;
+pub mod metrics;
 pub mod numeric;
 pub mod params;
 pub mod propagation;
-// pub mod regularization;
+pub mod reference;
+pub mod regularization;
 pub mod semi_dense;
 pub mod stat;
 pub mod variance;
 
+pub use context::PairContext;
 pub use flag::Flag;
 pub use hypothesis::Hypothesis;
+pub use metrics::UpdateStats;
 pub use frame::Frame;
 pub use params::Params;
+pub use reference::ReferenceFrames;
 pub use variance::VarianceCoefficients;
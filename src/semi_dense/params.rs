@@ -8,4 +8,13 @@ pub struct Params {
     pub var_coeffs: VarianceCoefficients,
     pub ref_step_size: f64,
     pub min_gradient: f64,
+    // refine the search results along epipolar lines to subpixel
+    pub subpixel: bool,
+    // search epipolar lines coarse to fine at this factor of ref_step_size.
+    // the lines are also clipped to the reference image before sampling.
+    // 0 or 1 searches the whole line at ref_step_size
+    pub coarse_step_factor: usize,
+    // pixels whose keyframe gradient magnitude (Sobel) is smaller than this
+    // are not searched. 0 searches all pixels observed by a reference frame
+    pub min_image_gradient: f64,
 }
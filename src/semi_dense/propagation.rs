@@ -1,10 +1,10 @@
-use crate::image_range::ImageRange;
+use crate::image_range::is_in_range;
 use crate::semi_dense::fusion::fusion;
 use crate::semi_dense::numeric::Inverse;
 use crate::semi_dense::stat;
 use crate::warp::{PerspectiveWarp, Warp};
-use ndarray::{arr1, Array, Array2, Data};
-use std::collections::HashMap;
+use ndarray::{Array, Array2, ArrayView2, Data};
+use rayon::prelude::*;
 
 fn propagate_variance(
     depth0: f64,
@@ -45,52 +45,166 @@ fn handle_collision(
     }
 }
 
-pub fn propagate<T: Data<Elem = f64>>(
+// source rows warped by one task
+const ROWS_PER_BLOCK: usize = 16;
+// target rows resolved by one task
+const ROWS_PER_BAND: usize = 16;
+
+// a pixel of frame 0 warped onto frame 1
+struct Splat {
+    index1: usize,  // flat index in frame 1
+    age1: usize,
+    depth1: f64,
+    variance1: f64,
+}
+
+// Warps rows [begin, end) of frame 0 and sorts the splats into the bands
+// of target rows they fall in, keeping the raster order of frame 0
+fn splat_rows<T: Data<Elem = f64>>(
     warp10: &PerspectiveWarp<T>,
-    depth_map0: &Array2<f64>,
-    variance_map0: &Array2<f64>,
-    default_depth: f64,
-    default_variance: f64,
+    age_map0: Option<&ArrayView2<'_, usize>>,
+    depth_map0: &ArrayView2<'_, f64>,
+    variance_map0: &ArrayView2<'_, f64>,
     uncertaintity_bias: f64,
-) -> (Array2<f64>, Array2<f64>) {
+    begin: usize,
+    end: usize,
+    n_bands: usize,
+) -> Vec<Vec<Splat>> {
     let shape = depth_map0.shape();
-    let (height, width) = (shape[0], shape[1]);
+    let width = shape[1];
 
-    let mut map1: HashMap<(usize, usize), (f64, f64)> = HashMap::new();
-    for y0 in 0..height {
+    let mut bands: Vec<Vec<Splat>> = (0..n_bands).map(|_| Vec::new()).collect();
+    for y0 in begin..end {
         for x0 in 0..width {
-            let u0 = arr1(&[x0 as f64, y0 as f64]);
-            let depth0 = depth_map0[[y0 as usize, x0 as usize]];
-            let (u1, depth1a) = warp10.warp(&u0, depth0);
-            if !u1.is_in_range(shape) {
+            let depth0 = depth_map0[[y0, x0]];
+            let (u1, depth1) = warp10.warp(&[x0 as f64, y0 as f64], depth0);
+            if !is_in_range(u1[0], u1[1], shape) {
                 continue;
             }
 
-            let variance0 = variance_map0[[y0 as usize, x0 as usize]];
-            let variance1a = propagate_variance(depth0, depth1a, variance0,
-                                                uncertaintity_bias);
-            let u1 = (u1[0] as usize, u1[1] as usize);
-            let (depth1, variance1) = match map1.get(&u1) {
-                Some((depth1b, variance1b)) => {
-                    handle_collision(depth1a, *depth1b, variance1a, *variance1b)
-                },
-                None => (depth1a, variance1a)
-            };
-
-            map1.insert(u1, (depth1, variance1));
+            let age0 = age_map0.map_or(0, |a| a[[y0, x0]]);
+            let variance0 = variance_map0[[y0, x0]];
+            let variance1 = propagate_variance(depth0, depth1, variance0,
+                                               uncertaintity_bias);
+            let (x1, y1) = (u1[0] as usize, u1[1] as usize);
+            bands[y1 / ROWS_PER_BAND].push(
+                Splat {
+                    index1: y1 * width + x1,
+                    age1: age0 + 1,
+                    depth1: depth1,
+                    variance1: variance1
+                }
+            );
         }
     }
+    bands
+}
 
-    let mut depth_map1 = Array::from_elem((height, width), default_depth);
-    let mut variance_map1 = Array::from_elem((height, width), default_variance);
-    for ((x1, y1), (depth1, variance1)) in map1.iter() {
-        depth_map1[[*y1, *x1]] = *depth1;
-        variance_map1[[*y1, *x1]] = *variance1;
+// Rows of frame 0 are warped in parallel and the resulting splats are
+// grouped by bands of target rows. Each band is then resolved by one task
+// that visits the splats in the source order, so the result is the same
+// as the serial implementation for any number of threads.
+// The age of a pixel that received a point is at least 1, so the age
+// buffer also tells which pixels are occupied.
+fn propagate_<T: Data<Elem = f64> + Sync>(
+    warp10: &PerspectiveWarp<T>,
+    age_map0: Option<&ArrayView2<'_, usize>>,
+    depth_map0: &ArrayView2<'_, f64>,
+    variance_map0: &ArrayView2<'_, f64>,
+    default_depth: f64,
+    default_variance: f64,
+    uncertaintity_bias: f64,
+) -> (Array2<usize>, Array2<f64>, Array2<f64>) {
+    assert_eq!(depth_map0.shape(), variance_map0.shape());
+    if let Some(age_map0) = age_map0 {
+        assert_eq!(age_map0.shape(), depth_map0.shape());
     }
+    let shape = depth_map0.shape();
+    let (height, width) = (shape[0], shape[1]);
+
+    let n_blocks = (height + ROWS_PER_BLOCK - 1) / ROWS_PER_BLOCK;
+    let n_bands = (height + ROWS_PER_BAND - 1) / ROWS_PER_BAND;
+
+    let blocks: Vec<Vec<Vec<Splat>>> = (0..n_blocks)
+        .into_par_iter()
+        .map(|block| {
+            let begin = block * ROWS_PER_BLOCK;
+            let end = std::cmp::min(begin + ROWS_PER_BLOCK, height);
+            splat_rows(warp10, age_map0, depth_map0, variance_map0,
+                       uncertaintity_bias, begin, end, n_bands)
+        })
+        .collect();
 
+    let mut age1 = vec![0; height * width];
+    let mut depth1 = vec![default_depth; height * width];
+    let mut variance1 = vec![default_variance; height * width];
+
+    let band_size = ROWS_PER_BAND * width;
+    age1.par_chunks_mut(band_size)
+        .zip(depth1.par_chunks_mut(band_size))
+        .zip(variance1.par_chunks_mut(band_size))
+        .enumerate()
+        .for_each(|(band, ((age1, depth1), variance1))| {
+            let offset = band * band_size;
+            for splats in blocks.iter() {
+                for s in splats[band].iter() {
+                    let i = s.index1 - offset;
+                    if age1[i] > 0 {
+                        let (d, v) = handle_collision(s.depth1, depth1[i],
+                                                      s.variance1, variance1[i]);
+                        depth1[i] = d;
+                        variance1[i] = v;
+                    } else {
+                        depth1[i] = s.depth1;
+                        variance1[i] = s.variance1;
+                    }
+                    // the last point in the source order gives the age
+                    age1[i] = s.age1;
+                }
+            }
+        });
+
+    let age_map1 = Array::from_shape_vec((height, width), age1).unwrap();
+    let depth_map1 = Array::from_shape_vec((height, width), depth1).unwrap();
+    let variance_map1 = Array::from_shape_vec((height, width), variance1).unwrap();
+    (age_map1, depth_map1, variance_map1)
+}
+
+// Forward-warps every pixel of frame 0 into dense depth / variance buffers
+// of frame 1. Pixels of frame 1 that receive no point are set to
+// default_depth / default_variance. Points that land on the same pixel
+// are merged by 'handle_collision' in the raster order of frame 0.
+pub fn propagate<T: Data<Elem = f64> + Sync>(
+    warp10: &PerspectiveWarp<T>,
+    depth_map0: &ArrayView2<'_, f64>,
+    variance_map0: &ArrayView2<'_, f64>,
+    default_depth: f64,
+    default_variance: f64,
+    uncertaintity_bias: f64,
+) -> (Array2<f64>, Array2<f64>) {
+    let (_, depth_map1, variance_map1) = propagate_(
+        warp10, None, depth_map0, variance_map0,
+        default_depth, default_variance, uncertaintity_bias
+    );
     (depth_map1, variance_map1)
 }
 
+// Same as 'age::increment_age' followed by 'propagate' with the same warp
+// but every pixel of frame 0 is warped only once.
+// Returns the age map, depth map and variance map of frame 1
+pub fn propagate_with_age<T: Data<Elem = f64> + Sync>(
+    warp10: &PerspectiveWarp<T>,
+    age_map0: &ArrayView2<'_, usize>,
+    depth_map0: &ArrayView2<'_, f64>,
+    variance_map0: &ArrayView2<'_, f64>,
+    default_depth: f64,
+    default_variance: f64,
+    uncertaintity_bias: f64,
+) -> (Array2<usize>, Array2<f64>, Array2<f64>) {
+    propagate_(warp10, Some(age_map0), depth_map0, variance_map0,
+               default_depth, default_variance, uncertaintity_bias)
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -98,6 +212,7 @@ mod tests {
     use approx::assert_abs_diff_eq;
     use ndarray::arr2;
     use crate::camera::CameraParameters;
+    use crate::semi_dense::age::increment_age;
 
     #[test]
     fn test_propagate_variance() {
@@ -145,8 +260,8 @@ mod tests {
 
         let (depth_map1, variance_map1) = propagate(
             &warp10,
-            &depth_map0,
-            &variance_map0,
+            &depth_map0.view(),
+            &variance_map0.view(),
             default_depth,
             default_variance,
             uncertaintity_bias
@@ -181,4 +296,102 @@ mod tests {
             }
         }
     }
+
+    #[test]
+    fn test_propagate_same_as_serial() {
+        // image spans several row blocks / bands and
+        // many points collide on the same pixels
+        let (width, height) = (40, 37);
+        let shape = (height, width);
+
+        let camera_params = CameraParameters::new((100., 100.), (20., 18.));
+        let transform10 = arr2(
+            &[[1., 0., 0., 2.],
+              [0., 1., 0., -1.],
+              [0., 0., 1., 40.],
+              [0., 0., 0., 1.]]
+        );
+        let warp10 = PerspectiveWarp::new(&transform10, &camera_params, &camera_params);
+
+        let depth_map0 = Array::from_shape_fn(shape, |(y, x)| {
+            50. + ((7 * x + 13 * y) % 11) as f64
+        });
+        let variance_map0 = Array::from_shape_fn(shape, |(y, x)| {
+            1. + ((3 * x + 5 * y) % 7) as f64
+        });
+
+        let (depth_map1, variance_map1) = propagate(
+            &warp10, &depth_map0.view(), &variance_map0.view(), 60., 8., 3.
+        );
+
+        // serial reference in the raster order of frame 0
+        let mut expected_depth = Array::from_elem(shape, 60.);
+        let mut expected_variance = Array::from_elem(shape, 8.);
+        let mut occupied = Array::from_elem(shape, false);
+        for y0 in 0..height {
+            for x0 in 0..width {
+                let depth0 = depth_map0[[y0, x0]];
+                let (u1, depth1) = warp10.warp(&[x0 as f64, y0 as f64], depth0);
+                if !is_in_range(u1[0], u1[1], depth_map0.shape()) {
+                    continue;
+                }
+                let variance1 = propagate_variance(
+                    depth0, depth1, variance_map0[[y0, x0]], 3.
+                );
+                let key = (u1[1] as usize, u1[0] as usize);
+                if occupied[key] {
+                    let (d, v) = handle_collision(depth1, expected_depth[key],
+                                                  variance1, expected_variance[key]);
+                    expected_depth[key] = d;
+                    expected_variance[key] = v;
+                } else {
+                    expected_depth[key] = depth1;
+                    expected_variance[key] = variance1;
+                    occupied[key] = true;
+                }
+            }
+        }
+
+        assert_eq!(depth_map1, expected_depth);
+        assert_eq!(variance_map1, expected_variance);
+    }
+
+    #[test]
+    fn test_propagate_with_age() {
+        let (width, height) = (40, 37);
+        let shape = (height, width);
+
+        let camera_params = CameraParameters::new((100., 100.), (20., 18.));
+        let transform10 = arr2(
+            &[[1., 0., 0., 2.],
+              [0., 1., 0., -1.],
+              [0., 0., 1., 40.],
+              [0., 0., 0., 1.]]
+        );
+        let warp10 = PerspectiveWarp::new(&transform10, &camera_params, &camera_params);
+
+        let age_map0 = Array::from_shape_fn(shape, |(y, x)| (x + 2 * y) % 5);
+        let depth_map0 = Array::from_shape_fn(shape, |(y, x)| {
+            50. + ((7 * x + 13 * y) % 11) as f64
+        });
+        let variance_map0 = Array::from_shape_fn(shape, |(y, x)| {
+            1. + ((3 * x + 5 * y) % 7) as f64
+        });
+
+        let (age_map1, depth_map1, variance_map1) = propagate_with_age(
+            &warp10, &age_map0.view(), &depth_map0.view(), &variance_map0.view(), 60., 8., 3.
+        );
+
+        let expected_age = increment_age(
+            &age_map0.view(), &camera_params, &camera_params,
+            &transform10.view(), &depth_map0.view()
+        );
+        let (expected_depth, expected_variance) = propagate(
+            &warp10, &depth_map0.view(), &variance_map0.view(), 60., 8., 3.
+        );
+
+        assert_eq!(age_map1, expected_age);
+        assert_eq!(depth_map1, expected_depth);
+        assert_eq!(variance_map1, expected_variance);
+    }
 }
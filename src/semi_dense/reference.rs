@@ -0,0 +1,190 @@
+use std::collections::VecDeque;
+
+use ndarray::ArrayView2;
+use pyo3::prelude::{pyclass, PyObject};
+use super::frame::Frame;
+
+// Reference frames of the semi-dense estimation, at most 'capacity' of them.
+// Every pushed frame is given an id that increases by one per push.
+// Pixel ages are relative to the newest frame: age 1 is the newest one,
+// age 2 is the one pushed before it, and so on. This is the same order
+// as the reference frame list given to 'update_depth'.
+// Pixels older than the oldest stored frame are estimated with the
+// oldest one (see 'clamp_age') instead of stopping the process.
+// Clones share the images of the frames
+#[pyclass]
+#[derive(Clone)]
+pub struct ReferenceFrames {
+    capacity: usize,
+    // (id, frame) from the oldest to the newest
+    frames: VecDeque<(usize, Frame)>,
+    next_id: usize,
+}
+
+impl ReferenceFrames {
+    pub fn new(capacity: usize) -> Self {
+        assert!(capacity > 0);
+        ReferenceFrames {
+            capacity: capacity,
+            frames: VecDeque::with_capacity(capacity),
+            next_id: 0,
+        }
+    }
+
+    // Frames given from the oldest to the newest, all of them kept
+    pub fn from_vec(frames: Vec<Frame>) -> Self {
+        let mut store = ReferenceFrames::new(std::cmp::max(frames.len(), 1));
+        for frame in frames.into_iter() {
+            store.push(frame);
+        }
+        store
+    }
+
+    pub fn capacity(&self) -> usize {
+        self.capacity
+    }
+
+    pub fn len(&self) -> usize {
+        self.frames.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.frames.is_empty()
+    }
+
+    // Adds a frame as the newest one and returns its id.
+    // The oldest frame is dropped if the buffer is full
+    pub fn push(&mut self, frame: Frame) -> usize {
+        if self.frames.len() == self.capacity {
+            self.frames.pop_front();
+        }
+        let id = self.next_id;
+        self.frames.push_back((id, frame));
+        self.next_id += 1;
+        id
+    }
+
+    pub fn newest_id(&self) -> Option<usize> {
+        self.frames.back().map(|(id, _)| *id)
+    }
+
+    pub fn oldest_id(&self) -> Option<usize> {
+        self.frames.front().map(|(id, _)| *id)
+    }
+
+    // Age of the oldest stored frame if 'age' exceeds it.
+    // 0 (not observed) is kept as is
+    pub fn clamp_age(&self, age: usize) -> usize {
+        std::cmp::min(age, self.frames.len())
+    }
+
+    pub fn get(&self, age: usize) -> Option<&Frame> {
+        if age == 0 || age > self.frames.len() {
+            return None;
+        }
+        Some(&self.frames[self.frames.len() - age].1)
+    }
+
+    // Drops the frames that no pixel of 'age_map' refers to, that is,
+    // frames older than the maximum age. Returns the number of dropped frames
+    pub fn evict_unreferenced(&mut self, age_map: &ArrayView2<'_, usize>) -> usize {
+        let max_age = age_map.iter().fold(0, |m, &age| std::cmp::max(m, age));
+        let n_evicted = self.frames.len().saturating_sub(max_age);
+        for _ in 0..n_evicted {
+            self.frames.pop_front();
+        }
+        n_evicted
+    }
+
+    // Frames from the oldest to the newest
+    pub fn iter(&self) -> impl DoubleEndedIterator<Item = &Frame> {
+        self.frames.iter().map(|(_, frame)| frame)
+    }
+
+    // Images are shared, not copied
+    pub fn to_vec(&self) -> Vec<Frame> {
+        self.iter().cloned().collect()
+    }
+
+    // Bytes held by the stored images and gradients
+    pub fn memory_usage(&self) -> usize {
+        self.frames.iter().map(|(_, frame)| frame.memory_usage()).sum()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::camera::CameraParameters;
+    use ndarray::{arr2, Array};
+
+    fn make_frame(value: f64) -> Frame {
+        let camera_params = CameraParameters::new((10., 10.), (5., 4.));
+        let image = Array::from_elem((8, 10), value);
+        Frame::from_arrays(camera_params, image, Array::eye(4))
+    }
+
+    #[test]
+    fn test_push() {
+        let mut frames = ReferenceFrames::new(3);
+        assert!(frames.is_empty());
+        assert_eq!(frames.newest_id(), None);
+        assert_eq!(frames.clamp_age(2), 0);
+
+        for i in 0..5 {
+            assert_eq!(frames.push(make_frame(i as f64)), i);
+        }
+        // frames 0 and 1 are dropped
+        assert_eq!(frames.len(), 3);
+        assert_eq!(frames.oldest_id(), Some(2));
+        assert_eq!(frames.newest_id(), Some(4));
+
+        assert_eq!(frames.get(1).unwrap().image[[0, 0]], 4.);
+        assert_eq!(frames.get(3).unwrap().image[[0, 0]], 2.);
+        assert!(frames.get(0).is_none());
+        assert!(frames.get(4).is_none());
+
+        assert_eq!(frames.clamp_age(0), 0);
+        assert_eq!(frames.clamp_age(2), 2);
+        assert_eq!(frames.clamp_age(5), 3);
+
+        let vec = frames.to_vec();
+        assert_eq!(vec.len(), 3);
+        assert_eq!(vec[0].image[[0, 0]], 2.);
+        assert_eq!(vec[2].image[[0, 0]], 4.);
+
+        // the same order as 'to_vec'
+        let frames = ReferenceFrames::from_vec(vec);
+        assert_eq!(frames.len(), 3);
+        assert_eq!(frames.get(1).unwrap().image[[0, 0]], 4.);
+        assert_eq!(frames.get(3).unwrap().image[[0, 0]], 2.);
+
+        let frames = ReferenceFrames::from_vec(Vec::new());
+        assert!(frames.is_empty());
+        assert!(frames.get(1).is_none());
+    }
+
+    #[test]
+    fn test_evict_unreferenced() {
+        let mut frames = ReferenceFrames::new(8);
+        for i in 0..5 {
+            frames.push(make_frame(i as f64));
+        }
+        let memory_usage = frames.memory_usage();
+        assert_eq!(memory_usage, 5 * make_frame(0.).memory_usage());
+
+        let age_map = arr2(&[[0, 1, 2], [1, 0, 2]]);
+        assert_eq!(frames.evict_unreferenced(&age_map.view()), 3);
+        assert_eq!(frames.len(), 2);
+        assert_eq!(frames.oldest_id(), Some(3));
+        assert_eq!(frames.memory_usage(), 2 * memory_usage / 5);
+
+        // ids keep increasing after eviction
+        assert_eq!(frames.push(make_frame(5.)), 5);
+
+        // nothing is dropped if all frames are referenced
+        let age_map = arr2(&[[0, 4], [3, 1]]);
+        assert_eq!(frames.evict_unreferenced(&age_map.view()), 0);
+        assert_eq!(frames.len(), 3);
+    }
+}
@@ -1,116 +1,175 @@
-use crate::semi_dense::numeric::{Inv, Inverse};
 use crate::semi_dense::flag::Flag;
+use crate::semi_dense::numeric::{Inv, Inverse};
+use crate::semi_dense::stat;
 use ndarray::{Array, Array2, ArrayView2};
+use rayon::prelude::*;
 
-fn regularize_patch(
-    inv_depth_map: &ArrayView2<'_, Inv>,
-    inv_variance_map: &ArrayView2<'_, Inv>,
+// rows regularized by one task
+const ROWS_PER_BLOCK: usize = 16;
+
+// a pixel that has a successfully estimated depth
+#[derive(Clone, Copy)]
+struct Sample {
+    inv_depth: Inv,
+    variance: f64,
+}
+
+// Converts rows [begin, end) into samples in one contiguous buffer
+// so that the 3x3 windows below do not touch the input maps again
+fn to_samples(
+    depth_map: &ArrayView2<'_, f64>,
+    variance_map: &ArrayView2<'_, f64>,
     flag_map: &ArrayView2<'_, i64>,
-) -> Option<Inv> {
-    let mut numerator = Inv::from(0.0);
-    let mut denominator = Inv::from(0.0);
-    for y in 0..3 {
-        for x in 0..3 {
-            let id = inv_depth_map[[y, x]];
-            let iv = inv_variance_map[[y, x]];
-            if flag_map[[y, x]] == (Flag::Success as i64) {
-                numerator = numerator + id * iv;
-                denominator = denominator + iv;
+    begin: usize,
+    end: usize,
+) -> Vec<Option<Sample>> {
+    let width = depth_map.shape()[1];
+    let mut samples = Vec::with_capacity((end - begin) * width);
+    for y in begin..end {
+        for x in 0..width {
+            if flag_map[[y, x]] != (Flag::Success as i64) {
+                samples.push(None);
+                continue;
             }
+            samples.push(Some(Sample {
+                inv_depth: depth_map[[y, x]].inv(),
+                variance: variance_map[[y, x]]
+            }));
         }
     }
-    if denominator == Inv::from(0.0) {
-        return None;
-    }
+    samples
+}
 
-    Some(numerator / denominator)
+// Inverse-variance weighted mean of the inverse depths in the 3x3 window
+// around 'x' of 'rows'. Only successfully estimated neighbors that are
+// statistically same as the center are used.
+// Returns None if the center itself has no valid estimate
+fn regularize_pixel(
+    rows: &[&[Option<Sample>]],
+    center: usize,
+    x: usize,
+) -> Option<Inv> {
+    let c = rows[center][x]?;
+
+    let width = rows[center].len();
+    let (x_begin, x_end) = (x.saturating_sub(1), std::cmp::min(x + 2, width));
+
+    let mut numerator = 0.0;
+    let mut denominator = 0.0;
+    for row in rows.iter() {
+        for n in row[x_begin..x_end].iter().filter_map(|&n| n) {
+            if !stat::are_statically_same(c.inv_depth, n.inv_depth,
+                                          c.variance, n.variance) {
+                continue;
+            }
+            let w = f64::from(n.variance.inv());
+            numerator += f64::from(n.inv_depth) * w;
+            denominator += w;
+        }
+    }
+    Some(Inv::from(numerator / denominator))
 }
 
+// Smooths the depth map with the successfully estimated neighbors of
+// each pixel (see 'regularize_pixel'). Pixels without a valid estimate
+// keep their depth.
+// Row blocks are processed in parallel. Each block converts its rows and
+// the adjacent ones into a small buffer and slides a 3x3 window over it
 pub fn regularize(
-    depth_map: &Array2<f64>,
-    variance_map: &Array2<f64>,
-    flag_map: &Array2<i64>,
+    depth_map: &ArrayView2<'_, f64>,
+    variance_map: &ArrayView2<'_, f64>,
+    flag_map: &ArrayView2<'_, i64>,
 ) -> Array2<f64> {
     assert_eq!(depth_map.shape(), variance_map.shape());
     assert_eq!(depth_map.shape(), flag_map.shape());
     let shape = depth_map.shape();
     let (height, width) = (shape[0], shape[1]);
 
-    let inv_depth_map = depth_map.map(|&e| e.inv());
-    let inv_variance_map = variance_map.map(|&e| e.inv());
-
-    let mut id = Array::zeros((height+2, width+2));
-    let mut iv = Array::zeros((height+2, width+2));
-    let mut f = Array::from_elem((height+2, width+2), Flag::NotProcessed as i64);
-    id.slice_mut(s![1..1+height, 1..1+width]).assign(&inv_depth_map);
-    iv.slice_mut(s![1..1+height, 1..1+width]).assign(&inv_variance_map);
-    f.slice_mut(s![1..1+height, 1..1+width]).assign(&flag_map);
-
-    let mut regularized: Array2<f64> = Array::zeros((height, width));
-    for y in 0..height {
-        for x in 0..width {
-            regularized[[y, x]] = match regularize_patch(
-                &id.slice(s![y..y+3, x..x+3]),
-                &iv.slice(s![y..y+3, x..x+3]),
-                &f.slice(s![y..y+3, x..x+3])
-            ) {
-                Some(id) => id.inv(),
-                None => depth_map[[y, x]]
-            }
-        }
+    let mut regularized = vec![0.0; height * width];
+    if height == 0 || width == 0 {
+        return Array::from_shape_vec((height, width), regularized).unwrap();
     }
 
     regularized
+        .par_chunks_mut(ROWS_PER_BLOCK * width)
+        .enumerate()
+        .for_each(|(block, chunk)| {
+            let begin = block * ROWS_PER_BLOCK;
+            let end = begin + chunk.len() / width;
+            // including one row above and below the block
+            let (sbegin, send) = (begin.saturating_sub(1),
+                                  std::cmp::min(end + 1, height));
+            let samples = to_samples(depth_map, variance_map, flag_map,
+                                     sbegin, send);
+            let rows: Vec<&[Option<Sample>]> = samples.chunks(width).collect();
+
+            for y in begin..end {
+                let r = y - sbegin;
+                let window_begin = r.saturating_sub(1);
+                let window_end = std::cmp::min(r + 2, rows.len());
+                let window = &rows[window_begin..window_end];
+                let out = &mut chunk[(y - begin) * width..(y - begin + 1) * width];
+                for x in 0..width {
+                    out[x] = match regularize_pixel(window, r - window_begin, x) {
+                        Some(inv_depth) => inv_depth.inv(),
+                        None => depth_map[[y, x]]
+                    };
+                }
+            }
+        });
+
+    Array::from_shape_vec((height, width), regularized).unwrap()
 }
 
 #[cfg(test)]
 mod tests {
     use super::*;
+    use approx::assert_abs_diff_eq;
     use ndarray::arr2;
 
-    #[test]
-    fn test_regularize_patch() {
-        let depth_map = arr2(
-            &[[0., 3., 3.],
-              [4., 1., 9.],
-              [2., 8., 2.]],
-        );
-        let variance_map = arr2(
-            &[[0., 3., 1.],
-              [8., 2., 4.],
-              [0., 1., 2.]]
-        );
-        let flag_map = arr2(
-            &[[0, 1, 1],
-              [1, 0, 1],
-              [0, 1, 1]]
-        );
-
-        let mut expected = Inv::from(0.);
-        let id1 = depth_map[[1, 1]].inv();
-        let v1 = variance_map[[1, 1]];
-        let mut n_contributions = 0;
-        for y in 0..3 {
-            for x in 0..3 {
-                let id2 = depth_map[[y, x]].inv();
-                let v2 = variance_map[[y, x]];
-                let flag = flag_map[[y, x]];
-                if are_statically_same(id2, id1, v1, v2) &&
-                   flag == (Flag::Success as i64) {
-                    expected = expected + id2 * v2.inv();
-                    n_contributions += 1;
+    // straightforward implementation of 'regularize'
+    fn regularize_naive(
+        depth_map: &Array2<f64>,
+        variance_map: &Array2<f64>,
+        flag_map: &Array2<i64>,
+    ) -> Array2<f64> {
+        let shape = depth_map.shape();
+        let (height, width) = (shape[0] as i64, shape[1] as i64);
+        let success = Flag::Success as i64;
+
+        let mut regularized = depth_map.clone();
+        for y in 0..height {
+            for x in 0..width {
+                let c = [y as usize, x as usize];
+                if flag_map[c] != success {
+                    continue;
                 }
+                let mut numerator = 0.0;
+                let mut denominator = 0.0;
+                for yn in y-1..y+2 {
+                    for xn in x-1..x+2 {
+                        if yn < 0 || yn >= height || xn < 0 || xn >= width {
+                            continue;
+                        }
+                        let n = [yn as usize, xn as usize];
+                        if flag_map[n] != success {
+                            continue;
+                        }
+                        if !stat::are_statically_same(
+                            depth_map[c].inv(), depth_map[n].inv(),
+                            variance_map[c], variance_map[n]
+                        ) {
+                            continue;
+                        }
+                        let w = f64::from(variance_map[n].inv());
+                        numerator += f64::from(depth_map[n].inv()) * w;
+                        denominator += w;
+                    }
+                }
+                regularized[c] = Inv::from(numerator / denominator).inv();
             }
         }
-        expected = expected / n_contributions;
-
-        let inv_depth_map = depth_map.map(|&e| e.inv());
-        let r = regularize_patch(
-            &inv_depth_map.view(),
-            &variance_map.view(),
-            &flag_map.view()
-        );
-        assert_eq!(r, expected);
+        regularized
     }
 
     #[test]
@@ -127,36 +186,62 @@ mod tests {
               [2., 4., 2., 2.]]
         );
 
+        let (s, n) = (Flag::Success as i64, Flag::NotProcessed as i64);
         let flag_map = arr2(
-            &[[1, 0, 1, 1],
-              [1, 1, 0, 1],
-              [0, 1, 0, 1]]
+            &[[s, n, s, s],
+              [s, s, n, s],
+              [n, s, n, s]]
         );
-        let regularized = regularize(&depth_map, &variance_map, &flag_map);
+        let regularized = regularize(&depth_map.view(), &variance_map.view(),
+                                     &flag_map.view());
 
-        let depth_patch = arr2(
-            &[[0., 0., 0.],
-              [2., 4., 2.],
-              [4., 1., 9.]]
-        );
-        let variance_patch = arr2(
-            &[[0., 0., 0.],
-              [4., 3., 5.],
-              [5., 2., 1.]]
-        );
-        let flag_patch = arr2(
-            &[[0, 0, 0],
-              [0, 1, 1],
-              [1, 0, 1]]
-        );
+        assert_eq!(regularized,
+                   regularize_naive(&depth_map, &variance_map, &flag_map));
 
-        assert_eq!(
-            regularized[[0, 2]],
-            regularize_patch(
-                &depth_patch.map(|&e| e.inv()).view(),
-                &variance_patch.view(),
-                &flag_patch.view(),
-            ).inv()
+        // pixels without a valid estimate are not changed
+        assert_eq!(regularized[[0, 1]], 2.);
+        assert_eq!(regularized[[2, 2]], 8.);
+    }
+
+    #[test]
+    fn test_regularize_outlier() {
+        let depth_map = arr2(
+            &[[2., 2., 2.],
+              [2., 100., 2.],
+              [2., 2., 2.]]
         );
+        let variance_map = Array::from_elem((3, 3), 1e-4);
+        let flag_map = Array::from_elem((3, 3), Flag::Success as i64);
+
+        let regularized = regularize(&depth_map.view(), &variance_map.view(),
+                                     &flag_map.view());
+        // the center is not statistically same as the neighbors
+        // so it is not affected by them and vice versa
+        for y in 0..3 {
+            for x in 0..3 {
+                assert_abs_diff_eq!(regularized[[y, x]], depth_map[[y, x]],
+                                    epsilon = 1e-8);
+            }
+        }
+    }
+
+    #[test]
+    fn test_regularize_blocks() {
+        // spans several row blocks
+        let shape = (37, 21);
+        let depth_map = Array::from_shape_fn(shape, |(y, x)| {
+            1. + ((3 * x + 7 * y) % 5) as f64 * 0.1
+        });
+        let variance_map = Array::from_shape_fn(shape, |(y, x)| {
+            0.05 + ((x + 2 * y) % 3) as f64 * 0.01
+        });
+        let flag_map = Array::from_shape_fn(shape, |(y, x)| {
+            if (x * y) % 7 == 3 { Flag::NotProcessed as i64 } else { Flag::Success as i64 }
+        });
+
+        let regularized = regularize(&depth_map.view(), &variance_map.view(),
+                                     &flag_map.view());
+        assert_eq!(regularized,
+                   regularize_naive(&depth_map, &variance_map, &flag_map));
     }
 }
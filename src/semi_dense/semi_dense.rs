@@ -1,32 +1,57 @@
-use std::convert::TryInto;
-
-use indicatif::ProgressBar;
-use ndarray::{arr1, Array, Array1, Array2};
-use ndarray_linalg::solve::Inverse;
-use ndarray_linalg::Norm;
-
-use crate::camera::Normalizer;
-use crate::gradient::gradient1d;
-use crate::interpolation::Interpolation;
-use crate::image_range::{ImageRange, all_in_range};
-use crate::transform::get_translation;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::time::Instant;
+
+use ndarray::{Array, Array2, ArrayView2, ArrayViewMut2};
+use rayon::prelude::*;
+use rayon::ThreadPool;
+
+use crate::interpolation::interpolate_xy;
+use crate::image_range::is_in_range;
+use crate::transform::Matrix4;
 use crate::warp::Warp;
 use super::depth::{calc_key_depth, calc_ref_depth, depth_search_range};
-use super::epipolar::{key_coordinates, ref_coordinates, calc_key_epipole};
+use super::context::PairContext;
+use super::epipolar::{clip_segment, key_coordinates, ref_coordinates, N_KEY_SAMPLES};
 use super::flag::Flag;
 use super::frame::Frame;
-use super::gradient::ImageGradient;
+use super::reference::ReferenceFrames;
 use super::hypothesis;
 use super::hypothesis::Hypothesis;
 use super::intensities;
+use super::metrics::UpdateStats;
 use super::numeric::Inv;
 use super::numeric::Inverse as InverseDepth;
 use super::params::Params;
 use super::variance::{calc_alpha, calc_variance, geo_var, photo_var};
 
+// number of coarse matches refined at full resolution
+// by the coarse-to-fine search
+const N_CANDIDATES: usize = 3;
+
+// Buffers for the variable length samples along the reference epipolar
+// line. One is kept per thread and reused for every pixel so that
+// 'estimate' does not allocate once the buffers have grown
+pub struct Scratch {
+    xs_ref: Vec<[f64; 2]>,
+    us_ref: Vec<[f64; 2]>,
+    ref_intensities: Vec<f64>,
+    candidates: Vec<(f64, usize)>,
+}
+
+impl Scratch {
+    pub fn new() -> Self {
+        Scratch {
+            xs_ref: Vec::new(),
+            us_ref: Vec::new(),
+            ref_intensities: Vec::new(),
+            candidates: Vec::with_capacity(N_CANDIDATES + 1),
+        }
+    }
+}
+
 fn step_ratio(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
     key_inv_depth: Inv,
 ) -> Result<f64, Flag> {
     let key_depth: f64 = key_inv_depth.inv();
@@ -40,94 +65,224 @@ fn step_ratio(
 }
 
 fn calc_key_direction(
-    x_key: &Array1<f64>,
-    e_key: &Array1<f64>,
-    ref_direction: &Array1<f64>,
-) -> Array1<f64> {
-    let d = x_key - e_key;
-    if ref_direction.dot(&d) > 0. { d } else { -d }
+    x_key: &[f64; 2],
+    e_key: &[f64; 2],
+    ref_direction: &[f64; 2],
+) -> [f64; 2] {
+    let d = [x_key[0] - e_key[0], x_key[1] - e_key[1]];
+    if ref_direction[0] * d[0] + ref_direction[1] * d[1] > 0. {
+        d
+    } else {
+        [-d[0], -d[1]]
+    }
 }
 
 fn calc_ref_ends(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
     depth_range: (f64, f64),
-) -> (Array1<f64>, Array1<f64>) {
+) -> ([f64; 2], [f64; 2]) {
     let (min_depth, max_depth) = depth_range;
     let (x_min_ref, _) = transform_rk.warp(x_key, min_depth);
     let (x_max_ref, _) = transform_rk.warp(x_key, max_depth);
     (x_min_ref, x_max_ref)
 }
 
+#[inline]
+fn is_in_image(u: &[f64; 2], image_shape: &[usize]) -> bool {
+    is_in_range(u[0], u[1], image_shape)
+}
+
 fn check_us_ref(
-    us_ref: &Array2<f64>,
+    us_ref: &[[f64; 2]],
     us_key_size: usize,
     ref_image_shape: &[usize]
 ) -> Result<(), Flag> {
-    if us_ref.nrows() < us_key_size {
+    if us_ref.len() < us_key_size {
         return Err(Flag::RefEpipolarTooShort);
     }
 
-    if !us_ref.row(0).is_in_range(ref_image_shape) {
+    if !is_in_image(&us_ref[0], ref_image_shape) {
         return Err(Flag::RefCloseOutOfRange);
     }
 
     // TODO when does this condition become true?
-    if !us_ref.row(us_ref.nrows()-1).is_in_range(ref_image_shape) {
+    if !is_in_image(&us_ref[us_ref.len()-1], ref_image_shape) {
         return Err(Flag::RefFarOutOfRange);
     }
 
     Ok(())
 }
 
-fn transform_rk(
-    transform_wk: &Array2<f64>,
-    transform_wr: &Array2<f64>,
-) -> Array2<f64> {
-    let transform_rw = transform_wr.inv().unwrap();
-    transform_rw.dot(transform_wk)
+// coordinate at a fractional 'index' of 'xs' by linear interpolation
+fn interpolate_coordinate(xs: &[[f64; 2]], index: f64) -> [f64; 2] {
+    let i = (index.floor().max(0.) as usize).min(xs.len() - 1);
+    let j = (i + 1).min(xs.len() - 1);
+    let t = index - i as f64;
+    [xs[i][0] + t * (xs[j][0] - xs[i][0]),
+     xs[i][1] + t * (xs[j][1] - xs[i][1])]
+}
+
+// Clips the reference epipolar segment to the image so that
+// no samples are taken outside of it
+fn clip_ref_ends(
+    x_min_ref: &[f64; 2],
+    x_max_ref: &[f64; 2],
+    refframe: &Frame,
+) -> Result<([f64; 2], [f64; 2]), Flag> {
+    let u_min = refframe.camera_params.unnormalize_xy(x_min_ref);
+    let u_max = refframe.camera_params.unnormalize_xy(x_max_ref);
+    // 'unnormalize' is affine so the parameters are the same
+    // in the normalized coordinates
+    let (t0, t1) = match clip_segment(&u_min, &u_max, refframe.image.shape()) {
+        // the whole segment including the closest end is out of the image
+        None => return Err(Flag::RefCloseOutOfRange),
+        Some(t) => t,
+    };
+    let d = [x_max_ref[0] - x_min_ref[0], x_max_ref[1] - x_min_ref[1]];
+    Ok(([x_min_ref[0] + t0 * d[0], x_min_ref[1] + t0 * d[1]],
+        [x_min_ref[0] + t1 * d[0], x_min_ref[1] + t1 * d[1]]))
+}
+
+// Fills scratch.xs_ref, us_ref and ref_intensities with the samples
+// [begin, end) of 'xs' = x_min + i * step * direction (i = 0, 1, ...)
+fn sample_ref(
+    refframe: &Frame,
+    x_min: &[f64; 2],
+    unit_direction: &[f64; 2],
+    step: f64,
+    begin: usize,
+    end: usize,
+    scratch: &mut Scratch,
+) {
+    let ref_image = refframe.image.view();
+    scratch.xs_ref.clear();
+    scratch.us_ref.clear();
+    scratch.ref_intensities.clear();
+    for i in begin..end {
+        let s = (i as f64) * step;
+        let x = [x_min[0] + s * unit_direction[0], x_min[1] + s * unit_direction[1]];
+        let u = refframe.camera_params.unnormalize_xy(&x);
+        scratch.xs_ref.push(x);
+        scratch.us_ref.push(u);
+        scratch.ref_intensities.push(interpolate_xy(&ref_image, u[0], u[1]));
+    }
 }
 
+// Searches the epipolar segment from x_min_ref to x_max_ref coarse to fine.
+// Key and reference intensities are first compared at 'coarse_step_factor'
+// times the step sizes and then the full resolution search is run only
+// around the N_CANDIDATES best coarse matches.
+// Returns the fractional index of the best match along the full resolution
+// samples x_min_ref + i * ref_step_size * direction, or None if the coarse
+// samples cannot be taken
+fn search_coarse_to_fine(
+    x_key: &[f64; 2],
+    key_direction: &[f64; 2],
+    key_step_size: f64,
+    key_intensities: &[f64; N_KEY_SAMPLES],
+    x_min_ref: &[f64; 2],
+    unit_direction: &[f64; 2],
+    n_samples: usize,
+    keyframe: &Frame,
+    refframe: &Frame,
+    params: &Params,
+    scratch: &mut Scratch,
+) -> Option<f64> {
+    let factor = params.coarse_step_factor;
+    let step = params.ref_step_size;
+
+    let xs_key = key_coordinates(key_direction, x_key, key_step_size * factor as f64);
+    let key_image = keyframe.image.view();
+    let mut coarse_key_intensities = [0.; N_KEY_SAMPLES];
+    for i in 0..N_KEY_SAMPLES {
+        let u = keyframe.camera_params.unnormalize_xy(&xs_key[i]);
+        if !is_in_image(&u, keyframe.image.shape()) {
+            return None;
+        }
+        coarse_key_intensities[i] = interpolate_xy(&key_image, u[0], u[1]);
+    }
+
+    let n_coarse = (n_samples + factor - 1) / factor;
+    if n_coarse < N_KEY_SAMPLES {
+        return None;
+    }
+    sample_ref(refframe, x_min_ref, unit_direction, step * factor as f64,
+               0, n_coarse, scratch);
+    let mut candidates = std::mem::replace(&mut scratch.candidates, Vec::new());
+    intensities::find_candidates(&scratch.ref_intensities, &coarse_key_intensities,
+                                 N_CANDIDATES, &mut candidates);
+
+    let half = N_KEY_SAMPLES / 2;
+    let mut min_error = f64::INFINITY;
+    let mut index = None;
+    for &(_, offset) in candidates.iter() {
+        // full resolution windows whose centers are
+        // within one coarse step from the coarse match
+        let center = (offset + half) * factor;
+        let begin = center.saturating_sub(factor + half);
+        let end = std::cmp::min(center + factor + half + 1, n_samples);
+        if end - begin < N_KEY_SAMPLES {
+            continue;
+        }
+        sample_ref(refframe, x_min_ref, unit_direction, step, begin, end, scratch);
+        let m = intensities::find_minimum(&scratch.ref_intensities, key_intensities);
+        if m.error < min_error {
+            min_error = m.error;
+            let delta = if params.subpixel { m.subpixel_offset() } else { 0. };
+            index = Some((begin + m.argmin + half) as f64 + delta);
+        }
+    }
+    scratch.candidates = candidates;
+    index
+}
+
+// context: PairContext of (keyframe, refframe)
 pub fn estimate(
-    u_key: &Array1<f64>,
+    u_key: &[f64; 2],
     prior: &Hypothesis,
     keyframe: &Frame,
     refframe: &Frame,
-    image_grad: &ImageGradient,
+    context: &PairContext,
     params: &Params,
+    scratch: &mut Scratch,
 ) -> Result<Hypothesis, Flag> {
-    let transform_wk = &keyframe.transform;
-    let transform_wr = &refframe.transform;
-    let transform_rk = transform_rk(&transform_wk, &transform_wr);
+    let transform_rk = &context.transform_rk;
 
     let depth_range = depth_search_range(&prior.range());
-    let x_key = keyframe.camera_params.normalize(u_key);
+    let x_key = keyframe.camera_params.normalize_xy(u_key);
 
     // calculate step size along the epipolar line on the keyframe
     // step size / inv depth = approximately const
-    let result = step_ratio(&transform_rk, &x_key, prior.inv_depth);
+    let result = step_ratio(transform_rk, &x_key, prior.inv_depth);
     // note that key_step_size is always > 0
     let key_step_size = match result {
         Err(e) => return Err(e),
         Ok(ratio) => ratio * params.ref_step_size,
     };
 
-    let (x_min_ref, x_max_ref) = calc_ref_ends(&transform_rk, &x_key, depth_range);
-    let ref_direction = &x_max_ref - &x_min_ref;
+    let (x_min_ref, x_max_ref) = calc_ref_ends(transform_rk, &x_key, depth_range);
+    let ref_direction = [x_max_ref[0] - x_min_ref[0], x_max_ref[1] - x_min_ref[1]];
 
-    let e_key = calc_key_epipole(&transform_wk, &transform_wr);
-    let key_direction = calc_key_direction(&x_key, &e_key, &ref_direction);
+    let key_direction = calc_key_direction(&x_key, &context.e_key, &ref_direction);
 
     // calculate coordinates on the keyframe image
     let xs_key = key_coordinates(&key_direction, &x_key, key_step_size);
-    let us_key = keyframe.camera_params.unnormalize(&xs_key);
-    if !all_in_range(&us_key, keyframe.image.shape()) {
-        return Err(Flag::KeyOutOfRange);
+    let mut us_key = [[0.; 2]; N_KEY_SAMPLES];
+    for i in 0..N_KEY_SAMPLES {
+        us_key[i] = keyframe.camera_params.unnormalize_xy(&xs_key[i]);
+        if !is_in_image(&us_key[i], keyframe.image.shape()) {
+            return Err(Flag::KeyOutOfRange);
+        }
     }
 
     // extract intensities from the key coordinates
-    let key_intensities = keyframe.image.interpolate(&us_key);
-    let key_gradient = gradient1d(&key_intensities).norm();
+    let key_image = keyframe.image.view();
+    let mut key_intensities = [0.; N_KEY_SAMPLES];
+    for i in 0..N_KEY_SAMPLES {
+        key_intensities[i] = interpolate_xy(&key_image, us_key[i][0], us_key[i][1]);
+    }
+    let key_gradient = intensities::gradient(&key_intensities, 1.);
 
     // most of coordinates has insufficient gradient
     // return early to reduce computation
@@ -135,21 +290,70 @@ pub fn estimate(
         return Err(Flag::InsufficientGradient);
     }
 
-    // calculate coordinates on the reference frame image
-    let xs_ref = ref_coordinates(&x_min_ref, &ref_direction, params.ref_step_size);
-    let us_ref = refframe.camera_params.unnormalize(&xs_ref);
-    check_us_ref(&us_ref, us_key.nrows(), refframe.image.shape())?;
+    let x_ref = if params.coarse_step_factor > 1 {
+        let (x_min_ref, x_max_ref) = clip_ref_ends(&x_min_ref, &x_max_ref, refframe)?;
+        let d = [x_max_ref[0] - x_min_ref[0], x_max_ref[1] - x_min_ref[1]];
+        let norm = (d[0] * d[0] + d[1] * d[1]).sqrt();
+        let n_samples = (norm / params.ref_step_size) as usize;
+        if n_samples < N_KEY_SAMPLES {
+            return Err(Flag::RefEpipolarTooShort);
+        }
+        let unit_direction = [d[0] / norm, d[1] / norm];
+
+        let index = match search_coarse_to_fine(
+            &x_key, &key_direction, key_step_size, &key_intensities,
+            &x_min_ref, &unit_direction,
+            n_samples, keyframe, refframe, params, scratch
+        ) {
+            Some(index) => index,
+            None => {
+                // search the whole segment at full resolution
+                sample_ref(refframe, &x_min_ref, &unit_direction,
+                           params.ref_step_size, 0, n_samples, scratch);
+                if params.subpixel {
+                    intensities::search_subpixel(&scratch.ref_intensities,
+                                                 &key_intensities)
+                } else {
+                    intensities::search(&scratch.ref_intensities,
+                                        &key_intensities) as f64
+                }
+            }
+        };
+        let s = index * params.ref_step_size;
+        [x_min_ref[0] + s * unit_direction[0], x_min_ref[1] + s * unit_direction[1]]
+    } else {
+        // calculate coordinates on the reference frame image
+        ref_coordinates(&x_min_ref, &ref_direction, params.ref_step_size,
+                        &mut scratch.xs_ref);
+        scratch.us_ref.clear();
+        for x in scratch.xs_ref.iter() {
+            scratch.us_ref.push(refframe.camera_params.unnormalize_xy(x));
+        }
+        check_us_ref(&scratch.us_ref, N_KEY_SAMPLES, refframe.image.shape())?;
 
-    // extract intensities from the ref coordinates
-    let ref_intensities = refframe.image.interpolate(&us_ref);
+        // extract intensities from the ref coordinates
+        let ref_image = refframe.image.view();
+        scratch.ref_intensities.clear();
+        for u in scratch.us_ref.iter() {
+            scratch.ref_intensities.push(interpolate_xy(&ref_image, u[0], u[1]));
+        }
 
-    // search along epipolar line and calculate depth
-    let argmin = intensities::search(&ref_intensities, &key_intensities);
-    let key_depth = calc_key_depth(&transform_rk, &x_key, &xs_ref.row(argmin));
+        // search along epipolar line
+        if params.subpixel {
+            let index = intensities::search_subpixel(&scratch.ref_intensities,
+                                                     &key_intensities);
+            interpolate_coordinate(&scratch.xs_ref, index)
+        } else {
+            let argmin = intensities::search(&scratch.ref_intensities,
+                                             &key_intensities);
+            scratch.xs_ref[argmin]
+        }
+    };
+    // calculate depth
+    let key_depth = calc_key_depth(transform_rk, &x_key, &x_ref);
     // calculate variance
-    let alpha = calc_alpha(&transform_rk, &x_key, depth_range, key_depth);
-    let t_rk = get_translation(&transform_rk);
-    let geo_var = geo_var(&x_key, &t_rk, &image_grad.get(&u_key));
+    let alpha = calc_alpha(transform_rk, &x_key, depth_range, key_depth);
+    let geo_var = geo_var(&x_key, &context.t_rk, &keyframe.gradient.get(u_key));
     let photo_var = photo_var(key_gradient / key_step_size);
     let variance = calc_variance(alpha, geo_var, photo_var, &params.var_coeffs);
 
@@ -157,86 +361,245 @@ pub fn estimate(
     Ok(Hypothesis::new(key_depth.inv(), variance, params.inv_depth_range))
 }
 
-pub fn update_depth(
+fn update_pixel(
+    x: usize,
+    y: usize,
     keyframe: &Frame,
-    refframes: &Vec<Frame>,
-    age_map: &Array2<usize>,
-    prior_depth: &Array2<f64>,
-    prior_variance: &Array2<f64>,
+    refframes: &ReferenceFrames,
+    contexts: &Vec<PairContext>,
+    age_map: &ArrayView2<'_, usize>,
+    prior_depth: &ArrayView2<'_, f64>,
+    prior_variance: &ArrayView2<'_, f64>,
     params: &Params,
-) -> (Array2<i64>, Array2<f64>, Array2<f64>) {
-    assert!(age_map.shape() == prior_depth.shape());
-    assert!(age_map.shape() == prior_variance.shape());
-    assert!(age_map.shape() == keyframe.image.shape());
-    for i in 0..refframes.len() {
-        assert!(age_map.shape() == refframes[i].image.shape());
+    scratch: &mut Scratch,
+    stats: &mut UpdateStats,
+) -> (Flag, f64, f64) {
+    let age = age_map[[y, x]];
+    let d = prior_depth[[y, x]];
+    let v = prior_variance[[y, x]];
+
+    // frames older than the oldest stored one may have been dropped.
+    // such pixels are estimated with the oldest frame
+    let clamped = refframes.clamp_age(age);
+    let refframe = match refframes.get(clamped) {
+        Some(refframe) => refframe,
+        // refframe cannot be observed from this pixel
+        None => return (Flag::NotProcessed, d, v),
+    };
+    if clamped < age {
+        stats.n_age_clamped += 1;
     }
+    let context = &contexts[clamped - 1];
 
-    let image_grad = ImageGradient::new(&keyframe.image);
-    let height = keyframe.image.shape()[0];
-    let width = keyframe.image.shape()[1];
-
-    let mut flag_map = Array::zeros((height, width));
-    let mut result_depth = Array::zeros((height, width));
-    let mut result_variance = Array::zeros((height, width));
     let inv_depth_range = params.inv_depth_range;
+    if let Err(f) = hypothesis::check_args(d.inv(), v, inv_depth_range) {
+        return (f, d, v);
+    }
 
-    let bar = ProgressBar::new((height * width).try_into().unwrap());
+    stats.n_attempted += 1;
+    let u_key = [x as f64, y as f64];
+    let prior = Hypothesis::new(d.inv(), v, inv_depth_range);
+    let result = estimate(&u_key, &prior, keyframe, refframe,
+                          context, params, scratch);
+    let (h, flag) = match result {
+        Err(flag) => (prior, flag),
+        Ok(h) => (h, Flag::Success),
+    };
+    (flag, h.inv_depth.inv(), h.variance)
+}
+
+// number of rows estimated by one task
+const ROWS_PER_BLOCK: usize = 8;
+
+// Pixels whose depth can be estimated, that is, pixels observed by a
+// reference frame (age > 0) with the image gradient magnitude of at
+// least 'min_image_gradient'
+pub struct Candidates {
+    // flat indices of the pixels in raster order
+    pub indices: Vec<usize>,
+    // indices[block_starts[b]..block_starts[b+1]] are in the b-th block
+    // of ROWS_PER_BLOCK rows
+    pub block_starts: Vec<usize>,
+    // pixels not observed by any reference frame
+    pub n_unobserved: usize,
+}
 
+pub fn select_candidates(
+    keyframe: &Frame,
+    age_map: &ArrayView2<'_, usize>,
+    min_image_gradient: f64,
+) -> Candidates {
+    let (height, width) = (age_map.shape()[0], age_map.shape()[1]);
+    let mut indices = Vec::new();
+    let mut block_starts = Vec::with_capacity(height / ROWS_PER_BLOCK + 2);
+    let mut n_unobserved = 0;
     for y in 0..height {
+        if y % ROWS_PER_BLOCK == 0 {
+            block_starts.push(indices.len());
+        }
         for x in 0..width {
-            bar.inc(1);
-
-            let age = age_map[[y, x]];
-            let d = prior_depth[[y, x]];
-            let v = prior_variance[[y, x]];
-
-            if age == 0 {
-                // refframe cannot be observed from this pixel
-                result_depth[[y, x]] = d;
-                result_variance[[y, x]] = v;
-                flag_map[[y, x]] = Flag::NotProcessed as i64;
+            if age_map[[y, x]] == 0 {
+                n_unobserved += 1;
                 continue;
             }
-
-            if refframes.len() < age {
-                eprintln!("Age exceeds the refframe size");
-                std::process::exit(1);
+            if min_image_gradient > 0. &&
+               keyframe.gradient.magnitude(x, y) < min_image_gradient {
+                continue;
             }
+            indices.push(y * width + x);
+        }
+    }
+    block_starts.push(indices.len());
+    Candidates {
+        indices: indices,
+        block_starts: block_starts,
+        n_unobserved: n_unobserved,
+    }
+}
 
-            let refframe = &refframes[refframes.len()-age];
+// Only the pixels selected by 'select_candidates' are estimated.
+// The other pixels keep the prior depth and variance and are flagged
+// as NotProcessed (age == 0) or InsufficientGradient.
+// Pixels are independent of each other so blocks of rows are processed
+// in parallel on 'pool', or on the global rayon pool, which has as many
+// threads as logical cores, if 'pool' is None.
+// If given, progress(n_processed_rows, height) is called every time a
+// block of rows is finished. It can be called from any worker thread.
+pub fn update_depth(
+    keyframe: &Frame,
+    refframes: &ReferenceFrames,
+    age_map: &ArrayView2<'_, usize>,
+    prior_depth: &ArrayView2<'_, f64>,
+    prior_variance: &ArrayView2<'_, f64>,
+    params: &Params,
+    pool: Option<&ThreadPool>,
+    progress: Option<&(dyn Fn(usize, usize) + Sync)>,
+) -> (Array2<i64>, Array2<f64>, Array2<f64>, UpdateStats) {
+    let shape = (age_map.shape()[0], age_map.shape()[1]);
+    let mut flag_map = Array2::zeros(shape);
+    let mut result_depth = Array2::zeros(shape);
+    let mut result_variance = Array2::zeros(shape);
+    let stats = update_depth_into(
+        keyframe, refframes, age_map, prior_depth, prior_variance,
+        params, pool, progress,
+        &mut flag_map.view_mut(),
+        &mut result_depth.view_mut(),
+        &mut result_variance.view_mut()
+    );
+    (flag_map, result_depth, result_variance, stats)
+}
 
-            if let Err(f) = hypothesis::check_args(d.inv(), v, inv_depth_range) {
-                result_depth[[y, x]] = d;
-                result_variance[[y, x]] = v;
-                flag_map[[y, x]] = f as i64;
-                continue;
-            }
+// Same as 'update_depth' but writes the results into the given arrays,
+// which have to be the same shape as the age map and must not overlap
+// the inputs. Nothing is allocated per pixel so a caller can reuse the
+// output buffers across keyframes.
+pub fn update_depth_into(
+    keyframe: &Frame,
+    refframes: &ReferenceFrames,
+    age_map: &ArrayView2<'_, usize>,
+    prior_depth: &ArrayView2<'_, f64>,
+    prior_variance: &ArrayView2<'_, f64>,
+    params: &Params,
+    pool: Option<&ThreadPool>,
+    progress: Option<&(dyn Fn(usize, usize) + Sync)>,
+    flag_map: &mut ArrayViewMut2<'_, i64>,
+    result_depth: &mut ArrayViewMut2<'_, f64>,
+    result_variance: &mut ArrayViewMut2<'_, f64>,
+) -> UpdateStats {
+    assert!(age_map.shape() == prior_depth.shape());
+    assert!(age_map.shape() == prior_variance.shape());
+    assert!(age_map.shape() == keyframe.image.shape());
+    for refframe in refframes.iter() {
+        assert!(age_map.shape() == refframe.image.shape());
+    }
+    assert!(age_map.shape() == flag_map.shape());
+    assert!(age_map.shape() == result_depth.shape());
+    assert!(age_map.shape() == result_variance.shape());
 
-            let u_key = arr1(&[x as f64, y as f64]);
-            let prior = Hypothesis::new(d.inv(), v, inv_depth_range);
-            let result = estimate(&u_key, &prior, &keyframe, refframe,
-                                  &image_grad, &params);
-            let (h, flag) = match result {
-                Err(flag) => (prior, flag),
-                Ok(h) => (h, Flag::Success),
-            };
-
-            result_depth[[y, x]] = h.inv_depth.inv();
-            result_variance[[y, x]] = h.variance;
+    let start = Instant::now();
+
+    // indexed by age - 1
+    let contexts: Vec<PairContext> = refframes.iter().rev()
+        .map(|refframe| PairContext::new(keyframe, refframe))
+        .collect();
+    let height = keyframe.image.shape()[0];
+    let width = keyframe.image.shape()[1];
+
+    let candidates = select_candidates(keyframe, age_map, params.min_image_gradient);
+
+    let n_processed = AtomicUsize::new(0);
+    let update_block = |block: usize| -> (Vec<(Flag, f64, f64)>, UpdateStats) {
+        let begin = block * ROWS_PER_BLOCK;
+        let end = std::cmp::min(begin + ROWS_PER_BLOCK, height);
+        let indices = &candidates.indices[
+            candidates.block_starts[block]..candidates.block_starts[block + 1]
+        ];
+
+        let mut stats = UpdateStats::new();
+        let mut scratch = Scratch::new();
+        let mut results = Vec::with_capacity(indices.len());
+        for &i in indices.iter() {
+            let (y, x) = (i / width, i % width);
+            let result = update_pixel(x, y, keyframe, refframes, &contexts,
+                                      age_map, prior_depth, prior_variance,
+                                      params, &mut scratch, &mut stats);
+            stats.add(result.0);
+            results.push(result);
+        }
+
+        if let Some(progress) = progress {
+            let n = n_processed.fetch_add(end - begin, Ordering::SeqCst);
+            progress(n + end - begin, height);
+        }
+        (results, stats)
+    };
+
+    let n_blocks = (height + ROWS_PER_BLOCK - 1) / ROWS_PER_BLOCK;
+    let update_blocks = || -> Vec<(Vec<(Flag, f64, f64)>, UpdateStats)> {
+        (0..n_blocks).into_par_iter().map(update_block).collect()
+    };
+    let blocks = match pool {
+        None => update_blocks(),
+        Some(pool) => pool.install(update_blocks),
+    };
+
+    // untouched pixels are copied from the priors at once
+    flag_map.zip_mut_with(age_map, |flag, &age| {
+        *flag = if age == 0 {
+            Flag::NotProcessed as i64
+        } else {
+            Flag::InsufficientGradient as i64
+        };
+    });
+    result_depth.assign(prior_depth);
+    result_variance.assign(prior_variance);
+
+    let mut stats = UpdateStats::new();
+    let n_masked = height * width - candidates.indices.len();
+    stats.flag_counts[Flag::NotProcessed.index()] += candidates.n_unobserved;
+    stats.flag_counts[Flag::InsufficientGradient.index()] += n_masked - candidates.n_unobserved;
+
+    for (block, (results, block_stats)) in blocks.into_iter().enumerate() {
+        let indices = &candidates.indices[candidates.block_starts[block]..];
+        for (&i, (flag, depth, variance)) in indices.iter().zip(results.into_iter()) {
+            let (y, x) = (i / width, i % width);
             flag_map[[y, x]] = flag as i64;
+            result_depth[[y, x]] = depth;
+            result_variance[[y, x]] = variance;
         }
+        stats = stats.merge(&block_stats);
     }
+    stats.elapsed = start.elapsed();
 
-    bar.finish();
-
-    (flag_map, result_depth, result_variance)
+    stats
 }
 
 #[cfg(test)]
 mod tests {
     use super::*;
+    use crate::transform::to_matrix4;
     use ndarray::arr2;
+    use ndarray_linalg::solve::Inverse;
 
     #[test]
     fn test_calc_ref_ends() {
@@ -254,31 +617,23 @@ mod tests {
               [0., 0., 0., 1.]]
         );
 
-        let transform_rk = transform_rk(&transform_wk, &transform_wr);
-        assert_eq!(
-            transform_rk,
-            arr2(&[[1., 0., 0., -8.],
-                   [0., 1., 0., 0.],
-                   [0., 0., 1., 0.],
-                   [0., 0., 0., 1.]])
-        );
-
-        let x_key = arr1(&[2., 0.]);
+        let transform_rk = to_matrix4(&transform_wr.inv().unwrap().dot(&transform_wk));
+        let x_key = [2., 0.];
         let (x_min_ref, x_max_ref) = calc_ref_ends(&transform_rk, &x_key, (2., 3.));
-        assert_eq!(x_min_ref, arr1(&[-2., 0.]));
-        assert_eq!(x_max_ref, arr1(&[-2./3., 0.]));
+        assert_eq!(x_min_ref, [-2., 0.]);
+        assert_eq!(x_max_ref, [-2./3., 0.]);
     }
 
     #[test]
     fn test_step_ratio() {
-        let transform_rk = arr2(
-            &[[0., 0., 1., -2.],
-              [0., 1., 0., 2.],
-              [-1., 0., 0., 7.],
-              [0., 0., 0., 1.]]
-        );
+        let transform_rk = [
+            [0., 0., 1., -2.],
+            [0., 1., 0., 2.],
+            [-1., 0., 0., 7.],
+            [0., 0., 0., 1.]
+        ];
         let key_depth = 2.0;
-        let x_key = arr1(&[2.0, 2.0]);
+        let x_key = [2.0, 2.0];
         // ref_depth = -(2.0 * 2.0) + 7.0 = 3.0
         let ref_depth = 3.0;
 
@@ -289,7 +644,7 @@ mod tests {
         );
 
         let key_depth = 4.0;
-        let x_key = arr1(&[2.0, 2.0]);
+        let x_key = [2.0, 2.0];
         // ref_depth = -(4.0 * 2.0) + 7.0 = -1.0
         assert_eq!(
             step_ratio(&transform_rk, &x_key, key_depth.inv()).unwrap_err(),
@@ -297,34 +652,188 @@ mod tests {
         );
     }
 
+    #[test]
+    fn test_search_coarse_to_fine() {
+        use crate::camera::CameraParameters;
+        use crate::semi_dense::VarianceCoefficients;
+
+        // every row of the image has the same intensities
+        let shape = (60, 200);
+        let image = Array::from_shape_fn(shape, |(_, x)| {
+            1. + ((x * 37) % 23) as f64 + 0.3 * ((x * 11) % 7) as f64
+        });
+        // one pixel is 0.01 on the normalized image plane
+        let camera_params = CameraParameters::new((100., 100.), (0., 30.));
+        let frame = Frame::from_arrays(camera_params, image.clone(),
+                                       Array::eye(4));
+
+        let params = Params {
+            inv_depth_range: (Inv::from(0.1), Inv::from(1.)),
+            var_coeffs: VarianceCoefficients { photo: 1., geo: 1. },
+            ref_step_size: 0.01,
+            min_gradient: 0.,
+            subpixel: false,
+            coarse_step_factor: 4,
+            min_image_gradient: 0.,
+        };
+
+        // pixels 120, ..., 124 on the key epipolar line
+        let key_intensities = [image[[30, 120]], image[[30, 121]], image[[30, 122]],
+                               image[[30, 123]], image[[30, 124]]];
+        // reference samples are taken at pixels 10, 11, ..., 189
+        let mut scratch = Scratch::new();
+        let index = search_coarse_to_fine(
+            &[1.22, 0.], &[1., 0.], 0.01, &key_intensities,
+            &[0.1, 0.], &[1., 0.], 180, &frame, &frame, &params, &mut scratch
+        );
+        // the sample of pixel 122
+        assert_eq!(index, Some(112.));
+
+        // the same result as the search at full resolution
+        sample_ref(&frame, &[0.1, 0.], &[1., 0.], 0.01, 0, 180, &mut scratch);
+        assert_eq!(intensities::search(&scratch.ref_intensities, &key_intensities), 112);
+
+        // too short to search coarsely
+        let index = search_coarse_to_fine(
+            &[1.22, 0.], &[1., 0.], 0.01, &key_intensities,
+            &[0.1, 0.], &[1., 0.], 16, &frame, &frame, &params, &mut scratch
+        );
+        assert_eq!(index, None);
+    }
+
+    #[test]
+    fn test_select_candidates() {
+        use crate::camera::CameraParameters;
+
+        // vertical edge between x = 9 and x = 10
+        let (height, width) = (20, 20);
+        let image = Array::from_shape_fn((height, width), |(_, x)| {
+            if x < 10 { 0. } else { 1. }
+        });
+        let camera_params = CameraParameters::new((10., 10.), (10., 10.));
+        let keyframe = Frame::from_arrays(camera_params, image, Array::eye(4));
+
+        // rows 0, 1 and 2 are not observed
+        let age_map = Array::from_shape_fn((height, width), |(y, _)| {
+            if y < 3 { 0 } else { 1 }
+        });
+
+        let candidates = select_candidates(&keyframe, &age_map.view(), 0.);
+        let expected: Vec<usize> = (3 * width..height * width).collect();
+        assert_eq!(candidates.indices, expected);
+        assert_eq!(candidates.n_unobserved, 3 * width);
+        assert_eq!(candidates.block_starts, vec![0, 5 * width, 13 * width, 17 * width]);
+
+        let candidates = select_candidates(&keyframe, &age_map.view(), 1.);
+        let mut expected = Vec::new();
+        // the top and bottom rows of the gradient are 0
+        for y in 3..height - 1 {
+            expected.push(y * width + 9);
+            expected.push(y * width + 10);
+        }
+        assert_eq!(candidates.indices, expected);
+        assert_eq!(candidates.block_starts, vec![0, 5 * 2, 13 * 2, 16 * 2]);
+    }
+
+    #[test]
+    fn test_interpolate_coordinate() {
+        let xs = [[0., 1.], [2., 3.], [4., 7.]];
+        assert_eq!(interpolate_coordinate(&xs, 1.), [2., 3.]);
+        assert_eq!(interpolate_coordinate(&xs, 0.5), [1., 2.]);
+        assert_eq!(interpolate_coordinate(&xs, 1.25), [2.5, 4.]);
+        assert_eq!(interpolate_coordinate(&xs, 2.), [4., 7.]);
+    }
+
     #[test]
     fn test_check_us_ref() {
         let ref_image_shape: [usize; 2] = [40, 30];
         let us_key_size = 2;
 
-        let us_ref = arr2(
-            &[[10., 20.],
-              [0., 0.]]
-        );
+        let us_ref = [[10., 20.], [0., 0.]];
         let result = check_us_ref(&us_ref, us_key_size, &ref_image_shape);
         assert_eq!(result.unwrap(), ());
 
-        let us_ref = arr2(&[[10., -2.]]);
+        let us_ref = [[10., -2.]];
         let result = check_us_ref(&us_ref, us_key_size, &ref_image_shape);
         assert_eq!(result.unwrap_err(), Flag::RefEpipolarTooShort);
 
-        let us_ref = arr2(
-            &[[10., -2.],
-              [0., 0.]]
-        );
+        let us_ref = [[10., -2.], [0., 0.]];
         let result = check_us_ref(&us_ref, us_key_size, &ref_image_shape);
         assert_eq!(result.unwrap_err(), Flag::RefCloseOutOfRange);
 
-        let us_ref = arr2(
-            &[[0., 0.],
-              [10., -2.]]
-        );
+        let us_ref = [[0., 0.], [10., -2.]];
         let result = check_us_ref(&us_ref, us_key_size, &ref_image_shape);
         assert_eq!(result.unwrap_err(), Flag::RefFarOutOfRange);
     }
+
+    #[test]
+    fn test_update_depth_into() {
+        use crate::camera::CameraParameters;
+        use crate::semi_dense::VarianceCoefficients;
+
+        // flat image, so no pixel has enough image gradient
+        let (height, width) = (10, 12);
+        let image = Array::from_elem((height, width), 1.);
+        let camera_params = CameraParameters::new((10., 10.), (6., 5.));
+        let keyframe = Frame::from_arrays(camera_params, image, Array::eye(4));
+        let refframes = ReferenceFrames::from_vec(vec![keyframe.clone()]);
+
+        // rows 0 and 1 are not observed
+        let age_map = Array::from_shape_fn((height, width), |(y, _)| {
+            if y < 2 { 0 } else { 1 }
+        });
+        let prior_depth = Array::from_shape_fn((height, width), |(y, x)| {
+            1. + (y * width + x) as f64
+        });
+        let prior_variance = Array::from_elem((height, width), 0.5);
+
+        let params = Params {
+            inv_depth_range: (Inv::from(0.1), Inv::from(1.)),
+            var_coeffs: VarianceCoefficients { photo: 1., geo: 1. },
+            ref_step_size: 0.01,
+            min_gradient: 0.,
+            subpixel: false,
+            coarse_step_factor: 1,
+            min_image_gradient: 1.,
+        };
+
+        let pool = rayon::ThreadPoolBuilder::new().num_threads(1).build().unwrap();
+
+        // outputs are overwritten entirely
+        let mut flag_map = Array::from_elem((height, width), 100);
+        let mut depth = Array::from_elem((height, width), -1.);
+        let mut variance = Array::from_elem((height, width), -1.);
+        let stats = update_depth_into(
+            &keyframe, &refframes,
+            &age_map.view(), &prior_depth.view(), &prior_variance.view(),
+            &params, Some(&pool), None,
+            &mut flag_map.view_mut(), &mut depth.view_mut(), &mut variance.view_mut()
+        );
+
+        assert_eq!(depth, prior_depth);
+        assert_eq!(variance, prior_variance);
+        for y in 0..height {
+            for x in 0..width {
+                let expected = if y < 2 {
+                    Flag::NotProcessed
+                } else {
+                    Flag::InsufficientGradient
+                };
+                assert_eq!(flag_map[[y, x]], expected as i64);
+            }
+        }
+        assert_eq!(stats.flag_counts[Flag::NotProcessed.index()], 2 * width);
+        assert_eq!(stats.flag_counts[Flag::InsufficientGradient.index()],
+                   (height - 2) * width);
+
+        // the allocating version gives the same results
+        let (flag_map1, depth1, variance1, _) = update_depth(
+            &keyframe, &refframes,
+            &age_map.view(), &prior_depth.view(), &prior_variance.view(),
+            &params, Some(&pool), None
+        );
+        assert_eq!(flag_map1, flag_map);
+        assert_eq!(depth1, depth);
+        assert_eq!(variance1, variance);
+    }
 }
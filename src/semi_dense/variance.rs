@@ -1,9 +1,7 @@
-use crate::homogeneous::Homogeneous;
-use crate::projection::Projection;
-use crate::transform::{get_rotation, get_translation};
-use crate::vector;
+use crate::projection::project_xy;
+use crate::transform::Matrix4;
+use crate::vector::normalize2;
 use crate::warp::Warp;
-use ndarray::{Array1, Array2, ArrayView1};
 
 static EPSILON: f64 = 1e-16;
 
@@ -27,14 +25,25 @@ pub fn photo_var(gradient: f64) -> f64 {
     2. / gradient
 }
 
+#[inline]
+fn dot2(a: &[f64; 2], b: &[f64; 2]) -> f64 {
+    a[0] * b[0] + a[1] * b[1]
+}
+
+// dot product of the rotation part of a row of a transform and a 3D vector
+#[inline]
+fn dot_row(row: &[f64; 4], v: &[f64; 3]) -> f64 {
+    row[0] * v[0] + row[1] * v[1] + row[2] * v[2]
+}
+
 fn geo_var_(
-    direction: &Array1<f64>,
-    image_grad: &Array1<f64>,
+    direction: &[f64; 2],
+    image_grad: &[f64; 2],
 ) -> f64 {
-    let direction = vector::normalize(direction);
-    let image_grad = vector::normalize(image_grad);
+    let direction = normalize2(direction);
+    let image_grad = normalize2(image_grad);
 
-    let p = direction.dot(&image_grad);
+    let p = dot2(&direction, &image_grad);
 
     if p == 0. {
         return 1. / EPSILON;
@@ -43,64 +52,64 @@ fn geo_var_(
 }
 
 pub fn geo_var(
-    x_key: &Array1<f64>,
-    t_rk: &ArrayView1<'_, f64>,
-    image_grad: &Array1<f64>,
+    x_key: &[f64; 2],
+    t_rk: &[f64; 3],
+    image_grad: &[f64; 2],
 ) -> f64 {
-    let epipolar_direction = x_key - &Projection::project(t_rk);
+    let e = project_xy(t_rk);
+    let epipolar_direction = [x_key[0] - e[0], x_key[1] - e[1]];
     geo_var_(&epipolar_direction, image_grad)
 }
 
 fn alpha_(
-    x_key: &Array1<f64>,
+    x_key: &[f64; 2],
     x_ref_i: f64,
     direction_i: f64,
-    ri: &ArrayView1<'_, f64>,
-    rz: &ArrayView1<'_, f64>,
+    ri: &[f64; 4],
+    rz: &[f64; 4],
     ti: f64,
     tz: f64
 ) -> f64 {
-    let y = x_key.to_homogeneous();
+    let y = [x_key[0], x_key[1], 1.];
 
-    let d = rz.dot(&y) * ti - ri.dot(&y) * tz;
+    let d = dot_row(rz, &y) * ti - dot_row(ri, &y) * tz;
     let n = x_ref_i * tz - ti;
 
     direction_i * d / (n * n)
 }
 
 fn ref_epipolar_direction(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
     depth_range: (f64, f64),
-) -> Array1<f64> {
+) -> [f64; 2] {
     let (min_depth, max_depth) = depth_range;
     let (x_min_ref, _) = transform_rk.warp(x_key, min_depth);
     let (x_max_ref, _) = transform_rk.warp(x_key, max_depth);
-    vector::normalize(&(x_max_ref - x_min_ref))
+    normalize2(&[x_max_ref[0] - x_min_ref[0], x_max_ref[1] - x_min_ref[1]])
 }
 
 fn calc_alpha_(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
-    direction: &Array1<f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
+    direction: &[f64; 2],
     prior_depth: f64
 ) -> f64 {
-    let rot_rk = get_rotation(&transform_rk);
-    let t_rk = get_translation(&transform_rk);
     let (x_ref, _) = transform_rk.warp(x_key, prior_depth);
 
     let i = if f64::abs(direction[0]) > f64::abs(direction[1]) { 0 } else { 1 };
-    alpha_(&x_key, x_ref[i], direction[i],
-           &rot_rk.row(i), &rot_rk.row(2), t_rk[i], t_rk[2])
+    alpha_(x_key, x_ref[i], direction[i],
+           &transform_rk[i], &transform_rk[2],
+           transform_rk[i][3], transform_rk[2][3])
 }
 
 pub fn calc_alpha(
-    transform_rk: &Array2<f64>,
-    x_key: &Array1<f64>,
+    transform_rk: &Matrix4,
+    x_key: &[f64; 2],
     depth_range: (f64, f64),
     prior_depth: f64
 ) -> f64 {
-    let d = ref_epipolar_direction(&transform_rk, &x_key, depth_range);
+    let d = ref_epipolar_direction(transform_rk, x_key, depth_range);
     calc_alpha_(transform_rk, x_key, &d, prior_depth)
 }
 
@@ -108,30 +117,29 @@ pub fn calc_alpha(
 mod tests {
     use super::*;
     use approx::assert_abs_diff_eq;
-    use ndarray::{arr1, arr2, Array};
-    use ndarray_linalg::Norm;
-    use crate::transform;
+    use ndarray::{arr1, arr2};
+    use crate::transform::{make_matrix, to_matrix4};
 
     #[test]
     fn test_geo_var() {
-        let gradient = arr1(&[20., -30.]);
-        let direction = arr1(&[6., 2.]);  // epipolar line direction
+        let gradient = [20., -30.];
+        let direction = [6., 2.];  // epipolar line direction
 
         // smoke
         let variance = geo_var_(&direction, &gradient);
-        let p = vector::normalize(&direction).dot(&vector::normalize(&gradient));
+        let p = dot2(&normalize2(&direction), &normalize2(&gradient));
         assert_abs_diff_eq!(variance, 1. / (p * p));
 
         // zero epipolar direction
-        let variance = geo_var_(&Array::zeros(2), &gradient);
+        let variance = geo_var_(&[0., 0.], &gradient);
         assert_abs_diff_eq!(variance, 1. / EPSILON);
 
         // zero gradient
-        let variance = geo_var_(&direction, &Array::zeros(2));
+        let variance = geo_var_(&direction, &[0., 0.]);
         assert_abs_diff_eq!(variance, 1. / EPSILON);
 
         // the case that the gradient is orthogonal to epipolar direction (max variance)
-        let gradient = arr1(&[direction[1], -direction[0]]);
+        let gradient = [direction[1], -direction[0]];
         let variance = geo_var_(&direction, &gradient);
         assert_abs_diff_eq!(variance, 1. / EPSILON);
     }
@@ -145,30 +153,28 @@ mod tests {
 
     #[test]
     fn test_alpha_() {
-        let rot = arr2(
-            &[[0., -1., 0.],
-              [1., 0., 0.],
-              [0., 0., 1.]]
-        );
-        let t = arr1(&[2., 4., -3.]);
+        let r0 = [0., -1., 0., 2.];
+        let r1 = [1., 0., 0., 4.];
+        let r2 = [0., 0., 1., -3.];
+        let t = [2., 4., -3.];
 
-        let direction = arr1(&[0.1, 0.3]);
-        let x_key = arr1(&[0.3, 0.9]);
-        let x_ref = arr1(&[-0.6, 0.4]);
+        let direction = [0.1, 0.3];
+        let x_key = [0.3, 0.9];
+        let x_ref = [-0.6, 0.4];
 
-        let y = x_key.to_homogeneous();
+        let y = [x_key[0], x_key[1], 1.];
 
         let alpha = alpha_(&x_key, x_ref[0], direction[0],
-                           &rot.row(0), &rot.row(2), t[0], t[2]);
+                           &r0, &r2, t[0], t[2]);
 
-        let n = t[0] * rot.row(2).dot(&y) - t[2] * rot.row(0).dot(&y);
+        let n = t[0] * dot_row(&r2, &y) - t[2] * dot_row(&r0, &y);
         let d = t[0] - x_ref[0] * t[2];
         assert_eq!(alpha, direction[0] * n / (d * d));
 
         let alpha = alpha_(&x_key, x_ref[1], direction[1],
-                           &rot.row(1), &rot.row(2), t[1], t[2]);
+                           &r1, &r2, t[1], t[2]);
 
-        let n = t[1] * rot.row(2).dot(&y) - t[2] * rot.row(1).dot(&y);
+        let n = t[1] * dot_row(&r2, &y) - t[2] * dot_row(&r1, &y);
         let d = t[1] - x_ref[1] * t[2];
         assert_eq!(alpha, direction[1] * n / (d * d));
     }
@@ -182,24 +188,24 @@ mod tests {
         ]);
         let t_rk = arr1(&[2., 4., -3.]);
 
-        let transform_rk = transform::make_matrix(&rot_rk, &t_rk);
+        let transform_rk = to_matrix4(&make_matrix(&rot_rk, &t_rk));
 
-        let x_key = arr1(&[0.3, 0.9]);
+        let x_key = [0.3, 0.9];
         let prior_depth = 10.0;
 
         let (x_ref, _) = transform_rk.warp(&x_key, prior_depth);
 
-        let direction = arr1(&[0.1, 0.3]);
+        let direction = [0.1, 0.3];
         assert_eq!(
             calc_alpha_(&transform_rk, &x_key, &direction, prior_depth),
             alpha_(&x_key, x_ref[1], direction[1],
-                        &rot_rk.row(1), &rot_rk.row(2), t_rk[1], t_rk[2]));
+                   &transform_rk[1], &transform_rk[2], t_rk[1], t_rk[2]));
 
-        let direction = arr1(&[-2., 1.]);
+        let direction = [-2., 1.];
         assert_eq!(
             calc_alpha_(&transform_rk, &x_key, &direction, prior_depth),
             alpha_(&x_key, x_ref[0], direction[0],
-                   &rot_rk.row(0), &rot_rk.row(2), t_rk[0], t_rk[2]));
+                   &transform_rk[0], &transform_rk[2], t_rk[0], t_rk[2]));
     }
 
     #[test]
@@ -214,21 +220,22 @@ mod tests {
 
     #[test]
     fn test_ref_epipolar_direction() {
-        let transform_rk = arr2(
-            &[[0., 0., 1., -1.],
-              [0., 1., 0., -2.],
-              [-1., 0., 0., 4.],
-              [0., 0., 0., 1.]]
-        );
-        let x_key = arr1(&[0.4, 1.2]);
+        let transform_rk = [
+            [0., 0., 1., -1.],
+            [0., 1., 0., -2.],
+            [-1., 0., 0., 4.],
+            [0., 0., 0., 1.]
+        ];
+        let x_key = [0.4, 1.2];
         let (min, max) = (0.5, 1.4);
         let d1 = ref_epipolar_direction(&transform_rk, &x_key, (min, max));
         let (x_ref_min, _) = transform_rk.warp(&x_key, min);
         let (x_ref_max, _) = transform_rk.warp(&x_key, max);
-        let d2 = x_ref_max - x_ref_min;
+        let d2 = [x_ref_max[0] - x_ref_min[0], x_ref_max[1] - x_ref_min[1]];
+        let norm2 = dot2(&d2, &d2).sqrt();
 
-        assert_eq!(d1.norm(), 1.);
+        assert_abs_diff_eq!(dot2(&d1, &d1), 1., epsilon = 1e-12);
         // d1 and d2 should be the same direction
-        assert_eq!(d1.dot(&d2), d2.norm());
+        assert_abs_diff_eq!(dot2(&d1, &d2), norm2, epsilon = 1e-12);
     }
 }
@@ -2,6 +2,30 @@ use crate::homogeneous::Homogeneous;
 use ndarray::{Array, Array2, ArrayBase, ArrayView1, ArrayView2, Axis,
               Data, LinalgScalar, Ix1, Ix2, stack};
 
+// 4x4 transformation matrix on the stack
+pub type Matrix4 = [[f64; 4]; 4];
+
+pub fn to_matrix4<S: Data<Elem = f64>>(transform: &ArrayBase<S, Ix2>) -> Matrix4 {
+    assert_eq!(transform.shape(), &[4, 4]);
+    let mut m = [[0.; 4]; 4];
+    for i in 0..4 {
+        for j in 0..4 {
+            m[i][j] = transform[[i, j]];
+        }
+    }
+    m
+}
+
+#[inline]
+pub fn transform_xyz(transform: &Matrix4, p: &[f64; 3]) -> [f64; 3] {
+    let mut q = [0.; 3];
+    for i in 0..3 {
+        q[i] = transform[i][0] * p[0] + transform[i][1] * p[1] +
+               transform[i][2] * p[2] + transform[i][3];
+    }
+    q
+}
+
 pub trait Transform<A, D, Rhs> {
     fn transform(&self, points0: &Rhs) -> Array<A, D>;
 }
@@ -115,6 +139,19 @@ mod tests {
         assert_eq!(transform10.transform(&point0), point1);
     }
 
+    #[test]
+    fn test_transform_xyz() {
+        let transform10 = arr2(&[
+            [1., 0., 0., 1.],
+            [0., 0., -1., 2.],
+            [0., 1., 0., 3.],
+            [0., 0., 0., 1.],
+        ]);
+        let m = to_matrix4(&transform10);
+        assert_eq!(m[1], [0., 0., -1., 2.]);
+        assert_eq!(transform_xyz(&m, &[1., 2., 5.]), [2., -3., 5.]);
+    }
+
     #[test]
     fn test_get_rotation() {
         let transform = arr2(&[[1, 2, 3, -1],
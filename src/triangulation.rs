@@ -1,6 +1,6 @@
 use ndarray::{ArrayBase, ArrayView1, Data, Ix1, Ix2};
 use crate::homogeneous::Homogeneous;
-use crate::transform::{get_rotation, get_translation};
+use crate::transform::{get_rotation, get_translation, Matrix4};
 
 static EPSILON: f64 = 1e-16;
 
@@ -35,13 +35,25 @@ pub fn calc_depth0<
                  &rot10.row(i), &rot10.row(2), t10[i], t10[2])
 }
 
+// same as calc_depth0 but for fixed-size inputs
+pub fn calc_depth0_xy(transform_10: &Matrix4, x0: &[f64; 2], x1: &[f64; 2]) -> f64 {
+    let t = [transform_10[0][3], transform_10[1][3], transform_10[2][3]];
+    let i = if f64::abs(t[0]) > f64::abs(t[1]) { 0 } else { 1 };
+    let (r_i, r_z) = (&transform_10[i], &transform_10[2]);
+    let y0 = [x0[0], x0[1], 1.];
+    let dot = |r: &[f64; 4]| r[0] * y0[0] + r[1] * y0[1] + r[2] * y0[2];
+    let n = t[i] - t[2] * x1[i];
+    let d = dot(r_z) * x1[i] - dot(r_i);
+    n / (d + EPSILON)
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
     use ndarray::{arr1, arr2, Array1, Array2};
     use ndarray_linalg::solve::Inverse;
     use crate::projection::Projection;
-    use crate::transform::{make_matrix, Transform};
+    use crate::transform::{make_matrix, to_matrix4, Transform};
 
     #[test]
     fn test_calc_depth0() {
@@ -61,6 +73,10 @@ mod tests {
             let depth = calc_depth0(&transform_10, &x0.view(), &x1.view());
 
             assert_eq!(depth, p0[2]);
+
+            let depth = calc_depth0_xy(&to_matrix4(&transform_10),
+                                       &[x0[0], x0[1]], &[x1[0], x1[1]]);
+            assert_eq!(depth, p0[2]);
         }
 
         // rotvec = [0, np.pi/2, 0]
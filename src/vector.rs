@@ -10,6 +10,14 @@ pub fn normalize<S: Data<Elem = f64>>(v: &ArrayBase<S, Ix1>) -> Array1<f64> {
     v.map(|e| e / norm)
 }
 
+pub fn normalize2(v: &[f64; 2]) -> [f64; 2] {
+    let norm = (v[0] * v[0] + v[1] * v[1]).sqrt();
+    if norm == 0. {
+        return *v;
+    }
+    [v[0] / norm, v[1] / norm]
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -25,5 +33,8 @@ mod tests {
 
         let v = arr1(&[0., 0.]);
         assert_eq!(normalize(&v), v);
+
+        assert_eq!(normalize2(&[4., 3.]), [0.8, 0.6]);
+        assert_eq!(normalize2(&[0., 0.]), [0., 0.]);
     }
 }
@@ -1,24 +1,27 @@
-use crate::transform::Transform;
-use crate::projection::Projection;
+use crate::transform::{Matrix4, Transform, to_matrix4, transform_xyz};
+use crate::projection::{Projection, inv_project_xy, project_xy};
 use crate::camera::{CameraParameters, Normalizer};
-use ndarray::{Array, Array1, Array2, ArrayBase, Data, Ix1, Ix2};
+use ndarray::{Array, Array1, Array2, ArrayBase, Data, Ix1, Ix2,
+              LinalgScalar, ScalarOperand};
+use num_traits::float::Float;
 
 pub trait Warp<XType, DepthType, D> {
     type Output;
     fn warp(&self, x0: XType, depth0: DepthType) -> Self::Output;
 }
 
-impl<S1, S2> Warp<&ArrayBase<S1, Ix1>, f64, Ix1>
+impl<A, S1, S2> Warp<&ArrayBase<S1, Ix1>, A, Ix1>
 for ArrayBase<S2, Ix2>
 where
-    S1: Data<Elem = f64>,
-    S2: Data<Elem = f64>,
+    S1: Data<Elem = A>,
+    S2: Data<Elem = A>,
+    A: Float + LinalgScalar + ScalarOperand,
 {
-    type Output = (Array1<f64>, f64);
+    type Output = (Array1<A>, A);
     fn warp(
         &self,
         x0: &ArrayBase<S1, Ix1>,
-        depth0: f64
+        depth0: A
     ) -> Self::Output {
         let point0 = Projection::inv_project(x0, depth0);
         let point1 = self.transform(&point0);
@@ -28,14 +31,15 @@ where
     }
 }
 
-impl<S1, S2, S3> Warp<&ArrayBase<S2, Ix2>, &ArrayBase<S3, Ix1>, Ix2>
+impl<A, S1, S2, S3> Warp<&ArrayBase<S2, Ix2>, &ArrayBase<S3, Ix1>, Ix2>
 for ArrayBase<S1, Ix2>
 where
-    S1: Data<Elem = f64>,
-    S2: Data<Elem = f64>,
-    S3: Data<Elem = f64>,
+    S1: Data<Elem = A>,
+    S2: Data<Elem = A>,
+    S3: Data<Elem = A>,
+    A: Float + LinalgScalar + ScalarOperand,
 {
-    type Output = (Array2<f64>, Array1<f64>);
+    type Output = (Array2<A>, Array1<A>);
     fn warp(
         &self,
         xs0: &ArrayBase<S2, Ix2>,
@@ -43,14 +47,26 @@ where
     ) -> Self::Output {
         let points0 = Projection::inv_project(xs0, depths0);
         let points1 = self.transform(&points0);
-        let xs1 = Projection::<Ix2, &Array1<f64>>::project(&points1);
+        let xs1 = Projection::<Ix2, &Array1<A>>::project(&points1);
         let depths1 = points1.slice(s![.., 2]).to_owned();
         (xs1, depths1)
     }
 }
 
+// allocation-free warp of a single point
+impl Warp<&[f64; 2], f64, Ix1> for Matrix4 {
+    type Output = ([f64; 2], f64);
+    #[inline]
+    fn warp(&self, x0: &[f64; 2], depth0: f64) -> Self::Output {
+        let point1 = transform_xyz(self, &inv_project_xy(x0, depth0));
+        (project_xy(&point1), point1[2])
+    }
+}
+
 pub struct PerspectiveWarp<'a, T> where T: Data<Elem = f64> {
     transform10: &'a ArrayBase<T, Ix2>,
+    // copy of transform10 for the fixed-size warp
+    transform10_xy: Matrix4,
     camera_params0: &'a CameraParameters,
     camera_params1: &'a CameraParameters,
 }
@@ -63,6 +79,7 @@ impl<'a, T> PerspectiveWarp<'a, T> where T: Data<Elem = f64> {
     ) -> Self {
         PerspectiveWarp {
             transform10: transform10,
+            transform10_xy: to_matrix4(transform10),
             camera_params0: camera_params0,
             camera_params1: camera_params1,
         }
@@ -84,6 +101,20 @@ where
     }
 }
 
+// allocation-free warp of a single pixel
+impl<'a, S> Warp<&[f64; 2], f64, Ix1> for PerspectiveWarp<'a, S>
+where
+    S: Data<Elem = f64>,
+{
+    type Output = ([f64; 2], f64);
+    #[inline]
+    fn warp(&self, u0: &[f64; 2], depth0: f64) -> Self::Output {
+        let x0 = self.camera_params0.normalize_xy(u0);
+        let (x1, depth1) = self.transform10_xy.warp(&x0, depth0);
+        (self.camera_params1.unnormalize_xy(&x1), depth1)
+    }
+}
+
 impl<'a, S1, S2, S3> Warp<&ArrayBase<S1, Ix2>, &ArrayBase<S2, Ix1>, Ix2>
 for PerspectiveWarp<'a, S3>
 where
@@ -149,6 +180,37 @@ mod tests {
         assert_eq!(depth1_, depth1);
     }
 
+    #[test]
+    fn test_warp_xy() {
+        let transform10: Matrix4 = [
+            [0., 0., 1., 0.],
+            [0., 1., 0., 0.],
+            [-1., 0., 0., 4.],
+            [0., 0., 0., 1.],
+        ];
+        let (x1, depth1) = transform10.warp(&[0., 0.], 2.);
+        assert_eq!(x1, [0.5, 0.0]);
+        assert_eq!(depth1, 4.);
+        let (x1, depth1) = transform10.warp(&[2., -1.], 4.);
+        assert_eq!(x1, [-1.0, 1.0]);
+        assert_eq!(depth1, -4.);
+    }
+
+    #[test]
+    fn test_warp_2d_f32() {
+        let transform10 = arr2(&[
+            [0f32, 0., 1., 0.],
+            [0., 1., 0., 0.],
+            [-1., 0., 0., 4.],
+            [0., 0., 0., 1.],
+        ]);
+        let xs0 = arr2(&[[0f32, 0.], [2., -1.]]);
+        let depths0 = arr1(&[2f32, 4.]);
+        let (xs1_, depths1_) = Warp::warp(&transform10, &xs0, &depths0);
+        assert_eq!(xs1_, arr2(&[[0.5f32, 0.0], [-1.0, 1.0]]));
+        assert_eq!(depths1_, arr1(&[4f32, -4.]));
+    }
+
     #[bench]
     fn bench_warp_2d(b: &mut Bencher) {
         let transform10 = arr2(&[
@@ -195,6 +257,10 @@ mod tests {
         let (u1_, depth1_) = warp10.warp(&u0, depth0);
         assert_eq!(u1_, u1);
         assert_eq!(depth1_, depth1);
+
+        let (u1_, depth1_) = warp10.warp(&[25., 40.], depth0);
+        assert_eq!(u1_, [40., 70.]);
+        assert_eq!(depth1_, depth1);
     }
 
     #[test]
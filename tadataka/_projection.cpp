@@ -54,13 +54,16 @@ PYBIND11_MODULE(_projection, m) {
   m.def("inv_pi",
         py::overload_cast<const Eigen::Vector2d, double>(&inv_pi));
 
+  // functions that take arrays of points release the GIL
   m.def("inv_pi",
         py::overload_cast<
           const Eigen::Matrix<double, Eigen::Dynamic, 2>,
-                              const Eigen::VectorXd>(&inv_pi));
+                              const Eigen::VectorXd>(&inv_pi),
+        py::call_guard<py::gil_scoped_release>());
 
   m.def("project_vector", &project_vector,
         py::return_value_policy::reference_internal);
   m.def("project_vectors", &project_vectors,
-        py::return_value_policy::reference_internal);
+        py::return_value_policy::reference_internal,
+        py::call_guard<py::gil_scoped_release>());
 }
@@ -37,5 +37,6 @@ PYBIND11_MODULE(_transform, m) {
         const Eigen::Ref<const RowMajorMatrixXd<4, 4>>&,
         const Eigen::Ref<const RowVectors3D>&,
         Eigen::Ref<RowVectors3D>&>(&transform),
-        py::return_value_policy::reference_internal);
+        py::return_value_policy::reference_internal,
+        py::call_guard<py::gil_scoped_release>());
 }
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from tadataka.coordinates import image_coordinates
+from tadataka.projection import inv_pi
+from tadataka.utils import float_dtype
+
+
+MAX_CACHED_RAYS = 16
+
+_rays = OrderedDict()
+# DVO and the semi-dense mapping may run in different threads
+_rays_lock = threading.Lock()
+
+
+def camera_model_key(camera_model):
+    distortion_model = camera_model.distortion_model
+    return (type(distortion_model).__name__,
+            tuple(camera_model.camera_parameters.params),
+            tuple(getattr(distortion_model, "params", ())))
+
+
+def readonly(array):
+    array.setflags(write=False)
+    return array
+
+
+def normalized_rays(camera_model, image_shape, dtype=np.float64):
+    """
+    Returns the pixel grid 'image_coordinates(image_shape)' and its
+    coordinates on the normalized image plane.
+    Normalization (especially undistortion) of every pixel is expensive
+    so the results are cached per camera model and image shape.
+    The normalized coordinates are cast to 'dtype'.
+    The returned arrays are read-only
+    """
+    key = (camera_model_key(camera_model), tuple(image_shape[0:2]),
+           np.dtype(dtype).name)
+    with _rays_lock:
+        if key in _rays:
+            _rays.move_to_end(key)
+            return _rays[key]
+
+    # computed without the lock. threads that miss the same key at once
+    # compute the same rays and the last one is kept
+    us = image_coordinates(image_shape)
+    xs = camera_model.normalize(us).astype(dtype, copy=False)
+    rays = readonly(us), readonly(xs)
+    with _rays_lock:
+        _rays[key] = rays
+        if len(_rays) > MAX_CACHED_RAYS:
+            _rays.popitem(last=False)
+    return rays
+
+
+class BackProjection(object):
+    """
+    Pixel grid, normalized rays and 3D points of a depth map.
+    Shared by the error evaluation and the pose update so that
+    they are computed once per (camera model, image shape, depth map).
+    Rays and points are float32 if the depth map is float32
+    """
+    def __init__(self, camera_model, depth_map):
+        assert(np.ndim(depth_map) == 2)
+        self.camera_model = camera_model
+        self.shape = depth_map.shape
+
+        self.us, self.xs = normalized_rays(camera_model, depth_map.shape,
+                                           float_dtype(depth_map))
+        self.depths = readonly(depth_map.flatten())
+        self.P = readonly(inv_pi(self.xs, self.depths))
+        self.mask = readonly(self.depths > 0)  # pixels with valid depth
@@ -27,9 +27,13 @@ const RowMajorMatrix2d unnormalize(
 }
 
 
+// the GIL is released while the keypoints are processed.
+// arguments and return values are converted before and after that
 PYBIND11_MODULE(_normalizer, m) {
   m.def("normalize", &normalize,
-        py::return_value_policy::reference_internal);
+        py::return_value_policy::reference_internal,
+        py::call_guard<py::gil_scoped_release>());
   m.def("unnormalize", &unnormalize,
-        py::return_value_policy::reference_internal);
+        py::return_value_policy::reference_internal,
+        py::call_guard<py::gil_scoped_release>());
 }
@@ -1,12 +1,13 @@
 import numpy as np
+cimport cython
 cimport numpy as cnp
 
 
-cdef extern from "_radtan_distort_jacobian.h":
+cdef extern from "_radtan_distort_jacobian.h" nogil:
     void distort_jacobian(double *dist_coeffs, double *keypoint, double *out)
 
 
-cdef extern from "_radtan_distort.h":
+cdef extern from "_radtan_distort.h" nogil:
     void distort(double *dist_coeffs, double *keypoint, double *out)
 
 
@@ -28,11 +29,22 @@ def distort_(cnp.ndarray[cnp.double_t, ndim=1] keypoint,
 
 def radtan_distort(cnp.ndarray[cnp.double_t, ndim=2] keypoints,
                    cnp.ndarray[cnp.double_t, ndim=1] dist_coeffs):
+    cdef double[:, ::1] ps
+    cdef double *coeffs
+    cdef double q[2]
+    cdef Py_ssize_t i
 
     keypoints = np.ascontiguousarray(keypoints, dtype=np.float64)
-
-    for i in range(keypoints.shape[0]):
-        keypoints[i] = distort_(keypoints[i], dist_coeffs)
+    dist_coeffs = np.ascontiguousarray(dist_coeffs, dtype=np.float64)
+    ps = keypoints
+    coeffs = &dist_coeffs[0]
+
+    # the loop does not touch Python objects so other threads can run
+    with nogil:
+        for i in range(ps.shape[0]):
+            distort(coeffs, &ps[i, 0], q)
+            ps[i, 0] = q[0]
+            ps[i, 1] = q[1]
     return keypoints
 
 
@@ -87,12 +99,53 @@ def undistort_(cnp.ndarray[cnp.double_t, ndim=1] keypoint,
     return p
 
 
+# same as 'undistort_' but runs without the GIL.
+# 'keypoint' and 'out' can be the same
+@cython.cdivision(True)
+cdef int undistort_point(double *dist_coeffs, double *keypoint, double *out,
+                         int max_iter, float threshold) nogil:
+    cdef double J[4]
+    cdef double q[2]
+    cdef double p[2]
+    cdef double r0, r1, det, d0, d1
+    cdef int i
+
+    p[0] = keypoint[0]
+    p[1] = keypoint[1]
+    for i in range(max_iter):
+        distort_jacobian(dist_coeffs, p, J)
+        distort(dist_coeffs, p, q)
+        r0 = keypoint[0] - q[0]
+        r1 = keypoint[1] - q[1]
+
+        # d = inv(J) * r
+        det = J[0] * J[3] - J[1] * J[2]
+        d0 = (J[3] / det) * r0 + (-J[1] / det) * r1
+        d1 = (-J[2] / det) * r0 + (J[0] / det) * r1
+
+        if d0 * d0 + d1 * d1 < threshold:
+            break
+
+        p[0] = p[0] + d0
+        p[1] = p[1] + d1
+    out[0] = p[0]
+    out[1] = p[1]
+    return 0
+
+
 def radtan_undistort(cnp.ndarray[cnp.double_t, ndim=2] keypoints,
                      cnp.ndarray[cnp.double_t, ndim=1] dist_coeffs,
                      int max_iter, float threshold):
+    cdef double[:, ::1] ps
+    cdef double *coeffs
+    cdef Py_ssize_t i
 
     keypoints = np.ascontiguousarray(keypoints, dtype=np.float64)
+    dist_coeffs = np.ascontiguousarray(dist_coeffs, dtype=np.float64)
+    ps = keypoints
+    coeffs = &dist_coeffs[0]
 
-    for i in range(keypoints.shape[0]):
-        keypoints[i] = undistort_(keypoints[i], dist_coeffs, max_iter, threshold)
+    with nogil:
+        for i in range(ps.shape[0]):
+            undistort_point(coeffs, &ps[i, 0], &ps[i, 0], max_iter, threshold)
     return keypoints
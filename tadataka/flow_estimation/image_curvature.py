@@ -2,7 +2,7 @@ import numpy as np
 from skimage import data
 from skimage.color import rgb2gray
 
-from tadataka.gradient import grad_x, grad_y
+from tadataka.gradient import sobel
 
 
 # it is very hard to test 'compute_image_curvature'
@@ -16,13 +16,9 @@ def compute_curvature(fx, fy, fxx, fxy, fyx, fyy):
 def compute_image_curvature(image):
     assert(np.ndim(image) == 2)
 
-    gx = grad_x(image)
-    gy = grad_y(image)
-
-    gxx = grad_x(gx)
-    gxy = grad_y(gx)
-    gyx = grad_x(gy)
-    gyy = grad_y(gy)
+    gx, gy = sobel(image)
+    gxx, gxy = sobel(gx)
+    gyx, gyy = sobel(gy)
 
     return compute_curvature(gx, gy, gxx, gxy, gyx, gyy)
 
@@ -1,12 +1,35 @@
+import numpy as np
 from scipy import ndimage
 
+try:
+    from rust_bindings import gradient as _gradient
+except ImportError:
+    _gradient = None
+
 
 sobel_mode = "reflect"
 
 
+def sobel(image, scale=1.0):
+    """
+    Sobel derivatives (GX, GY) of a 2D image computed together in one pass.
+    Pixels outside the image are the nearest edge pixels ("reflect" mode)
+    and the results are multiplied by 'scale'.
+    Use this rather than grad_x and grad_y if both derivatives are needed
+    """
+    image = np.asarray(image, dtype=np.float64)
+    assert(image.ndim == 2)
+    if _gradient is not None:
+        return _gradient.sobel(image, scale)
+    return scale * grad_x(image), scale * grad_y(image)
+
+
+# grad_x and grad_y run the separable filter along one axis only
 def grad_x(image):
+    image = np.asarray(image, dtype=np.float64)
     return ndimage.sobel(image, axis=1, mode=sobel_mode)
 
 
 def grad_y(image):
+    image = np.asarray(image, dtype=np.float64)
     return ndimage.sobel(image, axis=0, mode=sobel_mode)
@@ -1,12 +1,15 @@
 import numpy as np
 
 from tadataka.decorator import allow_1d
-from tadataka.utils import is_in_image_range
+from tadataka.utils import float_dtype, is_in_image_range
 from rust_bindings import interpolation as _interpolation
 
 
 @allow_1d(which_argument=1)
 def interpolation_(image, C):
+    if float_dtype(image) == np.float32:
+        C = C.astype(np.float32, copy=False)
+        return _interpolation.interpolation_f32(image, C)
     return _interpolation.interpolation(image, C)
 
 
@@ -15,6 +18,7 @@ def interpolation(image, C):
     Args:
         image (np.ndarary): gray scale image
         coordinates (np.ndarray): coordinates of shape (n_coordinates, 2)
+    The result is float32 if the image is float32
     """
 
     if not np.ndim(image) == 2:
@@ -2,11 +2,10 @@ import warnings
 
 import numpy as np
 
-from scipy.spatial.transform import Rotation
 from sparseba import SBA, can_run_ba
 
 from tadataka.rigid_transform import transform
-from tadataka.pose import Pose
+from tadataka.pose import PoseArray
 from tadataka.transform_project import (pose_jacobian, point_jacobian,
                                         transform_project)
 
@@ -139,16 +138,15 @@ def run_ba(viewpoint_indices, point_indices,
     ba = LocalBundleAdjustment(viewpoint_indices, point_indices,
                                keypoints_true)
 
-    rotvecs = np.array([p.rotation.as_rotvec() for p in poses])
-    ts = np.array([p.t for p in poses])
+    poses = PoseArray.from_poses(poses)
+    rotvecs, ts = poses.rotvecs(), poses.t
 
     rotvecs, ts, points = ba.compute(rotvecs, ts, points,
                                      absolute_error_threshold=1e-9,
                                      max_iter=5,
                                      relative_error_threshold=0.20)
 
-    rotations = [Rotation.from_rotvec(rotvec) for rotvec in rotvecs]
-    poses = [Pose(r, t) for r, t in zip(rotations, ts)]
+    poses = list(PoseArray.from_rotvecs(rotvecs, ts))
     return poses, points
 
 
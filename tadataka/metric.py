@@ -1,11 +1,15 @@
 import numpy as np
 from tadataka.interpolation import interpolation
-from tadataka.warp import LocalWarp2D
+from tadataka.warp import LocalWarp2D, warp2d_
+from tadataka.backprojection import BackProjection
 from tadataka.coordinates import image_coordinates, get
 from tadataka.utils import is_in_image_range
 
 
 def calc_error_(v1, v2):
+    if len(v1) == 0:
+        # no point is warped into the image
+        return np.nan
     d = v1 - v2
     return np.mean(d * d)
 
@@ -28,12 +32,31 @@ def photometric_error(warp, gray_image0, depth_map0, gray_image1):
 
 
 class PhotometricError(object):
-    def __init__(self, camera_model0, camera_model1, I0, D0, I1):
+    def __init__(self, camera_model0, camera_model1, I0, D0, I1,
+                 backprojection0=None):
+        """
+        backprojection0: BackProjection of (camera_model0, D0).
+                         Computed here if not given
+        """
+        if backprojection0 is None:
+            backprojection0 = BackProjection(camera_model0, D0)
+        assert(backprojection0.shape == I0.shape == D0.shape)
+
         self.camera_model0 = camera_model0
         self.camera_model1 = camera_model1
         self.I0, self.D0, self.I1 = I0, D0, I1
+        self.backprojection0 = backprojection0
+        self.intensities0 = I0.flatten()
 
     def __call__(self, pose10):
         # warp points in t0 coordinate onto the t1 coordinate
-        warp10 = LocalWarp2D(self.camera_model0, self.camera_model1, pose10)
-        return photometric_error(warp10, self.I0, self.D0, self.I1)
+        # reusing the normalized coordinates of I0
+        xs1, _ = warp2d_(pose10.T, self.backprojection0.xs,
+                         self.backprojection0.depths)
+        us1 = self.camera_model1.unnormalize(xs1)
+
+        mask = is_in_image_range(us1, self.I1.shape)
+
+        i0 = self.intensities0[mask]
+        i1 = interpolation(self.I1, us1[mask])
+        return calc_error_(i0, i1)
@@ -12,7 +12,8 @@ from tadataka.exceptions import NotEnoughInliersException
 from tadataka.matrix import (estimate_fundamental, decompose_essential,
                              motion_matrix)
 from tadataka.so3 import exp_so3, log_so3
-from tadataka.se3 import exp_se3_t_
+from tadataka.se3 import exp_se3, exp_se3_t_, log_se3
+from tadataka.rigid_transform import transform_all, transform_each
 from tadataka.triangulation import linear_triangulation
 
 
@@ -22,9 +23,34 @@ class Pose(object):
         self.rotation = rotation  # SciPy's Rotation object
         self.t = translation
 
+    @classmethod
+    def from_matrix(cls, R, t):
+        """
+        Make a pose from a rotation matrix without converting it to
+        SciPy's Rotation. The conversion is deferred until 'rotation' is
+        accessed, so this is cheap enough to view an element of PoseArray
+        """
+        pose = cls.__new__(cls)
+        pose._rotation, pose._R = None, R
+        pose.t = t
+        return pose
+
+    @property
+    def rotation(self):
+        if self._rotation is None:
+            self._rotation = Rotation.from_matrix(self._R)
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        self._rotation = rotation
+        self._R = None  # invalidate the cached rotation matrix
+
     @property
     def R(self):
-        return self.rotation.as_matrix()
+        if self._R is None:
+            self._R = self._rotation.as_matrix()
+        return self._R
 
     @property
     def T(self):
@@ -49,6 +75,8 @@ class Pose(object):
         return Pose(*convert_coordinate(self.rotation, self.t))
 
     def __mul__(self, other):
+        if not isinstance(other, Pose):
+            return NotImplemented
         return Pose(self.rotation * other.rotation,
                     np.dot(self.R, other.t) + self.t)
 
@@ -59,6 +87,129 @@ class Pose(object):
                 np.isclose(self.t, other.t).all())
 
 
+class PoseArray(object):
+    """
+    Set of poses backed by contiguous arrays.
+    Rotations are held as matrices of shape (N, 3, 3) and
+    translations as vectors of shape (N, 3).
+    Each operation is applied to all poses at once.
+    """
+
+    def __init__(self, rotations, translations):
+        assert(rotations.shape[1:3] == (3, 3))
+        assert(translations.shape[1] == 3)
+        assert(rotations.shape[0] == translations.shape[0])
+        self.R = np.ascontiguousarray(rotations, dtype=np.float64)
+        self.t = np.ascontiguousarray(translations, dtype=np.float64)
+
+    @classmethod
+    def identity(cls, n_poses):
+        R = np.tile(np.identity(3), (n_poses, 1, 1))
+        return PoseArray(R, np.zeros((n_poses, 3)))
+
+    @classmethod
+    def from_poses(cls, poses):
+        R = np.array([pose.R for pose in poses], dtype=np.float64)
+        t = np.array([pose.t for pose in poses], dtype=np.float64)
+        return PoseArray(R.reshape(-1, 3, 3), t.reshape(-1, 3))
+
+    @classmethod
+    def from_rotvecs(cls, rotvecs, translations):
+        R = Rotation.from_rotvec(rotvecs).as_matrix()
+        return PoseArray(R.reshape(-1, 3, 3), translations)
+
+    @classmethod
+    def from_quaternions(cls, quaternions, translations):
+        """
+        quaternions: (N, 4) array in the scalar-last (x, y, z, w) format
+        """
+        R = Rotation.from_quat(quaternions).as_matrix()
+        return PoseArray(R.reshape(-1, 3, 3), translations)
+
+    @classmethod
+    def from_matrices(cls, T):
+        """
+        T: (N, 4, 4) array of rigid transformation matrices
+        """
+        assert(T.shape[1:3] == (4, 4))
+        return PoseArray(T[:, 0:3, 0:3], T[:, 0:3, 3])
+
+    @classmethod
+    def from_se3(cls, xis):
+        return PoseArray.from_matrices(exp_se3(np.reshape(xis, (-1, 6))))
+
+    @property
+    def T(self):
+        n = len(self)
+        T = np.zeros((n, 4, 4))
+        T[:, 0:3, 0:3] = self.R
+        T[:, 0:3, 3] = self.t
+        T[:, 3, 3] = 1
+        return T
+
+    def rotvecs(self):
+        return Rotation.from_matrix(self.R).as_rotvec().reshape(-1, 3)
+
+    def quaternions(self):
+        return Rotation.from_matrix(self.R).as_quat().reshape(-1, 4)
+
+    def log_se3(self):
+        return log_se3(self.T)
+
+    def __len__(self):
+        return self.R.shape[0]
+
+    def __getitem__(self, index):
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            # the returned pose shares the memory with this array
+            return Pose.from_matrix(self.R[index], self.t[index])
+        return PoseArray(self.R[index], self.t[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def inv(self):
+        RT = np.swapaxes(self.R, 1, 2)
+        return PoseArray(RT, -np.einsum('ijk,ik->ij', RT, self.t))
+
+    def __mul__(self, other):
+        """
+        Compose poses element-wise. Either side may be a single pose,
+        which is broadcasted to all poses of the other side
+        """
+        if isinstance(other, Pose):
+            other = PoseArray.from_poses([other])
+        if not isinstance(other, PoseArray):
+            return NotImplemented
+        R = np.matmul(self.R, other.R)
+        t = np.matmul(self.R, other.t[..., np.newaxis])[..., 0] + self.t
+        return PoseArray(R, t)
+
+    def __rmul__(self, other):
+        if isinstance(other, Pose):
+            return PoseArray.from_poses([other]) * self
+        return NotImplemented
+
+    def relative(self, other):
+        """
+        Relative poses between two sets of poses, which is equivalent to
+        [a.inv() * b for a, b in zip(self, other)]
+        """
+        return self.inv() * other
+
+    def transform_each(self, points):
+        """Transform the i-th point by the i-th pose"""
+        return transform_each(self.R, self.t, points)
+
+    def transform_all(self, points):
+        """
+        Transform all points by each pose.
+        Returns an array of shape (n_poses, n_points, 3)
+        """
+        return transform_all(self.R, self.t, points)
+
+
 def convert_coordinate(rotation, t):
     inv_rotation = rotation.inv()
     return inv_rotation, -np.dot(inv_rotation.as_matrix(), t)
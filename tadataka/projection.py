@@ -1,6 +1,7 @@
 import numpy as np
 
 from tadataka.matrix import to_homogeneous
+from tadataka.utils import float_dtype
 from rust_bindings import projection
 
 
@@ -11,6 +12,11 @@ def pi(P):
     """
     Project 3D points onto normalized image plane
     """
+    if float_dtype(P) == np.float32:
+        if P.ndim == 1:
+            return projection.project_vecs_f32(P.reshape(1, -1))[0]
+        return projection.project_vecs_f32(P)
+
     if P.ndim == 1:
         return projection.project_vec(P)
     return projection.project_vecs(P)
@@ -20,6 +26,13 @@ def inv_pi(xs, depths):
     """
     Inverse projection from normalized image plane to 3D
     """
+    if float_dtype(xs) == np.float32:
+        depths = np.asarray(depths, dtype=np.float32)
+        if xs.ndim == 1:
+            return projection.inv_project_vecs_f32(
+                xs.reshape(1, -1), depths.reshape(1))[0]
+        return projection.inv_project_vecs_f32(xs, depths)
+
     if xs.ndim == 1:
         return projection.inv_project_vec(xs, depths)
     return projection.inv_project_vecs(xs, depths)
@@ -1,9 +1,14 @@
 import numpy as np
-from tadataka.so3 import exp_so3, log_so3, tangent_so3
+from tadataka.so3 import (exp_so3, log_so3, tangent_so3, masked,
+                          left_jacobian_so3, inv_left_jacobian_so3)
 
 
 EPSILON = 1e-16
 
+# Coefficients of 'Q' below lose precision faster than those of SO(3)
+# so the Taylor expansions are used in a wider range
+SMALL_ANGLE = 1e-1
+
 
 def normalize(omega):
     theta = np.linalg.norm(omega)
@@ -13,55 +18,112 @@ def normalize(omega):
 
 
 def exp_se3_t_(xi):
-    v, rotvec = xi[:3], xi[3:]
-
-    # NOTE K is computed from the normalized rotvec
-    omega, theta = normalize(rotvec)
-    K = tangent_so3(omega)
-
-    I = np.eye(3)
-
-    if theta < EPSILON:  # theta = norm(omega) >= 0
-        V = I + K * theta / 2 + np.dot(K, K) * pow(theta, 2) / 6
-    else:
-        V = (I + (1 - np.cos(theta)) / theta * K +
-             (theta - np.sin(theta)) / theta * np.dot(K, K))
-    return np.dot(V, v)
+    """
+    Translation part of exp_se3(xi).
+    xi: se3 elements of shape (6,) or (N, 6)
+    """
+    xi = np.asarray(xi, dtype=np.float64)
+    v, rotvec = xi[..., :3], xi[..., 3:]
+    # V = I + (1 - cos(theta)) / theta^2 * K + (theta - sin(theta)) / theta^3 * K^2
+    # which is identical to the left Jacobian of SO(3)
+    V = left_jacobian_so3(rotvec)
+    return np.einsum('...ij,...j->...i', V, v)
 
 
 def exp_se3(xi):
-    rotvec = xi[3:]
-
-    G = np.empty((4, 4))
-    G[0:3, 0:3] = exp_so3(rotvec)
-    G[0:3, 3] = exp_se3_t_(xi)
-    G[3, 0:3] = 0
-    G[3, 3] = 1
+    """
+    xi: se3 elements of shape (6,) or (N, 6)
+    Returns transformation matrices of shape (4, 4) or (N, 4, 4)
+    """
+    xi = np.asarray(xi, dtype=np.float64)
+    rotvec = xi[..., 3:]
+
+    G = np.zeros(xi.shape[:-1] + (4, 4))
+    G[..., 0:3, 0:3] = exp_so3(rotvec)
+    G[..., 0:3, 3] = exp_se3_t_(xi)
+    G[..., 3, 3] = 1
     return G
 
 
 def log_se3(G):
+    """
+    Inverse of 'exp_se3'.
+    G: transformation matrices of shape (4, 4) or (N, 4, 4)
+    Returns se3 elements of shape (6,) or (N, 6)
+    """
     # Gallier, Jean, and Dianna Xu. "Computing exponentials of skew-symmetric
     # matrices and logarithms of orthogonal matrices." International Journal of
     # Robotics and Automation 18.1 (2003): 10-20.
 
-    R = G[0:3, 0:3]
-    t = G[0:3, 3]
+    G = np.asarray(G, dtype=np.float64)
+    R = G[..., 0:3, 0:3]
+    t = G[..., 0:3, 3]
 
     rotvec = log_so3(R)
-    omega, theta = normalize(rotvec)
-
-    if theta == 0:
-        # v == t if theta == 0
-        return np.concatenate((t, omega * theta))
-
-    K = tangent_so3(omega)
-    I = np.eye(3)
-    alpha = -theta / 2
-    beta = 1 - theta * np.sin(theta) / (2 * (1 - np.cos(theta)))
-    V_inv = I + alpha * K + beta * np.dot(K, K)
-    v = V_inv.dot(t)
-    return np.concatenate((v, omega * theta))
+    V_inv = inv_left_jacobian_so3(rotvec)
+    v = np.einsum('...ij,...j->...i', V_inv, t)
+    return np.concatenate((v, rotvec), axis=-1)
+
+
+def _calc_q(xi):
+    # Barfoot, Timothy D., and Paul T. Furgale.
+    # "Associating uncertainty with three-dimensional poses for use in
+    # estimation problems." IEEE Transactions on Robotics 30.3 (2014): 679-693.
+    v, rotvec = xi[..., :3], xi[..., 3:]
+    theta = np.linalg.norm(rotvec, axis=-1)
+
+    V = tangent_so3(v)
+    W = tangent_so3(rotvec)
+    WV = np.matmul(W, V)
+    VW = np.matmul(V, W)
+    WW = np.matmul(W, W)
+    WVW = np.matmul(WV, W)
+
+    # (theta - sin(theta)) / theta^3
+    a = masked(theta, SMALL_ANGLE,
+               lambda t: (t - np.sin(t)) / t**3,
+               lambda t: 1 / 6 - t**2 / 120 + t**4 / 5040)
+    # (theta^2 + 2 * cos(theta) - 2) / (2 * theta^4)
+    b = masked(theta, SMALL_ANGLE,
+               lambda t: (t**2 + 2 * np.cos(t) - 2) / (2 * t**4),
+               lambda t: 1 / 24 - t**2 / 720 + t**4 / 40320)
+    # (2 * theta - 3 * sin(theta) + theta * cos(theta)) / (2 * theta^5)
+    c = masked(theta, SMALL_ANGLE,
+               lambda t: (2 * t - 3 * np.sin(t) + t * np.cos(t)) / (2 * t**5),
+               lambda t: 1 / 120 - t**2 / 2520 + t**4 / 120960)
+
+    a = a[..., np.newaxis, np.newaxis]
+    b = b[..., np.newaxis, np.newaxis]
+    c = c[..., np.newaxis, np.newaxis]
+    return (V / 2 +
+            a * (WV + VW + WVW) +
+            b * (np.matmul(W, WV) + np.matmul(VW, W) - 3 * WVW) +
+            c * (np.matmul(WVW, W) + np.matmul(W, WVW)))
+
+
+def left_jacobian_se3(xi):
+    """
+    Left Jacobian of SE(3) which satisfies
+    exp_se3(xi + dxi) ~ exp_se3(J_l * dxi) * exp_se3(xi)
+    xi: se3 elements of shape (6,) or (N, 6)
+    Returns matrices of shape (6, 6) or (N, 6, 6)
+    """
+    xi = np.asarray(xi, dtype=np.float64)
+    J = left_jacobian_so3(xi[..., 3:])
+
+    JG = np.zeros(xi.shape[:-1] + (6, 6))
+    JG[..., 0:3, 0:3] = J
+    JG[..., 0:3, 3:6] = _calc_q(xi)
+    JG[..., 3:6, 3:6] = J
+    return JG
+
+
+def right_jacobian_se3(xi):
+    """
+    Right Jacobian of SE(3) which satisfies
+    exp_se3(xi + dxi) ~ exp_se3(xi) * exp_se3(J_r * dxi)
+    """
+    return left_jacobian_se3(-np.asarray(xi))
 
 
 def get_rotation(G):
@@ -1,9 +1,12 @@
 import numpy as np
-from scipy.spatial.transform import Rotation
 
 
 EPSILON = 1e-16
 
+# Taylor expansions are used for angles smaller than this value
+# to avoid catastrophic cancellation
+SMALL_ANGLE = 1e-2
+
 
 def is_rotation_matrix(R):
     assert(R.shape[0] == R.shape[1])
@@ -28,19 +31,145 @@ bases_so3 = np.array([
 def tangent_so3(v):
     """
     v: np.ndarray
-        se3 elements
+        se3 elements of shape (3,) or (N, 3)
     """
     #
     #        [0  0   0]            [ 0  0  1]            [0  -1  0]
     # v[0] * [0  0  -1]  +  v[1] * [ 0  0  0]  +  v[2] * [1   0  0]
     #        [0  1   0]            [-1  0  0]            [0   0  0]
 
-    return np.einsum('jkl,j->kl', bases_so3, v)
+    return np.einsum('jkl,...j->...kl', bases_so3, v)
+
+
+def vee_so3(K):
+    """Inverse of 'tangent_so3'"""
+    return np.stack((K[..., 2, 1], K[..., 0, 2], K[..., 1, 0]), axis=-1)
+
+
+def masked(theta, threshold, exact, taylor):
+    """
+    Evaluate 'exact(theta)' where theta >= threshold and
+    'taylor(theta)' elsewhere.
+    Small angles are replaced by the threshold before calling 'exact'
+    so that 'exact' never divides by zero.
+    """
+    small = theta < threshold
+    return np.where(small, taylor(theta),
+                    exact(np.where(small, threshold, theta)))
+
+
+def sinc_(theta):
+    # sin(theta) / theta
+    return masked(theta, SMALL_ANGLE,
+                  lambda t: np.sin(t) / t,
+                  lambda t: 1 - t**2 / 6 + t**4 / 120)
+
+
+def cosc_(theta):
+    # (1 - cos(theta)) / theta^2
+    return masked(theta, SMALL_ANGLE,
+                  lambda t: (1 - np.cos(t)) / t**2,
+                  lambda t: 1 / 2 - t**2 / 24 + t**4 / 720)
+
+
+def sinc3_(theta):
+    # (theta - sin(theta)) / theta^3
+    return masked(theta, SMALL_ANGLE,
+                  lambda t: (t - np.sin(t)) / t**3,
+                  lambda t: 1 / 6 - t**2 / 120 + t**4 / 5040)
+
+
+def _quadratic(a, K, b, KK):
+    # I + a * K + b * K^2 where a and b are broadcasted over matrices
+    I = np.identity(3)
+    return I + a[..., np.newaxis, np.newaxis] * K + \
+        b[..., np.newaxis, np.newaxis] * KK
 
 
 def exp_so3(rotvec):
-    return Rotation.from_rotvec(rotvec).as_matrix()
+    """
+    Rodrigues' formula.
+    rotvec: rotation vector of shape (3,) or (N, 3)
+    Returns rotation matrices of shape (3, 3) or (N, 3, 3)
+    """
+    rotvec = np.asarray(rotvec, dtype=np.float64)
+    theta = np.linalg.norm(rotvec, axis=-1)
+    K = tangent_so3(rotvec)
+    return _quadratic(sinc_(theta), K, cosc_(theta), np.matmul(K, K))
+
+
+def _log_so3_near_pi(R, cos):
+    # sin(theta) ~ 0 so the skew-symmetric part of R cannot determine
+    # the axis. Recover it from the symmetric part instead
+    #    (R + R^T) / 2 = cos(theta) * I + (1 - cos(theta)) * n * n^T
+    I = np.identity(3)
+    S = (R + np.swapaxes(R, -1, -2)) / 2
+    c = cos[..., np.newaxis, np.newaxis]
+    N = (S - c * I) / (1 - c)  # n * n^T
+
+    # use the column of the largest diagonal element for stability
+    diagonal = np.diagonal(N, axis1=-2, axis2=-1)
+    k = np.argmax(diagonal, axis=-1)[..., np.newaxis]
+    nk = np.sqrt(np.take_along_axis(diagonal, k, axis=-1))
+    column = np.take_along_axis(N, k[..., np.newaxis], axis=-1)[..., 0]
+    n = column / np.maximum(nk, EPSILON)
+
+    # the skew-symmetric part still tells the sign of the axis
+    sign = np.sign(np.sum(n * vee_so3(R - np.swapaxes(R, -1, -2)), axis=-1))
+    return np.where(sign < 0, -1, 1)[..., np.newaxis] * n
 
 
 def log_so3(R):
-    return Rotation.from_matrix(R).as_rotvec()
+    """
+    Inverse of 'exp_so3'.
+    R: rotation matrices of shape (3, 3) or (N, 3, 3)
+    Returns rotation vectors of shape (3,) or (N, 3)
+    """
+    R = np.asarray(R, dtype=np.float64)
+    w = vee_so3(R - np.swapaxes(R, -1, -2)) / 2  # sin(theta) * n
+    sin = np.linalg.norm(w, axis=-1)
+    cos = (np.trace(R, axis1=-2, axis2=-1) - 1) / 2
+    theta = np.arctan2(sin, cos)
+
+    # theta / sin(theta)
+    factor = masked(theta, SMALL_ANGLE,
+                    lambda t: t / np.sin(t),
+                    lambda t: 1 + t**2 / 6 + 7 * t**4 / 360)
+    near_pi = (np.pi - theta) < SMALL_ANGLE
+    # the near pi branch divides by (1 - cos(theta)), which is ~ 2 there
+    c = np.where(near_pi, cos, -1)
+    return np.where(near_pi[..., np.newaxis],
+                    theta[..., np.newaxis] * _log_so3_near_pi(R, c),
+                    factor[..., np.newaxis] * w)
+
+
+def left_jacobian_so3(rotvec):
+    """
+    Left Jacobian of SO(3)
+    J_l = I + (1 - cos(theta)) / theta^2 * K
+            + (theta - sin(theta)) / theta^3 * K^2
+    where K = tangent_so3(rotvec) and theta = norm(rotvec)
+    """
+    rotvec = np.asarray(rotvec, dtype=np.float64)
+    theta = np.linalg.norm(rotvec, axis=-1)
+    K = tangent_so3(rotvec)
+    return _quadratic(cosc_(theta), K, sinc3_(theta), np.matmul(K, K))
+
+
+def inv_left_jacobian_so3(rotvec):
+    rotvec = np.asarray(rotvec, dtype=np.float64)
+    theta = np.linalg.norm(rotvec, axis=-1)
+    K = tangent_so3(rotvec)
+    # 1 / theta^2 - (1 + cos(theta)) / (2 * theta * sin(theta))
+    b = masked(theta, SMALL_ANGLE,
+               lambda t: 1 / t**2 - (1 + np.cos(t)) / (2 * t * np.sin(t)),
+               lambda t: 1 / 12 + t**2 / 720 + t**4 / 30240)
+    return _quadratic(-0.5 * np.ones(theta.shape), K, b, np.matmul(K, K))
+
+
+def right_jacobian_so3(rotvec):
+    return left_jacobian_so3(-np.asarray(rotvec))
+
+
+def inv_right_jacobian_so3(rotvec):
+    return inv_left_jacobian_so3(-np.asarray(rotvec))
@@ -24,6 +24,17 @@ def merge_dicts(*dicts):
     return merged
 
 
+def float_dtype(array):
+    """
+    np.float32 if 'array' is single precision, otherwise np.float64.
+    Arguments of native functions are cast to the dtype of
+    the main array so that float32 inputs are not upcast silently
+    """
+    if np.asarray(array).dtype == np.float32:
+        return np.float32
+    return np.float64
+
+
 def round_int(X):
     return np.round(X, 0).astype(np.int64)
 
@@ -1 +1,2 @@
 from tadataka.vo.feature_based import FeatureBasedVO
+from tadataka.vo.semi_dense import SemiDenseVO
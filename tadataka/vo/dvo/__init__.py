@@ -1,5 +1,7 @@
 import sys
 import warnings
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from numpy.linalg import norm
@@ -7,21 +9,31 @@ from numpy.linalg import norm
 from skimage.transform import rescale
 from skimage.color import rgb2gray
 
-from tadataka import camera
 from tadataka.metric import PhotometricError
-from tadataka.coordinates import image_coordinates
-from tadataka.math import solve_linear_equation
-from tadataka.utils import is_in_image_range
-from tadataka.projection import inv_pi, pi
+from tadataka.backprojection import BackProjection
+from tadataka.coordinates import get
+from tadataka.utils import float_dtype, is_in_image_range
+from tadataka.projection import pi
 from tadataka.camera import CameraModel, CameraParameters
+from tadataka.camera.distortion import NoDistortion
 from tadataka.rigid_transform import transform
 from tadataka.interpolation import interpolation
 from tadataka.vo.dvo.jacobian import calc_image_gradient, calc_jacobian
+from tadataka.vo.dvo.pyramid import (ImagePyramid, ImagePyramidCache,
+                                     level_to_scale)
+from tadataka.vo.dvo.selection import PixelSelector
+from tadataka.vo.dvo.motion import (ConstantVelocityModel, predicted_motion,
+                                    initial_hypotheses)
 from tadataka.pose import Pose
 from tadataka.robust.weights import (compute_weights_huber,
                                      compute_weights_student_t,
                                      compute_weights_tukey)
 
+try:
+    from rust_bindings import dvo as _dvo
+except ImportError:
+    _dvo = None
+
 
 def calc_error(r, weights=None):
     if weights is None:
@@ -29,6 +41,12 @@ def calc_error(r, weights=None):
     return np.dot(r * weights, r)  # r * W * r
 
 
+def calc_hessian(J, weights=None):
+    if weights is None:
+        return np.dot(J.T, J)
+    return np.dot(J.T * weights, J)  # J^T * W * J
+
+
 def compute_weights(name, residuals):
     if name == "tukey":
         return compute_weights_tukey(residuals)
@@ -39,65 +57,142 @@ def compute_weights(name, residuals):
     raise ValueError(f"No such weights '{name}'")
 
 
-def level_to_scale(level, layer_size_ratio):
-    return 1 / pow(layer_size_ratio, level)
-
+def calc_normal_equation_(camera_model1, pose10, P0, intensities0,
+                           I1, gradient1, weights):
+    GX1, GY1 = gradient1
+    assert(GX1.shape == GY1.shape == I1.shape)
 
-def calc_pose_update(camera_model1, residuals, GX1, GY1, P1, weights):
-    assert(GX1.shape == GY1.shape)
+    dtype = P0.dtype
+    P1 = transform(pose10.R.astype(dtype), pose10.t.astype(dtype), P0)
     us1 = camera_model1.unnormalize(pi(P1))
-    mask = is_in_image_range(us1, GX1.shape) & (P1[:, 2] > 0)
+    mask = is_in_image_range(us1, I1.shape) & (P1[:, 2] > 0)
 
     if not np.any(mask):
         # warped coordinates are out of image range
-        return None
-
-    r = residuals[mask]
-    p1 = P1[mask]
-    gx1 = interpolation(GX1, us1[mask])
-    gy1 = interpolation(GY1, us1[mask])
+        return np.zeros((6, 6)), np.zeros(6), 0., 0
 
+    r = intensities0[mask] - interpolation(I1, us1[mask])
     J = calc_jacobian(camera_model1.camera_parameters.focal_length,
-                      gx1, gy1, p1)
+                      interpolation(GX1, us1[mask]),
+                      interpolation(GY1, us1[mask]),
+                      P1[mask])
 
-    if weights is None:
-        return solve_linear_equation(J, r)
     if isinstance(weights, str):
         weights = compute_weights(weights, r)
-        return solve_linear_equation(J, r, weights)
+    elif weights is not None:
+        weights = weights[mask]
+
+    g = np.dot(J.T, r) if weights is None else np.dot(J.T, weights * r)
+    return calc_hessian(J, weights), g, calc_error(r, weights), len(r)
+
+
+def calc_normal_equation(camera_model1, pose10, P0, intensities0,
+                         I1, gradient1, weights=None):
+    """
+    Warps P0 onto the image I1 and returns J^T * W * J, J^T * W * r,
+    r^T * W * r and the number of points warped into the image,
+    where r = I0(u0) - I1(u1).
 
-    weights = weights.flatten()[mask]
-    return solve_linear_equation(J, r, weights)
+    weights can be None, an array of per-point weights or
+    the name of a robust weight function.
+    The native kernel is used when it is available.
+    Robust weights and distorted camera models are computed in NumPy.
+    If I1 is float32, the other arrays are cast to float32 and
+    the single precision kernel is used. The system is accumulated in
+    float64 in both cases.
+    """
+    if (_dvo is None or isinstance(weights, str) or
+            not isinstance(camera_model1.distortion_model, NoDistortion)):
+        return calc_normal_equation_(camera_model1, pose10, P0, intensities0,
+                                     I1, gradient1, weights)
+
+    dtype = float_dtype(I1)
+    normal_equation = (_dvo.normal_equation_f32 if dtype == np.float32
+                       else _dvo.normal_equation)
+
+    def cast(array):
+        return None if array is None else np.asarray(array, dtype=dtype)
+
+    GX1, GY1 = gradient1
+    return normal_equation(
+        pose10.T, cast(P0), cast(intensities0), I1, cast(GX1), cast(GY1),
+        camera_model1.camera_parameters, cast(weights)
+    )
+
+
+# number of iterations run at a pyramid level and the error after them
+LevelStats = namedtuple("LevelStats", ["level", "n_iterations", "error"])
+
+
+def to_pyramid(camera_model, I, D, n_levels, layer_size_ratio,
+               dtype=np.float64):
+    if not isinstance(I, ImagePyramid):
+        return ImagePyramid(camera_model, I, D, n_levels, layer_size_ratio,
+                            dtype)
+
+    assert(len(I) >= n_levels)
+    assert(I.layer_size_ratio == layer_size_ratio)
+    if D is not None and not I.has_depth_map:
+        I.set_depth_map(D)
+    return I
 
 
 class _PoseChangeEstimator(object):
-    def __init__(self, camera_model0, camera_model1, max_iter):
+    def __init__(self, camera_model0, camera_model1, max_iter,
+                 min_update_norm=0., min_relative_decrease=0.,
+                 warn_out_of_image=True):
         self.camera_model0 = camera_model0
         self.camera_model1 = camera_model1
         self.max_iter = max_iter
-
-    def __call__(self, I0, D0, I1, pose10, weights=None):
+        self.min_update_norm = min_update_norm
+        self.min_relative_decrease = min_relative_decrease
+        self.warn_out_of_image = warn_out_of_image
+
+    def __call__(self, I0, D0, I1, pose10, weights=None, gradient1=None,
+                 indices0=None, backprojection0=None):
+        """
+        indices0: flat indices of the pixels in I0 to be used.
+                  All pixels are used if not given
+        backprojection0: BackProjection of (camera_model0, D0).
+                         Computed here if not given
+        Returns the estimated pose, the number of iterations and the error
+        """
         def warn():
-            warnings.warn("Camera pose change is too large.", RuntimeWarning)
+            if self.warn_out_of_image:
+                warnings.warn("Camera pose change is too large.",
+                              RuntimeWarning)
+
+        if backprojection0 is None:
+            backprojection0 = BackProjection(self.camera_model0, D0)
 
         error = PhotometricError(self.camera_model0, self.camera_model1,
-                                 I0, D0, I1)
+                                 I0, D0, I1, backprojection0)
+
+        P0 = backprojection0.P
+        intensities0 = I0.flatten()
+        if isinstance(weights, np.ndarray):
+            weights = weights.flatten()
+        if indices0 is not None:
+            P0 = P0[indices0]
+            intensities0 = intensities0[indices0]
+            if isinstance(weights, np.ndarray):
+                weights = weights[indices0]
 
-        us0 = image_coordinates(I0.shape)
-        xs0 = self.camera_model0.normalize(us0)
-        P0 = inv_pi(xs0, D0.flatten())
-        GX1, GY1 = calc_image_gradient(I1)
-        residuals = (I0 - I1).flatten()
+        if gradient1 is None:
+            gradient1 = calc_image_gradient(I1)
 
         prev_error = error(pose10)
+        n_iterations = 0
         for k in range(self.max_iter):
-            P1 = transform(pose10.R, pose10.t, P0)
-
-            xi = calc_pose_update(self.camera_model1, residuals,
-                                  GX1, GY1, P1, weights)
-            if xi is None:
+            H, g, _, count = calc_normal_equation(
+                self.camera_model1, pose10, P0, intensities0,
+                I1, gradient1, weights
+            )
+            if count == 0:
                 warn()
-                return pose10
+                break
+
+            xi, _, _, _ = np.linalg.lstsq(H, g, rcond=None)
 
             dpose = Pose.from_se3(xi)
             candidate = dpose * pose10
@@ -105,46 +200,325 @@ class _PoseChangeEstimator(object):
             curr_error = error(candidate)
             if curr_error > prev_error:
                 break
-            prev_error = curr_error
 
-            pose10 = candidate
-        return pose10
+            decrease = 0. if prev_error == 0 else 1 - curr_error / prev_error
+            pose10, prev_error = candidate, curr_error
+            n_iterations = k + 1
+
+            # converged
+            if (norm(xi) < self.min_update_norm or
+                    decrease < self.min_relative_decrease):
+                break
+        return pose10, n_iterations, prev_error
 
 
 class PoseChangeEstimator(object):
     def __init__(self, camera_model0, camera_model1,
                  n_coarse_to_fine=5, max_iter=20,
-                 layer_size_ratio=1.5):
+                 layer_size_ratio=1.5, pixel_selector=None,
+                 min_update_norm=1e-6, min_relative_decrease=1e-4,
+                 motion_model=None, min_level_motion=0.,
+                 multi_hypothesis=False, hypothesis_angle=0.05, n_threads=4,
+                 dtype=np.float64):
+        """
+        pixel_selector: PixelSelector. If given, only the selected pixels
+                        of I0 are used at each level
+        min_update_norm, min_relative_decrease:
+            Iterations at a level stop when the norm of the update or
+            the relative decrease of the error falls below these values
+        motion_model: ConstantVelocityModel or any object that has
+                      'predict' and 'update'. Used for the initial guess
+                      if pose10 is not given
+        min_level_motion:
+            Coarse levels where the image motion predicted from
+            the initial guess is smaller than this value in pixels
+            are skipped
+        multi_hypothesis:
+            If True, the coarsest level is run from several initial poses
+            (see 'initial_hypotheses') concurrently in n_threads threads
+            and the one with the smallest error is refined.
+            hypothesis_angle is the rotation perturbation in radians
+        dtype:
+            dtype of the pyramids built from images.
+            np.float32 halves the memory traffic of warping,
+            interpolation and the normal equation
+        """
         self.n_coarse_to_fine = n_coarse_to_fine
         self.max_iter = max_iter
         self.layer_size_ratio = layer_size_ratio
+        self.pixel_selector = pixel_selector
+        self.min_update_norm = min_update_norm
+        self.min_relative_decrease = min_relative_decrease
+        self.motion_model = motion_model
+        self.min_level_motion = min_level_motion
+        self.multi_hypothesis = multi_hypothesis
+        self.hypothesis_angle = hypothesis_angle
+        self.n_threads = n_threads
+        self.dtype = dtype
 
         self.camera_model0 = camera_model0
         self.camera_model1 = camera_model1
 
-    def __call__(self, I0, D0, I1, weights=None, pose10=Pose.identity()):
-        assert(I0.shape == D0.shape == I1.shape)
-        assert(np.ndim(I0) == 2)
-        assert(np.ndim(D0) == 2)
-        assert(np.ndim(I1) == 2)
+    def __call__(self, I0, D0, I1, weights=None, pose10=None,
+                 return_stats=False):
+        """
+        I0 and I1 can be either gray images or ImagePyramids.
+        D0 can be None if I0 is a pyramid that already holds a depth map.
+        If pose10 is not given, the prediction of the motion model
+        (or identity if there is no motion model) is used as
+        the initial guess.
+        If return_stats is True, LevelStats of the levels that were run
+        are also returned
+        """
+        pyramid0 = to_pyramid(self.camera_model0, I0, D0,
+                              self.n_coarse_to_fine, self.layer_size_ratio,
+                              self.dtype)
+        pyramid1 = to_pyramid(self.camera_model1, I1, None,
+                              self.n_coarse_to_fine, self.layer_size_ratio,
+                              self.dtype)
+        assert(pyramid0.has_depth_map)
+        assert(pyramid0.shape == pyramid1.shape)
+
+        if pose10 is None:
+            pose10 = self._predict()
+
+        motion = predicted_motion(pose10, pyramid0[0].camera_model,
+                                  pyramid0[0].depth_map)
+
+        levels = [
+            level for level in reversed(range(self.n_coarse_to_fine))
+            if level == 0 or motion * level_to_scale(
+                level, self.layer_size_ratio) >= self.min_level_motion
+        ]
+
+        stats = []
+        for i, level in enumerate(levels):
+            args = (level, pyramid0[level], pyramid1[level], weights)
+            if i == 0 and self.multi_hypothesis:
+                pose10, n_iterations, error = self._estimate_from_hypotheses(
+                    initial_hypotheses(pose10, self.hypothesis_angle), *args
+                )
+            else:
+                pose10, n_iterations, error = self._estimate_at(pose10, *args)
+            stats.append(LevelStats(level, n_iterations, error))
+
+        if self.motion_model is not None:
+            self.motion_model.update(pose10)
+
+        if return_stats:
+            return pose10, stats
+        return pose10
 
-        for level in list(reversed(range(self.n_coarse_to_fine))):
-            pose10 = self._estimate_at(pose10, level, I0, D0, I1, weights)
+    def _predict(self):
+        if self.motion_model is None:
+            return Pose.identity()
+        return self.motion_model.predict()
+
+    def _estimate_from_hypotheses(self, priors, level, level0, level1, W0):
+        def estimate(prior):
+            # hypotheses that warp points out of the image are expected
+            return self._estimate_at(prior, level, level0, level1, W0,
+                                     warn_out_of_image=False)
+
+        def error(result):
+            # error is nan if no point is warped into the image
+            _, _, e = result
+            return np.inf if np.isnan(e) else e
+
+        # compute the lazily evaluated members once here
+        # rather than in every thread
+        level0.gradient, level0.backprojection, level1.gradient
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            results = list(executor.map(estimate, priors))
+        return min(results, key=error)
+
+    def _estimate_at(self, prior, level, level0, level1, W0,
+                     warn_out_of_image=True):
+        estimator = _PoseChangeEstimator(
+            level0.camera_model, level1.camera_model,
+            max_iter=self.max_iter,
+            min_update_norm=self.min_update_norm,
+            min_relative_decrease=self.min_relative_decrease,
+            warn_out_of_image=warn_out_of_image
+        )
+
+        if isinstance(W0, np.ndarray):
+            W0 = rescale(W0, level_to_scale(level, self.layer_size_ratio))
+
+        indices0 = None
+        if self.pixel_selector is not None:
+            indices0 = self.pixel_selector(level0.gradient, level0.depth_map)
+
+        return estimator(level0.image, level0.depth_map, level1.image,
+                         prior, W0, level1.gradient, indices0,
+                         level0.backprojection)
+
+
+class _Keyframe(object):
+    # Reference side quantities of the inverse compositional method.
+    # They depend only on the keyframe so they are computed once and
+    # reused for every frame tracked against it
+    def __init__(self, camera_model0, I0, D0, W0=None, gradient0=None,
+                 pixel_selector=None, backprojection0=None):
+        assert(I0.shape == D0.shape)
+
+        if backprojection0 is None:
+            backprojection0 = BackProjection(camera_model0, D0)
 
+        if gradient0 is None:
+            gradient0 = calc_image_gradient(I0)
+        GX0, GY0 = gradient0
+
+        if pixel_selector is None:
+            indices = np.flatnonzero(D0 > 0)
+        else:
+            indices = pixel_selector(gradient0, D0)
+
+        # only the selected pixels are kept from here on
+        us0 = backprojection0.us[indices]
+
+        self.i0 = get(I0, us0)
+        self.P0 = backprojection0.P[indices]
+        self.J = calc_jacobian(camera_model0.camera_parameters.focal_length,
+                               get(GX0, us0), get(GY0, us0), self.P0)
+        self.weights = None if W0 is None else W0.flatten()[indices]
+        self.H = calc_hessian(self.J, self.weights)
+
+    def hessian(self, mask):
+        if mask.all():
+            return self.H
+
+        n_outside = np.sum(~mask)
+        if n_outside > np.sum(mask):
+            return calc_hessian(self.J[mask], self.masked_weights(mask))
+
+        # cheaper to subtract what the points out of the image contribute
+        # than to rebuild the hessian
+        return self.H - calc_hessian(self.J[~mask], self.masked_weights(~mask))
+
+    def masked_weights(self, mask):
+        if self.weights is None:
+            return None
+        return self.weights[mask]
+
+
+class _InverseCompositionalPoseChangeEstimator(object):
+    def __init__(self, keyframe, camera_model1, max_iter):
+        self.keyframe = keyframe
+        self.camera_model1 = camera_model1
+        self.max_iter = max_iter
+
+    def _warp(self, pose10):
+        # keep float32 points in float32
+        dtype = self.keyframe.P0.dtype
+        P1 = transform(pose10.R.astype(dtype), pose10.t.astype(dtype),
+                       self.keyframe.P0)
+        return P1, self.camera_model1.unnormalize(pi(P1))
+
+    def _residuals(self, I1, pose10):
+        P1, us1 = self._warp(pose10)
+        mask = is_in_image_range(us1, I1.shape) & (P1[:, 2] > 0)
+        r = interpolation(I1, us1[mask]) - self.keyframe.i0[mask]
+        return r, mask
+
+    def _calc_update(self, r, mask, weights):
+        J = self.keyframe.J[mask]
+
+        if isinstance(weights, str):
+            # robust weights change every iteration
+            # so the hessian has to be recomputed
+            w = compute_weights(weights, r)
+            H, g = calc_hessian(J, w), np.dot(J.T, w * r)
+        else:
+            w = self.keyframe.masked_weights(mask)
+            H = self.keyframe.hessian(mask)
+            g = np.dot(J.T, r) if w is None else np.dot(J.T, w * r)
+
+        xi, _, _, _ = np.linalg.lstsq(H, g, rcond=None)
+        return xi
+
+    def __call__(self, I1, pose10, weights=None):
+        def warn():
+            warnings.warn("Camera pose change is too large.", RuntimeWarning)
+
+        r, mask = self._residuals(I1, pose10)
+        if not np.any(mask):
+            warn()
+            return pose10
+
+        prev_error = np.mean(r * r)
+        for k in range(self.max_iter):
+            xi = self._calc_update(r, mask, weights)
+
+            # the update is computed on the keyframe side
+            # so it is composed inversely
+            candidate = pose10 * Pose.from_se3(-xi)
+
+            r_, mask_ = self._residuals(I1, candidate)
+            if not np.any(mask_):
+                warn()
+                break
+
+            curr_error = np.mean(r_ * r_)
+            if curr_error > prev_error:
+                break
+
+            pose10, r, mask, prev_error = candidate, r_, mask_, curr_error
         return pose10
 
-    def _estimate_at(self, prior, level, I0, D0, I1, W0):
-        scale = level_to_scale(level, self.layer_size_ratio)
 
-        camera_model0 = camera.resize(self.camera_model0, scale)
-        camera_model1 = camera.resize(self.camera_model1, scale)
-        estimator = _PoseChangeEstimator(camera_model0, camera_model1,
-                                         max_iter=self.max_iter)
+class InverseCompositionalPoseChangeEstimator(object):
+    """
+    Inverse compositional variant of PoseChangeEstimator.
+    Image gradients, 3D points, Jacobians and Hessians of the keyframe
+    are precomputed for each pyramid level so that tracking a frame
+    only needs a warp, an interpolation and a 6-vector accumulation
+    per iteration.
+
+    I0 and I1 can be either gray images or ImagePyramids.
+    weights can be None, an array of the same shape as I0 or
+    the name of a robust weight function.
+    If pixel_selector is given, only the selected pixels of I0 are used.
+    dtype is the dtype of the pyramids built from images
+    """
+    def __init__(self, camera_model0, camera_model1, I0, D0, weights=None,
+                 n_coarse_to_fine=5, max_iter=20, layer_size_ratio=1.5,
+                 pixel_selector=None, dtype=np.float64):
+        pyramid0 = to_pyramid(camera_model0, I0, D0,
+                              n_coarse_to_fine, layer_size_ratio, dtype)
+        assert(pyramid0.has_depth_map)
 
-        D0 = rescale(D0, scale)
-        I0 = rescale(I0, scale)
-        I1 = rescale(I1, scale)
-        if isinstance(W0, np.ndarray):
-            W0 = rescale(W0, scale)
+        self.n_coarse_to_fine = n_coarse_to_fine
+        self.max_iter = max_iter
+        self.layer_size_ratio = layer_size_ratio
+        self.weights = weights
+        self.dtype = dtype
+
+        self.camera_model1 = camera_model1
+
+        W0 = weights if isinstance(weights, np.ndarray) else None
+        self.keyframes = [
+            self._keyframe_at(level, pyramid0[level], W0, pixel_selector)
+            for level in range(self.n_coarse_to_fine)
+        ]
 
-        return estimator(I0, D0, I1, prior, W0)
+    def _keyframe_at(self, level, level0, W0, pixel_selector):
+        if W0 is not None:
+            W0 = rescale(W0, level_to_scale(level, self.layer_size_ratio))
+        return _Keyframe(level0.camera_model, level0.image, level0.depth_map,
+                         W0, level0.gradient, pixel_selector,
+                         level0.backprojection)
+
+    def __call__(self, I1, pose10=Pose.identity()):
+        pyramid1 = to_pyramid(self.camera_model1, I1, None,
+                              self.n_coarse_to_fine, self.layer_size_ratio,
+                              self.dtype)
+
+        for level in list(reversed(range(self.n_coarse_to_fine))):
+            estimator = _InverseCompositionalPoseChangeEstimator(
+                self.keyframes[level], pyramid1[level].camera_model,
+                max_iter=self.max_iter
+            )
+            pose10 = estimator(pyramid1[level].image, pose10, self.weights)
+        return pose10
@@ -1,5 +1,8 @@
 import numpy as np
 
+from tadataka.gradient import sobel
+from tadataka.utils import float_dtype
+
 # Kerl, Christian.
 # "Odometry from rgb-d cameras for autonomous quadrocopters."
 # Master's Thesis, Technical University (2012).
@@ -25,5 +28,10 @@ def calc_jacobian(focal_length, didx, didy, P):
 
 
 def calc_image_gradient(image):
-    DY, DX = np.gradient(image)
-    return DX, DY  # reverse the order
+    """
+    Returns (DX, DY). The Sobel kernel is normalized by 1/8 so that
+    the results approximate the derivatives in pixels
+    """
+    dtype = float_dtype(image)
+    DX, DY = sobel(image, scale=1/8)
+    return DX.astype(dtype, copy=False), DY.astype(dtype, copy=False)
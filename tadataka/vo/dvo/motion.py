@@ -0,0 +1,46 @@
+import numpy as np
+
+from tadataka.pose import Pose
+
+
+class ConstantVelocityModel(object):
+    """
+    Predicts the next pose change from the last one.
+    Assumes that frames are captured at a constant rate
+    and that I0 is the previous frame
+    """
+    def __init__(self):
+        self.pose10 = Pose.identity()
+
+    def predict(self):
+        return self.pose10
+
+    def update(self, pose10):
+        self.pose10 = pose10
+
+
+def predicted_motion(pose10, camera_model, depth_map):
+    """
+    Rough magnitude of the image motion in pixels caused by pose10
+    """
+    depths = depth_map[depth_map > 0]
+    if len(depths) == 0:
+        return np.inf
+
+    focal_length = np.max(camera_model.camera_parameters.focal_length)
+    angle = np.linalg.norm(pose10.rotation.as_rotvec())
+    return focal_length * (np.linalg.norm(pose10.t) / np.median(depths) + angle)
+
+
+def initial_hypotheses(prediction, angle):
+    """
+    Candidates of the initial pose: identity, the prediction and
+    the prediction rotated by +-angle around each axis
+    """
+    hypotheses = [Pose.identity(), prediction]
+    for axis in range(3):
+        for sign in [-1, 1]:
+            xi = np.zeros(6)
+            xi[3 + axis] = sign * angle
+            hypotheses.append(Pose.from_se3(xi) * prediction)
+    return hypotheses
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+
+import numpy as np
+from skimage.transform import rescale
+
+from tadataka import camera
+from tadataka.backprojection import BackProjection
+from tadataka.vo.dvo.jacobian import calc_image_gradient
+
+
+def level_to_scale(level, layer_size_ratio):
+    return 1 / pow(layer_size_ratio, level)
+
+
+class PyramidLevel(object):
+    def __init__(self, camera_model, image, depth_map=None):
+        self.camera_model = camera_model
+        self.image = image
+        self.depth_map = depth_map
+        self._gradient = None
+        self._backprojection = None
+
+    @property
+    def gradient(self):
+        # computed on demand because gradients of a keyframe are not
+        # needed by the forward additive estimator
+        if self._gradient is None:
+            self._gradient = calc_image_gradient(self.image)
+        return self._gradient
+
+    @property
+    def backprojection(self):
+        assert(self.depth_map is not None)
+        if self._backprojection is None:
+            self._backprojection = BackProjection(self.camera_model,
+                                                  self.depth_map)
+        return self._backprojection
+
+    def set_depth_map(self, depth_map):
+        assert(depth_map.shape == self.image.shape)
+        self.depth_map = depth_map
+        self._backprojection = None
+
+
+class ImagePyramid(object):
+    """
+    Scaled camera models, intensities, depths and gradients of a frame.
+    Level 0 holds the original resolution and level k is scaled by
+    1 / layer_size_ratio^k.
+    Images and depth maps are stored as 'dtype'. Pass np.float32 to
+    run the whole estimation in single precision
+    """
+    def __init__(self, camera_model, image, depth_map=None,
+                 n_levels=5, layer_size_ratio=1.5, dtype=np.float64):
+        assert(image.ndim == 2)
+        assert(depth_map is None or depth_map.shape == image.shape)
+
+        self.shape = image.shape
+        self.layer_size_ratio = layer_size_ratio
+        self.dtype = dtype
+        self.levels = []
+        for level in range(n_levels):
+            scale = level_to_scale(level, layer_size_ratio)
+            self.levels.append(
+                PyramidLevel(camera.resize(camera_model, scale),
+                             self._rescale(image, scale))
+            )
+
+        self.has_depth_map = False
+        if depth_map is not None:
+            self.set_depth_map(depth_map)
+
+    def set_depth_map(self, depth_map):
+        assert(depth_map.shape == self.shape)
+        for level, pyramid_level in enumerate(self.levels):
+            scale = level_to_scale(level, self.layer_size_ratio)
+            pyramid_level.set_depth_map(self._rescale(depth_map, scale))
+        self.has_depth_map = True
+
+    def _rescale(self, image, scale):
+        # 'rescale' always returns float64
+        return rescale(image, scale).astype(self.dtype, copy=False)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, level):
+        return self.levels[level]
+
+
+class ImagePyramidCache(object):
+    """
+    Keeps pyramids of the most recently used frames so that a frame
+    tracked as I1 is not rescaled again when it becomes I0
+    """
+    def __init__(self, n_levels=5, layer_size_ratio=1.5, maxsize=4,
+                 dtype=np.float64):
+        assert(maxsize > 0)
+        self.n_levels = n_levels
+        self.layer_size_ratio = layer_size_ratio
+        self.dtype = dtype
+        self.maxsize = maxsize
+        self._pyramids = OrderedDict()
+
+    def __call__(self, key, camera_model, image, depth_map=None):
+        """
+        Returns the pyramid of the frame identified by 'key',
+        building it only if it is not cached
+        """
+        if key in self._pyramids:
+            self._pyramids.move_to_end(key)
+            pyramid = self._pyramids[key]
+            if depth_map is not None and not pyramid.has_depth_map:
+                pyramid.set_depth_map(depth_map)
+            return pyramid
+
+        pyramid = ImagePyramid(camera_model, image, depth_map,
+                               self.n_levels, self.layer_size_ratio,
+                               self.dtype)
+        self._pyramids[key] = pyramid
+        if len(self._pyramids) > self.maxsize:
+            self._pyramids.popitem(last=False)  # least recently used
+        return pyramid
+
+    def __contains__(self, key):
+        return key in self._pyramids
+
+    def __len__(self):
+        return len(self._pyramids)
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def block_medians(X, block_size):
+    """
+    Median of each block_size x block_size block of X.
+    Blocks on the right and bottom borders can be smaller
+    """
+    height, width = X.shape
+    ny = (height + block_size - 1) // block_size
+    nx = (width + block_size - 1) // block_size
+
+    padded = np.full((ny * block_size, nx * block_size), np.nan)
+    padded[:height, :width] = X
+    blocks = padded.reshape(ny, block_size, nx, block_size)
+    return np.nanmedian(blocks, axis=(1, 3))
+
+
+def block_ids(image_shape, block_size):
+    height, width = image_shape
+    nx = (width + block_size - 1) // block_size
+    ys, xs = np.mgrid[0:height, 0:width]
+    return (ys // block_size) * nx + (xs // block_size)
+
+
+class PixelSelector(object):
+    """
+    Selects pixels that have valid depth and a large image gradient.
+    The gradient threshold adapts to each block_size x block_size block
+    (median gradient magnitude of the block + gradient_offset).
+    If more than max_pixels pixels pass the threshold, pixels are taken
+    from every block in turn in descending order of gradient so that
+    the selected ones spread over the image.
+    """
+    def __init__(self, max_pixels=4000, block_size=16, gradient_offset=5e-3):
+        assert(max_pixels > 0)
+        assert(block_size > 0)
+        self.max_pixels = max_pixels
+        self.block_size = block_size
+        self.gradient_offset = gradient_offset
+
+    def __call__(self, gradient, depth_map):
+        """
+        Returns flat indices of the selected pixels in ascending order
+        """
+        GX, GY = gradient
+        assert(GX.shape == GY.shape == depth_map.shape)
+
+        magnitude = np.sqrt(GX * GX + GY * GY)
+        medians = block_medians(magnitude, self.block_size)
+        ids = block_ids(magnitude.shape, self.block_size)
+        threshold = medians.flatten()[ids] + self.gradient_offset
+
+        valid = np.isfinite(depth_map) & (depth_map > 0)
+        indices = np.flatnonzero(valid & (magnitude > threshold))
+        if len(indices) <= self.max_pixels:
+            return indices
+
+        magnitude = magnitude.flatten()[indices]
+        ids = ids.flatten()[indices]
+
+        # rank of each pixel in its block in descending order of gradient
+        order = np.lexsort((-magnitude, ids))
+        sorted_ids = ids[order]
+        ranks = np.arange(len(order)) - np.searchsorted(sorted_ids, sorted_ids)
+
+        # take rank 0 of every block, then rank 1, and so on
+        selected = order[np.lexsort((-magnitude[order], ranks))]
+        return np.sort(indices[selected[:self.max_pixels]])
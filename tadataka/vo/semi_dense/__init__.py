@@ -0,0 +1,239 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from tadataka.matrix import inv_motion_matrix
+from tadataka.numeric import safe_invert
+from tadataka.pose import Pose
+from tadataka.vo.dvo import PoseChangeEstimator
+from tadataka.vo.semi_dense.flag import ResultFlag
+
+try:
+    from rust_bindings import semi_dense as _semi_dense
+    from rust_bindings.camera import CameraParameters as _CameraParameters
+except ImportError:
+    _semi_dense = None
+
+
+class DoubleBuffer(object):
+    """
+    A pair of buffers shared by readers and one writer.
+    Readers see the front buffer while the writer fills the back one,
+    and 'write' swaps them when the writer finishes, so readers never see
+    a half-written buffer. The writer waits until the back buffer is
+    released by the readers that took it before the last swap
+    """
+    def __init__(self, front, back):
+        self._buffers = [front, back]
+        self._n_readers = [0, 0]
+        self._front = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            i = self._front
+            self._n_readers[i] += 1
+        try:
+            yield self._buffers[i]
+        finally:
+            with self._condition:
+                self._n_readers[i] -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        # only the writer changes '_front' so the back buffer
+        # cannot be taken by a reader once it is released
+        with self._condition:
+            i = 1 - self._front
+            self._condition.wait_for(lambda: self._n_readers[i] == 0)
+        yield self._buffers[i]
+        with self._condition:
+            self._front = i
+
+    @property
+    def front(self):
+        """
+        The front buffer without registering a reader.
+        Safe only in the writer thread because only the writer swaps
+        and modifies buffers
+        """
+        return self._buffers[self._front]
+
+
+# copy of the latest result of the mapping thread
+DepthMap = namedtuple("DepthMap",
+                      ["frame_id", "depth", "variance", "flag", "age"])
+
+
+class _DepthMap(object):
+    # depth and variance of a frame estimated by the mapping thread
+    def __init__(self, shape):
+        self.frame_id = -1  # not mapped yet if negative
+        self.image = None
+        self.transform_wf = None
+        self.age = np.zeros(shape, dtype=np.uint64)
+        self.depth = np.empty(shape, dtype=np.float64)
+        self.variance = np.empty(shape, dtype=np.float64)
+        self.flag = np.empty(shape, dtype=np.int64)
+
+
+class SemiDenseVO(object):
+    """
+    Semi-dense visual odometry.
+    'track' estimates the pose of a new frame by DVO against the latest
+    depth map in the calling thread, and passes the frame to the mapping
+    thread. The mapping thread propagates the depth map of the previously
+    mapped frame to the new one, refines it by the epipolar search and
+    publishes it by swapping double-buffered depth / variance maps.
+    Tracking therefore does not wait for the depth update, and frames
+    are tracked against the newest depth map available at that time.
+    At most one frame waits for the mapping thread. If mapping is slower
+    than tracking, a waiting frame is replaced by the newer one so that
+    the depth map follows the latest frame and memory does not grow.
+    The camera model must not have distortion
+    """
+    def __init__(self, camera_model, image_shape, params,
+                 default_depth, default_variance, uncertaintity_bias=1.0,
+                 max_refframes=32, n_coarse_to_fine=5):
+        assert(_semi_dense is not None)
+        self.camera_model = camera_model
+        self.image_shape = image_shape
+        self.params = params
+        self.default_depth = default_depth
+        self.default_variance = default_variance
+        self.uncertaintity_bias = uncertaintity_bias
+
+        focal_length = camera_model.camera_parameters.focal_length
+        offset = camera_model.camera_parameters.offset
+        self._camera_params = _CameraParameters(tuple(focal_length),
+                                                tuple(offset))
+        self._estimator = PoseChangeEstimator(
+            camera_model, camera_model, n_coarse_to_fine=n_coarse_to_fine
+        )
+
+        self._refframes = _semi_dense.ReferenceFrames(max_refframes)
+        self._maps = DoubleBuffer(_DepthMap(image_shape),
+                                  _DepthMap(image_shape))
+        self._mapper = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._next = None  # frame waiting for the mapping thread
+        self._pending = []
+        self._n_frames = 0
+
+    def track(self, image, pose_wf=None):
+        """
+        Estimates the pose of the gray image 'image' (world <- frame)
+        and queues the frame for mapping.
+        If 'pose_wf' is given, it is used instead of the estimate,
+        which is useful to initialize the scale with known poses.
+        The first frame is at the identity if 'pose_wf' is not given
+        """
+        assert(image.shape == self.image_shape)
+        # kept by the depth map buffers and read by other threads
+        image = np.array(image, dtype=np.float64)
+
+        if pose_wf is None and self._n_frames == 0:
+            pose_wf = Pose.identity()
+        if pose_wf is None:
+            pose_wf = self._estimate_pose(image)
+
+        frame_id = self._n_frames
+        self._n_frames += 1
+        self._submit(image, pose_wf.T, frame_id)
+        return pose_wf
+
+    def _submit(self, image, transform_wf, frame_id):
+        # finished jobs are dropped here, raising the exceptions in mapping
+        pending = []
+        for future in self._pending:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self._pending = pending
+
+        with self._lock:
+            # a job that has not started yet maps the replaced frame
+            has_job = self._next is not None
+            self._next = (image, transform_wf, frame_id)
+        if not has_job:
+            self._pending.append(self._mapper.submit(self._map_next))
+
+    def _map_next(self):
+        with self._lock:
+            args, self._next = self._next, None
+        self._map(*args)
+
+    def _estimate_pose(self, image):
+        if self._n_frames == 1:
+            # the first frame has to be mapped before tracking
+            self.wait()
+
+        with self._maps.read() as keyframe:
+            weights = safe_invert(keyframe.variance)
+            pose10 = self._estimator(keyframe.image, keyframe.depth,
+                                     image, weights)
+            transform_w0 = keyframe.transform_wf
+        transform_w1 = np.dot(transform_w0, inv_motion_matrix(pose10.T))
+        return Pose.from_matrix(transform_w1[0:3, 0:3], transform_w1[0:3, 3])
+
+    def _map(self, image1, transform_w1, frame_id):
+        frame1 = _semi_dense.Frame(self._camera_params, image1, transform_w1)
+        map0 = self._maps.front
+        with self._maps.write() as map1:
+            if map0.frame_id < 0:
+                self._init_map(map1)
+            else:
+                self._update_map(map0, map1, frame1, transform_w1)
+            map1.frame_id = frame_id
+            map1.image = image1
+            map1.transform_wf = transform_w1
+        self._refframes.push(frame1)
+
+    def _init_map(self, map1):
+        map1.age = np.zeros(self.image_shape, dtype=np.uint64)
+        map1.depth[:] = self.default_depth
+        map1.variance[:] = self.default_variance
+        map1.flag[:] = ResultFlag.NOT_PROCESSED
+
+    def _update_map(self, map0, map1, frame1, transform_w1):
+        transform10 = np.dot(inv_motion_matrix(transform_w1),
+                             map0.transform_wf)
+        age1, depth1, variance1 = _semi_dense.propagate_with_age(
+            map0.age, transform10, self._camera_params, self._camera_params,
+            map0.depth, map0.variance,
+            self.default_depth, self.default_variance,
+            self.uncertaintity_bias
+        )
+        # frames older than every pixel are not needed anymore
+        self._refframes.evict_unreferenced(age1)
+        _semi_dense.update_depth(
+            frame1, self._refframes, age1, depth1, variance1, self.params,
+            out_depth=map1.depth, out_variance=map1.variance,
+            out_flag=map1.flag
+        )
+        map1.age = age1
+
+    def wait(self):
+        """Waits until all the tracked frames are mapped"""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()  # raises the exception raised in mapping
+
+    def depth_map(self):
+        """
+        Returns a DepthMap that holds copies of the latest depth map,
+        its variance, flags and ages with the index of the frame
+        """
+        with self._maps.read() as m:
+            return DepthMap(m.frame_id, m.depth.copy(), m.variance.copy(),
+                            m.flag.copy(), m.age.copy())
+
+    def close(self):
+        self.wait()
+        self._mapper.shutdown()
@@ -3,11 +3,15 @@ from tadataka.matrix import calc_relative_transform
 from tadataka.rigid_transform import transform_se3
 from tadataka.decorator import allow_1d
 from tadataka.projection import inv_pi, pi
+from tadataka.utils import float_dtype
 from tadataka.pose import Pose
 from rust_bindings import warp as _warp
 
 
 def warp2d_(T10, xs0, depths0):
+    if float_dtype(xs0) == np.float32:
+        return _warp.warp_vecs_f32(T10.astype(np.float32),
+                                   xs0, depths0.astype(np.float32, copy=False))
     return _warp.warp_vecs(T10, xs0, depths0)
 
 
@@ -1,7 +1,15 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
-from numpy.testing import assert_array_almost_equal
-from tadataka.camera._radtan import inv2x2
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from tadataka.camera._radtan import (inv2x2, radtan_distort, radtan_undistort,
+                                     distort_, undistort_)
+
+
+dist_coeffs = np.array([0.1, -0.05, 0.01, 0.02, 0.003])
 
 
 def test_inv2x2():
@@ -10,3 +18,73 @@ def test_inv2x2():
         [40, -30]
     ], dtype=np.float64)
     assert_array_almost_equal(np.dot(inv2x2(X), X), np.identity(2))
+
+
+def test_radtan():
+    keypoints = np.random.uniform(-0.5, 0.5, (100, 2))
+
+    distorted = radtan_distort(keypoints.copy(), dist_coeffs)
+    expected = np.array([distort_(p, dist_coeffs) for p in keypoints])
+    assert_array_equal(distorted, expected)
+
+    undistorted = radtan_undistort(distorted.copy(), dist_coeffs, 100, 1e-10)
+    expected = np.array([undistort_(p, dist_coeffs, 100, 1e-10)
+                         for p in distorted])
+    assert_array_equal(undistorted, expected)
+    assert_array_almost_equal(undistorted, keypoints, decimal=4)
+
+
+def undistort_chunks(chunks, n_threads):
+    def undistort(keypoints):
+        return radtan_undistort(keypoints.copy(), dist_coeffs, 100, 1e-10)
+
+    with ThreadPoolExecutor(n_threads) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(undistort, chunks))
+        return results, time.perf_counter() - start
+
+
+def test_radtan_threads():
+    chunks = [np.random.uniform(-0.5, 0.5, (1000, 2)) for i in range(8)]
+
+    # concurrent calls give the same results as serial calls
+    serial, _ = undistort_chunks(chunks, 1)
+    concurrent, _ = undistort_chunks(chunks, 4)
+    for a, b in zip(serial, concurrent):
+        assert_array_equal(a, b)
+
+
+def other_thread_runs_during(f):
+    # Returns True if another Python thread makes progress
+    # in the middle of the call of 'f', that is, if 'f' releases the GIL.
+    # This does not depend on the number of cores or the machine load
+    times = []
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            times.append(time.perf_counter())
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    start = time.perf_counter()
+    f()
+    end = time.perf_counter()
+    stop.set()
+    thread.join()
+
+    # the thread may run just before and after the call
+    margin = (end - start) / 4
+    return any(start + margin < t < end - margin for t in times)
+
+
+def test_radtan_releases_gil():
+    # the GIL is released during the computation so calls from
+    # different threads run in parallel
+    keypoints = np.random.uniform(-0.5, 0.5, (1000000, 2))
+    assert(other_thread_runs_during(
+        lambda: radtan_undistort(keypoints, dist_coeffs, 100, 1e-10)
+    ))
+    # a call that holds the GIL
+    assert(not other_thread_runs_during(lambda: sum(range(10000000))))
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+import pytest
+
+from tadataka.backprojection import (BackProjection, MAX_CACHED_RAYS,
+                                     normalized_rays)
+from tadataka.camera import CameraModel, CameraParameters
+from tadataka.camera.distortion import FOV
+from tadataka.coordinates import image_coordinates
+from tadataka.projection import inv_pi
+
+
+camera_model = CameraModel(
+    CameraParameters(focal_length=[50., 50.], offset=[40., 30.]),
+    distortion_model=FOV(0.1)
+)
+
+
+def test_normalized_rays():
+    us, xs = normalized_rays(camera_model, (30, 40))
+    assert_array_equal(us, image_coordinates((30, 40)))
+    assert_array_almost_equal(xs, camera_model.normalize(us))
+
+    # cached
+    us_, xs_ = normalized_rays(camera_model, (30, 40))
+    assert(us_ is us)
+    assert(xs_ is xs)
+
+    with pytest.raises(ValueError):
+        xs[0, 0] = 1  # read-only
+
+    # equal camera models share the cache
+    camera_model_ = CameraModel(
+        CameraParameters(focal_length=[50., 50.], offset=[40., 30.]),
+        distortion_model=FOV(0.1)
+    )
+    assert(normalized_rays(camera_model_, (30, 40))[1] is xs)
+
+    # different camera models and shapes do not
+    assert(normalized_rays(camera_model, (30, 41))[1] is not xs)
+    camera_model_ = CameraModel(
+        CameraParameters(focal_length=[50., 50.], offset=[40., 30.]),
+        distortion_model=None
+    )
+    assert(normalized_rays(camera_model_, (30, 40))[1] is not xs)
+
+
+def test_backprojection():
+    depth_map = np.random.uniform(1, 5, (30, 40))
+    depth_map[3, 4] = 0
+
+    backprojection = BackProjection(camera_model, depth_map)
+    us = image_coordinates((30, 40))
+    xs = camera_model.normalize(us)
+    assert_array_almost_equal(backprojection.P,
+                              inv_pi(xs, depth_map.flatten()))
+    assert(np.sum(~backprojection.mask) == 1)
+    assert(not backprojection.mask[3 * 40 + 4])
+
+
+
+def test_backprojection_float32():
+    depth_map = np.random.uniform(1, 5, (30, 40))
+    expected = BackProjection(camera_model, depth_map)
+    backprojection = BackProjection(camera_model,
+                                    depth_map.astype(np.float32))
+    assert(backprojection.xs.dtype == np.float32)
+    assert(backprojection.P.dtype == np.float32)
+    assert_array_almost_equal(backprojection.P, expected.P, decimal=4)
+
+    # cached separately from float64 rays
+    assert(normalized_rays(camera_model, (30, 40), np.float32)[1]
+           is backprojection.xs)
+    assert(normalized_rays(camera_model, (30, 40))[1] is expected.xs)
+
+
+def test_normalized_rays_threads():
+    # more shapes than the cache holds so entries are evicted
+    # while other threads look them up
+    shapes = [(10, 10 + i) for i in range(2 * MAX_CACHED_RAYS)]
+
+    def lookup(i):
+        shape = shapes[i % len(shapes)]
+        us, xs = normalized_rays(camera_model, shape)
+        assert(us.shape == (shape[0] * shape[1], 2))
+        return xs.shape
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lookup, range(2000)))
+    assert(len(results) == 2000)
@@ -1,6 +1,7 @@
 import numpy as np
-from numpy.testing import assert_array_equal
-from tadataka.gradient import grad_x, grad_y
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+from scipy import ndimage
+from tadataka.gradient import grad_x, grad_y, sobel
 
 
 A = np.arange(25).reshape(5, 5)
@@ -15,3 +16,14 @@ def test_grad_x():
 def test_grad_y():
     GY = grad_y(A)
     assert_array_equal(GY[1:4, 1:4], 40)
+
+
+def test_sobel():
+    image = np.random.uniform(-1, 1, (41, 23))
+    GX, GY = sobel(image)
+    assert_array_almost_equal(GX, ndimage.sobel(image, axis=1, mode="reflect"))
+    assert_array_almost_equal(GY, ndimage.sobel(image, axis=0, mode="reflect"))
+
+    GX_, GY_ = sobel(image, scale=1/8)
+    assert_array_almost_equal(GX_, GX / 8)
+    assert_array_almost_equal(GY_, GY / 8)
@@ -23,6 +23,12 @@ def test_interpolation():
     coordinate = np.array([0.1, 1.2])
     assert(interpolation(image, coordinate).dtype == np.float64)
 
+    # not upcast. coordinates follow the image
+    expected = interpolation(image, coordinates)
+    intensities = interpolation(image.astype(np.float32), coordinates)
+    assert(intensities.dtype == np.float32)
+    assert_array_almost_equal(intensities, expected, decimal=5)
+
     # ordinary
     expected = (image[2, 1] * (2.0 - 1.3) * (3.0 - 2.6) +
                 image[2, 2] * (1.3 - 1.0) * (3.0 - 2.6) +
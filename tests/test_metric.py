@@ -0,0 +1,29 @@
+import numpy as np
+
+from tadataka.backprojection import BackProjection
+from tadataka.camera import CameraModel, CameraParameters
+from tadataka.metric import PhotometricError, photometric_error
+from tadataka.pose import Pose
+from tadataka.warp import LocalWarp2D
+
+
+def test_photometric_error():
+    camera_model = CameraModel(
+        CameraParameters(focal_length=[50., 50.], offset=[40., 30.]),
+        distortion_model=None
+    )
+    I0 = np.random.uniform(0, 1, (60, 80))
+    I1 = np.random.uniform(0, 1, (60, 80))
+    D0 = np.random.uniform(1, 5, (60, 80))
+    pose10 = Pose.from_se3(np.array([0.1, 0.2, 0.0, 0.01, 0.02, 0.0]))
+
+    expected = photometric_error(
+        LocalWarp2D(camera_model, camera_model, pose10), I0, D0, I1)
+
+    error = PhotometricError(camera_model, camera_model, I0, D0, I1)
+    assert(error(pose10) == expected)
+
+    backprojection = BackProjection(camera_model, D0)
+    error = PhotometricError(camera_model, camera_model, I0, D0, I1,
+                             backprojection)
+    assert(error(pose10) == expected)
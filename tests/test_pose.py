@@ -11,9 +11,9 @@ from tadataka.exceptions import NotEnoughInliersException
 from tadataka.dataset.observations import generate_translations
 from tadataka.pose import (
     estimate_pose_change, n_triangulated,
-    solve_pnp, triangulation_indices, Pose
+    solve_pnp, triangulation_indices, Pose, PoseArray
 )
-from tadataka.rigid_transform import transform
+from tadataka.rigid_transform import transform, transform_all
 
 from tests.utils import random_rotation_matrix
 
@@ -221,3 +221,123 @@ def test_type():
     assert(isinstance(Pose(rotvec, t).inv(), Pose))
     assert(isinstance(Pose(rotvec, t) * Pose(rotvec, t), Pose))
     assert(isinstance(Pose(rotvec, t) * Pose(rotvec, t), Pose))
+
+
+def random_pose_array(n):
+    rotvecs = np.random.uniform(-np.pi, np.pi, (n, 3))
+    translations = np.random.uniform(-10, 10, (n, 3))
+    return PoseArray.from_rotvecs(rotvecs, translations)
+
+
+def test_from_matrix():
+    rotvec = np.random.uniform(-1, 1, 3)
+    R = Rotation.from_rotvec(rotvec).as_matrix()
+    t = np.random.uniform(-10, 10, 3)
+    pose = Pose.from_matrix(R, t)
+    assert(pose.R is R)
+    assert_array_almost_equal(pose.rotation.as_rotvec(), rotvec)
+    assert(pose == Pose(Rotation.from_rotvec(rotvec), t))
+
+    # cached matrix has to be invalidated when rotation is replaced
+    pose.rotation = Rotation.from_rotvec(np.zeros(3))
+    assert_array_almost_equal(pose.R, np.identity(3))
+
+
+def test_pose_array_conversion():
+    N = 10
+    rotvecs = np.random.uniform(-1, 1, (N, 3))
+    translations = np.random.uniform(-10, 10, (N, 3))
+    poses = PoseArray.from_rotvecs(rotvecs, translations)
+
+    assert(len(poses) == N)
+    assert(poses.R.shape == (N, 3, 3))
+    assert(poses.t.shape == (N, 3))
+    assert_array_almost_equal(poses.rotvecs(), rotvecs)
+
+    for i, pose in enumerate(poses):
+        expected = Pose(Rotation.from_rotvec(rotvecs[i]), translations[i])
+        assert(pose == expected)
+        assert_array_almost_equal(poses.T[i], expected.T)
+
+    q = poses.quaternions()
+    assert_array_almost_equal(
+        PoseArray.from_quaternions(q, translations).R, poses.R
+    )
+    assert_array_almost_equal(PoseArray.from_matrices(poses.T).R, poses.R)
+    assert_array_almost_equal(PoseArray.from_matrices(poses.T).t, poses.t)
+
+    xis = poses.log_se3()
+    assert(xis.shape == (N, 6))
+    assert_array_almost_equal(PoseArray.from_se3(xis).T, poses.T)
+
+    list_ = [Pose(Rotation.from_rotvec(r), t)
+             for r, t in zip(rotvecs, translations)]
+    assert_array_almost_equal(PoseArray.from_poses(list_).T, poses.T)
+
+    identity = PoseArray.identity(N)
+    assert_array_equal(identity.R, np.tile(np.identity(3), (N, 1, 1)))
+    assert_array_equal(identity.t, np.zeros((N, 3)))
+
+
+def test_pose_array_getitem():
+    poses = random_pose_array(8)
+
+    # an element shares the memory with the array
+    pose = poses[3]
+    assert(isinstance(pose, Pose))
+    assert(np.shares_memory(pose.R, poses.R))
+    assert(np.shares_memory(pose.t, poses.t))
+
+    assert(poses[-1] == Pose.from_matrix(poses.R[7], poses.t[7]))
+
+    subset = poses[2:5]
+    assert(isinstance(subset, PoseArray))
+    assert(len(subset) == 3)
+    assert_array_equal(subset.T, poses.T[2:5])
+
+    subset = poses[np.array([0, 4])]
+    assert_array_equal(subset.T, poses.T[[0, 4]])
+
+
+def test_pose_array_inv_mul():
+    N = 10
+    poses0 = random_pose_array(N)
+    poses1 = random_pose_array(N)
+
+    composed = poses0 * poses1
+    inv = poses0.inv()
+    for i in range(N):
+        assert(composed[i] == poses0[i] * poses1[i])
+        assert(inv[i] == poses0[i].inv())
+
+    identity = poses0 * poses0.inv()
+    assert_array_almost_equal(identity.T, PoseArray.identity(N).T)
+
+    # broadcasting a single pose
+    pose = poses1[0]
+    right = poses0 * pose
+    left = pose * poses0
+    for i in range(N):
+        assert(right[i] == poses0[i] * pose)
+        assert(left[i] == pose * poses0[i])
+
+    relative = poses0.relative(poses1)
+    for i in range(N):
+        assert(relative[i] == poses0[i].inv() * poses1[i])
+
+
+def test_pose_array_transform():
+    N = 6
+    poses = random_pose_array(N)
+    points = np.random.uniform(-10, 10, (4, 3))
+
+    P = poses.transform_all(points)
+    assert(P.shape == (N, 4, 3))
+    assert_array_almost_equal(P, transform_all(poses.R, poses.t, points))
+    for i, pose in enumerate(poses):
+        assert_array_almost_equal(P[i], transform(pose.R, pose.t, points))
+
+    points = np.random.uniform(-10, 10, (N, 3))
+    P = poses.transform_each(points)
+    for i, pose in enumerate(poses):
+        assert_array_almost_equal(P[i], transform(pose.R, pose.t, points[i]))
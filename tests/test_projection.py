@@ -39,3 +39,17 @@ def test_inv_pi():
     x = np.array([0.5, 2.0])
     depth = 2.0
     assert_array_almost_equal(inv_pi(x, depth), [1.0, 4.0, 2.0])
+
+
+def test_float32():
+    P = np.array([[1, 4, 2], [-1, 3, 5]], dtype=np.float32)
+    xs = pi(P)
+    assert(xs.dtype == np.float32)
+    assert_array_almost_equal(xs, [[0.5, 2.0], [-0.2, 0.6]])
+    assert(pi(P[0]).dtype == np.float32)
+
+    # depths are cast to the dtype of xs
+    P_ = inv_pi(xs, np.array([2.0, 5.0]))
+    assert(P_.dtype == np.float32)
+    assert_array_almost_equal(P_, P, decimal=5)
+    assert(inv_pi(xs[0], 2.0).dtype == np.float32)
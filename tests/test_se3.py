@@ -1,7 +1,8 @@
 import numpy as np
 from numpy.testing import assert_array_almost_equal, assert_array_equal
 from scipy.linalg import expm
-from tadataka.se3 import exp_se3, log_se3
+from tadataka.se3 import (exp_se3, log_se3,
+                          left_jacobian_se3, right_jacobian_se3)
 from tadataka.pose import Pose
 
 
@@ -28,6 +29,55 @@ def test_exp_se3():
     run(np.array([-1, 2, 1, 0, -np.pi / 2, np.pi / 4]))
 
 
+def random_xis(n):
+    return np.vstack((
+        np.random.uniform(-2, 2, (n, 6)),
+        np.hstack((np.random.uniform(-2, 2, (n, 3)),
+                   np.random.uniform(-1e-6, 1e-6, (n, 3)))),
+        np.hstack((np.random.uniform(-2, 2, (1, 3)), np.zeros((1, 3))))
+    ))
+
+
+def test_exp_se3_batch():
+    xis = random_xis(10)
+    G = exp_se3(xis)
+    assert(G.shape == (len(xis), 4, 4))
+    for i, xi in enumerate(xis):
+        assert_array_almost_equal(G[i], expm(tangent_se3_(xi)))
+
+
+def test_log_se3_batch():
+    xis = random_xis(10)
+    G = exp_se3(xis)
+    assert(log_se3(G).shape == (len(xis), 6))
+    assert_array_almost_equal(log_se3(G), xis)
+
+
+def test_jacobian_se3():
+    def numerical(xi, left, eps=1e-6):
+        J = np.empty((6, 6))
+        G_inv = np.linalg.inv(exp_se3(xi))
+        for i in range(6):
+            d = np.zeros(6)
+            d[i] = eps
+            Gp, Gm = exp_se3(xi + d), exp_se3(xi - d)
+            if left:
+                Dp, Dm = np.dot(Gp, G_inv), np.dot(Gm, G_inv)
+            else:
+                Dp, Dm = np.dot(G_inv, Gp), np.dot(G_inv, Gm)
+            J[:, i] = (log_se3(Dp) - log_se3(Dm)) / (2 * eps)
+        return J
+
+    xis = random_xis(5)
+    JL = left_jacobian_se3(xis)
+    JR = right_jacobian_se3(xis)
+    assert(JL.shape == (len(xis), 6, 6))
+    for i, xi in enumerate(xis):
+        assert_array_almost_equal(JL[i], numerical(xi, left=True))
+        assert_array_almost_equal(JR[i], numerical(xi, left=False))
+        assert_array_almost_equal(left_jacobian_se3(xi), JL[i])
+
+
 def test_log_se3():
     def run(xi):
         # test log(exp(xi)) == xi
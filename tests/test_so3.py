@@ -1,7 +1,21 @@
 import numpy as np
 from numpy.testing import assert_array_equal, assert_array_almost_equal, assert_equal
+from scipy.spatial.transform import Rotation
 
-from tadataka.so3 import is_rotation_matrix, exp_so3, log_so3, tangent_so3
+from tadataka.so3 import (is_rotation_matrix, exp_so3, log_so3, tangent_so3,
+                          left_jacobian_so3, right_jacobian_so3,
+                          inv_left_jacobian_so3, inv_right_jacobian_so3)
+
+
+def random_rotvecs(n):
+    axes = np.random.normal(0, 1, (n, 3))
+    axes = axes / np.linalg.norm(axes, axis=1, keepdims=True)
+    return np.vstack((
+        np.random.uniform(-1.5, 1.5, (n, 3)),  # ordinary
+        np.random.uniform(-1e-6, 1e-6, (n, 3)),  # small angles
+        np.zeros((1, 3)),
+        (np.pi - 1e-6) * axes  # near pi
+    ))
 
 
 def test_is_rotation_matrix():
@@ -46,3 +60,67 @@ def test_tangent_so3():
                        [[0, -6, 5],
                         [6, 0, -4],
                         [-5, 4, 0]])
+
+
+def test_tangent_so3_batch():
+    V = np.random.uniform(-1, 1, (4, 3))
+    K = tangent_so3(V)
+    assert(K.shape == (4, 3, 3))
+    for i in range(4):
+        assert_array_equal(K[i], tangent_so3(V[i]))
+
+
+def test_exp_so3():
+    rotvecs = random_rotvecs(10)
+    R = exp_so3(rotvecs)
+    assert(R.shape == (len(rotvecs), 3, 3))
+    assert_array_almost_equal(R, Rotation.from_rotvec(rotvecs).as_matrix())
+
+    # 1d input
+    assert_array_almost_equal(exp_so3(rotvecs[0]), R[0])
+
+    assert_array_almost_equal(exp_so3([0, 0, np.pi / 2]),
+                              [[0, -1, 0],
+                               [1, 0, 0],
+                               [0, 0, 1]])
+
+
+def test_log_so3():
+    rotvecs = random_rotvecs(10)
+    R = exp_so3(rotvecs)
+    assert(log_so3(R).shape == (len(rotvecs), 3))
+    assert_array_almost_equal(log_so3(R), rotvecs)
+    assert_array_almost_equal(log_so3(R[0]), rotvecs[0])
+
+    # the rotation axis is ambiguous when theta == pi
+    rotvec = np.array([0, np.pi, 0])
+    assert_array_almost_equal(np.abs(log_so3(exp_so3(rotvec))), rotvec)
+
+
+def test_jacobian_so3():
+    def numerical_left(rotvec, eps=1e-6):
+        J = np.empty((3, 3))
+        for i in range(3):
+            d = np.zeros(3)
+            d[i] = eps
+            RT = exp_so3(rotvec).T
+            J[:, i] = (log_so3(np.dot(exp_so3(rotvec + d), RT)) -
+                       log_so3(np.dot(exp_so3(rotvec - d), RT))) / (2 * eps)
+        return J
+
+    rotvecs = np.vstack((np.random.uniform(-1.5, 1.5, (10, 3)),
+                         np.random.uniform(-1e-6, 1e-6, (3, 3)),
+                         np.zeros((1, 3))))
+
+    JL = left_jacobian_so3(rotvecs)
+    JR = right_jacobian_so3(rotvecs)
+    for i, rotvec in enumerate(rotvecs):
+        assert_array_almost_equal(JL[i], numerical_left(rotvec))
+        # J_r(rotvec) == J_l(-rotvec)
+        assert_array_almost_equal(JR[i], numerical_left(-rotvec))
+
+    I = np.tile(np.identity(3), (len(rotvecs), 1, 1))
+    assert_array_almost_equal(
+        np.matmul(JL, inv_left_jacobian_so3(rotvecs)), I)
+    assert_array_almost_equal(
+        np.matmul(JR, inv_right_jacobian_so3(rotvecs)), I)
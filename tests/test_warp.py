@@ -105,3 +105,16 @@ def test_warp2d_():
     us0 = 2.0 * xs0
     us1, depths1 = warp2d(us0, depths0)
     assert_array_almost_equal(us1, 3.0 * xs1)
+
+
+def test_warp2d_float32():
+    pose10 = Pose(Rotation.from_rotvec([0, np.pi/2, 0]), np.array([0, 0, 4]))
+
+    xs0 = np.array([[0, 0], [2, -1]], dtype=np.float32)
+    depths0 = np.array([2, 4], dtype=np.float32)
+
+    xs1, depths1 = warp2d_(pose10.T, xs0, depths0)
+    assert(xs1.dtype == np.float32)
+    assert(depths1.dtype == np.float32)
+    assert_array_almost_equal(xs1, [[0.5, 0.0], [-1.0, 1.0]], decimal=5)
+    assert_array_almost_equal(depths1, [4.0, -4.0], decimal=5)
@@ -40,3 +40,15 @@ def test_calc_jacobian():
 
     for i in range(N):
         run(J[i], didx[i], didy[i], P[i])
+
+
+def test_calc_image_gradient():
+    # derivatives of a linear image are exact except on the border
+    ys, xs = np.mgrid[0:10, 0:12]
+    image = 3. * xs - 2. * ys
+    DX, DY = calc_image_gradient(image)
+    assert_array_almost_equal(DX[1:-1, 1:-1], 3.)
+    assert_array_almost_equal(DY[1:-1, 1:-1], -2.)
+
+    DX, DY = calc_image_gradient(image.astype(np.float32))
+    assert(DX.dtype == DY.dtype == np.float32)
@@ -0,0 +1,68 @@
+import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from skimage.transform import rescale
+
+from tadataka.camera import CameraModel, CameraParameters
+from tadataka.vo.dvo.jacobian import calc_image_gradient
+from tadataka.vo.dvo.pyramid import ImagePyramid, ImagePyramidCache
+
+
+camera_model = CameraModel(
+    CameraParameters(focal_length=[100., 120.], offset=[40., 30.]),
+    distortion_model=None
+)
+
+
+def test_image_pyramid():
+    image = np.random.uniform(0, 1, (60, 80))
+    depth_map = np.random.uniform(1, 5, (60, 80))
+
+    pyramid = ImagePyramid(camera_model, image, depth_map,
+                           n_levels=3, layer_size_ratio=2.0)
+    assert(len(pyramid) == 3)
+    assert(pyramid.has_depth_map)
+
+    for level, shape in enumerate([(60, 80), (30, 40), (15, 20)]):
+        scale = 1 / 2 ** level
+        assert(pyramid[level].image.shape == shape)
+        assert(pyramid[level].depth_map.shape == shape)
+        assert_array_almost_equal(pyramid[level].image, rescale(image, scale))
+        assert_array_almost_equal(
+            pyramid[level].camera_model.camera_parameters.focal_length,
+            [100. * scale, 120. * scale]
+        )
+
+        GX, GY = pyramid[level].gradient
+        GX_, GY_ = calc_image_gradient(pyramid[level].image)
+        assert_array_equal(GX, GX_)
+        assert_array_equal(GY, GY_)
+
+    pyramid = ImagePyramid(camera_model, image, n_levels=3)
+    assert(not pyramid.has_depth_map)
+    assert(pyramid[2].depth_map is None)
+    pyramid.set_depth_map(depth_map)
+    assert(pyramid.has_depth_map)
+    assert(pyramid[2].depth_map.shape == pyramid[2].image.shape)
+
+
+def test_image_pyramid_cache():
+    images = [np.random.uniform(0, 1, (30, 40)) for i in range(4)]
+    depth_map = np.random.uniform(1, 5, (30, 40))
+
+    cache = ImagePyramidCache(n_levels=2, maxsize=2)
+
+    pyramid0 = cache(0, camera_model, images[0])
+    assert(not pyramid0.has_depth_map)
+    assert(cache(0, camera_model, images[0]) is pyramid0)
+
+    # depth map is attached to the cached pyramid
+    assert(cache(0, camera_model, images[0], depth_map) is pyramid0)
+    assert(pyramid0.has_depth_map)
+
+    cache(1, camera_model, images[1])
+    cache(0, camera_model, images[0])  # 0 becomes the most recently used
+    cache(2, camera_model, images[2])  # 1 is evicted
+    assert(len(cache) == 2)
+    assert(0 in cache)
+    assert(1 not in cache)
+    assert(2 in cache)
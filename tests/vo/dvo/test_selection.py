@@ -0,0 +1,49 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from tadataka.vo.dvo.selection import block_medians, PixelSelector
+
+
+def test_block_medians():
+    X = np.arange(20, dtype=np.float64).reshape(4, 5)
+    # [[ 0,  1,  2,  3,  4],
+    #  [ 5,  6,  7,  8,  9],
+    #  [10, 11, 12, 13, 14],
+    #  [15, 16, 17, 18, 19]]
+    assert_array_equal(block_medians(X, 2),
+                       [[3, 5, 6.5],
+                        [13, 15, 16.5]])
+
+
+def test_pixel_selector():
+    shape = (32, 48)
+    GX = np.zeros(shape)
+    GY = np.zeros(shape)
+    depth_map = np.ones(shape)
+
+    # one strong edge in each 16x16 block
+    for y in range(0, 32, 16):
+        for x in range(0, 48, 16):
+            GX[y:y+16, x + 3] = 1.0 + x
+    depth_map[0, 3] = 0  # invalid depth
+    depth_map[1, 3] = np.nan
+
+    select = PixelSelector(max_pixels=1000, block_size=16)
+    indices = select((GX, GY), depth_map)
+    expected = np.zeros(shape, dtype=bool)
+    expected[:, 3::16] = True
+    expected[0, 3] = expected[1, 3] = False
+    assert_array_equal(indices, np.flatnonzero(expected))
+
+    # pixels are taken from every block when the budget is small
+    select = PixelSelector(max_pixels=12, block_size=16)
+    indices = select((GX, GY), depth_map)
+    assert(len(indices) == 12)
+    ys, xs = np.unravel_index(indices, shape)
+    blocks = (ys // 16) * 3 + xs // 16
+    assert_array_equal(np.bincount(blocks), 2 * np.ones(6))
+
+    # flat image
+    select = PixelSelector()
+    indices = select((np.zeros(shape), np.zeros(shape)), depth_map)
+    assert(len(indices) == 0)
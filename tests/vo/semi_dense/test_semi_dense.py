@@ -1,13 +1,17 @@
 import numpy as np
 from numpy.testing import (assert_almost_equal, assert_array_equal,
                            assert_equal, assert_array_almost_equal)
+import pytest
 from scipy.spatial.transform import Rotation
 from skimage.color import rgb2gray
 
 from tadataka.vo.semi_dense.flag import ResultFlag as FLAG
 from tadataka.dataset import NewTsukubaDataset
 
-from rust_bindings.semi_dense import Params, update_depth, Frame, estimate_debug_
+from rust_bindings.semi_dense import (
+    Params, update_depth, Frame, ReferenceFrames, estimate_debug_,
+    increment_age, propagate, propagate_with_age, regularize, fusion_arrays
+)
 from rust_bindings.camera import CameraParameters
 
 from tests.dataset.path import new_tsukuba
@@ -20,6 +24,36 @@ def test_frame():
     frame = Frame(camera_params, image, transform)
 
 
+def test_reference_frames():
+    camera_params = CameraParameters((10., 10.), (20., 10.))
+    shape = (40, 20)
+
+    refframes = ReferenceFrames(3)
+    assert(refframes.capacity == 3)
+    assert(refframes.n_frames == 0)
+    assert(refframes.newest_id is None)
+
+    for i in range(5):
+        frame = Frame(camera_params, i * np.ones(shape), np.identity(4))
+        assert(refframes.push(frame) == i)
+
+    # the oldest frames are dropped when the buffer is full
+    assert(refframes.n_frames == 3)
+    assert(refframes.oldest_id == 2)
+    assert(refframes.newest_id == 4)
+    assert([f.image[0, 0] for f in refframes.frames] == [2., 3., 4.])
+
+    # image, gradients (x and y) and the transform of 3 frames
+    size = 3 * (3 * shape[0] * shape[1] + 16) * 8
+    assert(refframes.memory_usage() == size)
+
+    # only the newest 2 frames are referenced
+    age_map = np.array([[0, 1], [2, 1]], dtype=np.uint64)
+    assert(refframes.evict_unreferenced(age_map) == 1)
+    assert(refframes.oldest_id == 3)
+    assert(refframes.memory_usage() == 2 * size // 3)
+
+
 def test_new_params():
     params = Params(
         min_depth=0.1,
@@ -30,6 +64,17 @@ def test_new_params():
         min_gradient=0.001
     )
 
+    params = Params(
+        min_depth=0.1,
+        max_depth=10.0,
+        geo_coeff=0.4,
+        photo_coeff=0.5,
+        ref_step_size=0.02,
+        min_gradient=0.001,
+        subpixel=True,
+        coarse_step_factor=4
+    )
+
 
 def wrap_(c):
     [fx, fy] = c.focal_length
@@ -37,6 +82,84 @@ def wrap_(c):
     return CameraParameters((fx, fy), (ox, oy))
 
 
+def test_propagate_with_age():
+    width, height = 40, 37
+    camera_params = CameraParameters((100., 100.), (20., 18.))
+    transform10 = np.array([
+        [1., 0., 0., 2.],
+        [0., 1., 0., -1.],
+        [0., 0., 1., 40.],
+        [0., 0., 0., 1.]
+    ])
+
+    ys, xs = np.mgrid[0:height, 0:width]
+    age_map0 = ((xs + 2 * ys) % 5).astype(np.uint64)
+    depth_map0 = 50. + (7 * xs + 13 * ys) % 11
+    variance_map0 = 1. + (3 * xs + 5 * ys) % 7
+
+    age_map1, depth_map1, variance_map1 = propagate_with_age(
+        age_map0, transform10, camera_params, camera_params,
+        depth_map0, variance_map0, 60., 8., 3.
+    )
+
+    # same as the separate passes
+    assert_array_equal(
+        age_map1,
+        increment_age(age_map0, camera_params, camera_params,
+                      transform10, depth_map0)
+    )
+    expected_depth, expected_variance = propagate(
+        transform10, camera_params, camera_params,
+        depth_map0, variance_map0, 60., 8., 3.
+    )
+    assert_array_equal(depth_map1, expected_depth)
+    assert_array_equal(variance_map1, expected_variance)
+
+    with pytest.raises(ValueError, match="'variance_map0' has shape"):
+        propagate_with_age(
+            age_map0, transform10, camera_params, camera_params,
+            depth_map0, variance_map0[1:], 60., 8., 3.
+        )
+
+
+def test_fusion_arrays():
+    shape = (31, 17)
+    mu1 = np.random.uniform(-10, 10, shape)
+    mu2 = np.random.uniform(-10, 10, shape)
+    var1 = np.random.uniform(0.1, 5, shape)
+    var2 = np.random.uniform(0.1, 5, shape)
+
+    mu, var = fusion_arrays(mu1, mu2, var1, var2)
+    assert_array_almost_equal(mu, (var2 * mu1 + var1 * mu2) / (var1 + var2))
+    assert_array_almost_equal(var, (var1 * var2) / (var1 + var2))
+
+    with pytest.raises(ValueError, match="'var2' has shape"):
+        fusion_arrays(mu1, mu2, var1, var2[:, 1:])
+
+
+def test_regularize():
+    depth_map = np.array([
+        [2., 2., 2., 3.],
+        [2., 100., 2., 3.],
+        [2., 2., 2., 3.]
+    ])
+    variance_map = np.full(depth_map.shape, 1e-4)
+    flag_map = np.full(depth_map.shape, FLAG.SUCCESS, dtype=np.int64)
+    flag_map[0, 3] = FLAG.NOT_PROCESSED
+
+    regularized = regularize(depth_map, variance_map, flag_map)
+    assert(regularized.shape == depth_map.shape)
+    # outliers and pixels without estimates are kept as they are
+    assert_almost_equal(regularized[1, 1], 100.)
+    assert_almost_equal(regularized[0, 3], 3.)
+    # neighbors that are not statistically same are not used
+    assert_almost_equal(regularized[0, 0], 2.)
+    assert_almost_equal(regularized[1, 3], 3.)
+
+    with pytest.raises(ValueError, match="'flag_map' has shape"):
+        regularize(depth_map, variance_map, flag_map[1:])
+
+
 def test_update_depth():
     dataset = NewTsukubaDataset(new_tsukuba)
     keyframe_, refframe_ = dataset[0]
@@ -63,7 +186,7 @@ def test_update_depth():
     age_map = np.ones(shape, dtype=np.uint64)
     prior_depth = 200.0 * np.ones(shape, dtype=np.float64)
     prior_variance = np.ones(shape, dtype=np.float64)
-    update_depth(
+    depth_map, variance_map, flag_map = update_depth(
         keyframe,
         [refframe,],
         age_map,
@@ -72,6 +195,116 @@ def test_update_depth():
         params,
     )
 
+    # the result does not depend on the number of threads.
+    # pools are reused across calls with the same number of threads
+    for n_threads in [1, 2, 1]:
+        depth_map1, variance_map1, flag_map1 = update_depth(
+            keyframe, [refframe,], age_map, prior_depth, prior_variance,
+            params, n_threads=n_threads
+        )
+        assert_array_equal(depth_map1, depth_map)
+        assert_array_equal(variance_map1, variance_map)
+        assert_array_equal(flag_map1, flag_map)
+
+    # results can be written into preallocated arrays
+    out_depth = np.empty(shape, dtype=np.float64)
+    out_variance = np.empty(shape, dtype=np.float64)
+    out_flag = np.empty(shape, dtype=np.int64)
+    depth_map1, variance_map1, flag_map1 = update_depth(
+        keyframe, [refframe,], age_map, prior_depth, prior_variance, params,
+        out_depth=out_depth, out_variance=out_variance, out_flag=out_flag
+    )
+    assert(depth_map1 is out_depth)
+    assert(variance_map1 is out_variance)
+    assert(flag_map1 is out_flag)
+    assert_array_equal(out_depth, depth_map)
+    assert_array_equal(out_variance, variance_map)
+    assert_array_equal(out_flag, flag_map)
+
+    def update_depth_into(**outputs):
+        return update_depth(keyframe, [refframe,], age_map,
+                            prior_depth, prior_variance, params, **outputs)
+
+    with pytest.raises(ValueError, match="'out_depth' has shape"):
+        update_depth_into(out_depth=np.empty((2, 3)))
+    with pytest.raises(ValueError, match="'prior_variance' has shape"):
+        update_depth(keyframe, [refframe,], age_map, prior_depth,
+                     prior_variance[1:], params)
+
+    readonly = np.empty(shape, dtype=np.int64)
+    readonly.setflags(write=False)
+    with pytest.raises(ValueError, match="'out_flag' is not writeable"):
+        update_depth_into(out_flag=readonly)
+
+    with pytest.raises(ValueError,
+                       match="'out_depth' shares memory with 'prior_depth'"):
+        update_depth_into(out_depth=prior_depth)
+    with pytest.raises(ValueError,
+                       match="'out_variance' shares memory with 'out_depth'"):
+        update_depth_into(out_depth=out_depth, out_variance=out_depth)
+
+    progress = []
+    depth_map1, variance_map1, flag_map1, stats = update_depth(
+        keyframe, [refframe,], age_map, prior_depth, prior_variance, params,
+        progress=lambda n_processed, n_rows: progress.append(n_processed),
+        return_stats=True
+    )
+    assert_array_equal(flag_map1, flag_map)
+
+    # every block of rows is reported once
+    assert(sorted(progress)[-1] == shape[0])
+    assert(len(set(progress)) == len(progress))
+
+    flag_counts = stats["flag_counts"]
+    for flag in FLAG:
+        assert(flag_counts[flag] == np.sum(flag_map == flag))
+    assert(stats["n_succeeded"] == flag_counts[FLAG.SUCCESS])
+    assert(stats["n_succeeded"] <= stats["n_attempted"] <= flag_map.size)
+    assert(stats["elapsed"] > 0)
+
+    # a ReferenceFrames can be given instead of a list
+    refframes = ReferenceFrames(4)
+    refframes.push(refframe)
+    depth_map1, variance_map1, flag_map1 = update_depth(
+        keyframe, refframes, age_map, prior_depth, prior_variance, params
+    )
+    assert_array_equal(depth_map1, depth_map)
+    assert_array_equal(flag_map1, flag_map)
+
+    # pixels older than the oldest reference frame are estimated with it
+    old_age_map = age_map.copy()
+    old_age_map[:shape[0] // 2] = 3
+    depth_map1, variance_map1, flag_map1, stats = update_depth(
+        keyframe, [refframe,], old_age_map, prior_depth, prior_variance,
+        params, return_stats=True
+    )
+    assert_array_equal(depth_map1, depth_map)
+    assert_array_equal(flag_map1, flag_map)
+    assert(stats["n_age_clamped"] > 0)
+
+    # pixels with small image gradients are skipped and keep the priors
+    params = Params(
+        min_depth=60.0,
+        max_depth=1000.0,
+        geo_coeff=0.01,
+        photo_coeff=0.01,
+        ref_step_size=0.01,
+        min_gradient=0.2,
+        min_image_gradient=0.5
+    )
+    depth_map1, variance_map1, flag_map1, stats1 = update_depth(
+        keyframe, [refframe,], age_map, prior_depth, prior_variance, params,
+        return_stats=True
+    )
+    assert(stats1["n_attempted"] < stats["n_attempted"])
+    skipped = flag_map1 == FLAG.INSUFFICIENT_GRADIENT
+    assert_array_equal(depth_map1[skipped], prior_depth[skipped])
+    assert_array_equal(variance_map1[skipped], prior_variance[skipped])
+    # pixels that are searched give the same results as before
+    searched = flag_map1 != FLAG.INSUFFICIENT_GRADIENT
+    assert_array_equal(flag_map1[searched], flag_map[searched])
+    assert_array_equal(depth_map1[searched], depth_map[searched])
+
 
 def test_estimate():
     dataset = NewTsukubaDataset(new_tsukuba)
@@ -1,14 +1,27 @@
+import warnings
+
 import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_almost_equal
 from skimage.color import rgb2gray
 from skimage.transform import resize
 import pytest
 
 from tadataka import camera
+from tadataka.camera import CameraModel, CameraParameters
 from tadataka.metric import PhotometricError
 from tadataka.pose import Pose
 from tadataka.dataset.new_tsukuba import NewTsukubaDataset
 from tadataka.warp import LocalWarp2D, Warp2D
-from tadataka.vo.dvo import _PoseChangeEstimator, PoseChangeEstimator
+from tadataka.interpolation import interpolation
+from tadataka.vo.dvo.jacobian import calc_image_gradient
+from tadataka.vo.dvo import (_PoseChangeEstimator, PoseChangeEstimator,
+                             _Keyframe, calc_hessian, calc_jacobian,
+                             calc_normal_equation, calc_normal_equation_,
+                             InverseCompositionalPoseChangeEstimator,
+                             _InverseCompositionalPoseChangeEstimator)
+from tadataka.vo.dvo.pyramid import ImagePyramid
+from tadataka.vo.dvo.selection import PixelSelector
+from tadataka.vo.dvo.motion import ConstantVelocityModel, initial_hypotheses
 from tests.dataset.path import new_tsukuba
 
 
@@ -51,3 +64,263 @@ def test_pose_change_estimator():
 
     with pytest.raises(ValueError, match="No such weights 'random'"):
         evaluate(weights="random", rate=2.)
+
+
+def texture(xs, ys):
+    return (np.sin(xs / 7.) * np.cos(ys / 5.) +
+            0.5 * np.sin((xs + ys) / 11.)) / 3 + 0.5
+
+
+def make_translated_textures():
+    # fronto-parallel plane moving along the x axis
+    # so that I1 is exactly I0 shifted horizontally
+    shape = (60, 80)
+    fx, depth, tx = 50., 5., -0.1
+    camera_model = CameraModel(
+        CameraParameters(focal_length=[fx, fx], offset=[40., 30.]),
+        distortion_model=None
+    )
+
+    ys, xs = np.mgrid[0:shape[0], 0:shape[1]]
+    I0 = texture(xs, ys)
+    I1 = texture(xs - fx * tx / depth, ys)
+    D0 = depth * np.ones(shape)
+    return camera_model, I0, D0, I1, tx
+
+
+def test_keyframe_hessian():
+    shape = (30, 40)
+    camera_model = CameraModel(
+        CameraParameters(focal_length=[50., 50.], offset=[20., 15.]),
+        distortion_model=None
+    )
+    ys, xs = np.mgrid[0:shape[0], 0:shape[1]]
+    I0 = texture(xs, ys)
+    D0 = np.random.uniform(1, 5, shape)
+    D0[0, 0] = 0  # invalid depth is excluded
+    W0 = np.random.uniform(0, 1, shape)
+
+    keyframe = _Keyframe(camera_model, I0, D0, W0)
+    assert(keyframe.J.shape == (shape[0] * shape[1] - 1, 6))
+
+    N = keyframe.J.shape[0]
+    for n_inside in [N, N - 10, 10]:
+        mask = np.zeros(N, dtype=bool)
+        mask[np.random.choice(N, n_inside, replace=False)] = True
+        assert_array_almost_equal(
+            keyframe.hessian(mask),
+            calc_hessian(keyframe.J[mask], W0.flatten()[1:][mask])
+        )
+
+
+def test_inverse_compositional_pose_change_estimator():
+    camera_model, I0, D0, I1, tx = make_translated_textures()
+
+    error = PhotometricError(camera_model, camera_model, I0, D0, I1)
+
+    for weights in [None, np.ones(I0.shape), "huber"]:
+        estimator = InverseCompositionalPoseChangeEstimator(
+            camera_model, camera_model, I0, D0, weights,
+            n_coarse_to_fine=3
+        )
+        pose10 = estimator(I1)
+        assert(error(pose10) < error(Pose.identity()))
+        assert_array_almost_equal(pose10.t, [tx, 0, 0])
+        assert_array_almost_equal(pose10.rotation.as_rotvec(), np.zeros(3))
+
+    # pyramids can be passed in place of images
+    estimator = InverseCompositionalPoseChangeEstimator(
+        camera_model, camera_model,
+        ImagePyramid(camera_model, I0, D0, n_levels=3), None,
+        n_coarse_to_fine=3
+    )
+    pose10 = estimator(ImagePyramid(camera_model, I1, n_levels=3))
+    assert_array_almost_equal(pose10.t, [tx, 0, 0])
+
+    estimator = InverseCompositionalPoseChangeEstimator(
+        camera_model, camera_model, I0, D0, n_coarse_to_fine=3,
+        pixel_selector=PixelSelector(max_pixels=500)
+    )
+    assert(len(estimator.keyframes[0].P0) == 500)
+    assert_array_almost_equal(estimator(I1).t, [tx, 0, 0])
+
+    with pytest.raises(ValueError, match="No such weights 'random'"):
+        InverseCompositionalPoseChangeEstimator(
+            camera_model, camera_model, I0, D0, "random")(I1)
+
+
+def test_pose_change_estimator_pyramid():
+    camera_model, I0, D0, I1, tx = make_translated_textures()
+
+    estimator = PoseChangeEstimator(camera_model, camera_model,
+                                    n_coarse_to_fine=3)
+    expected = estimator(I0, D0, I1)
+
+    pyramid0 = ImagePyramid(camera_model, I0, n_levels=3)
+    pyramid1 = ImagePyramid(camera_model, I1, n_levels=3)
+    pose10 = estimator(pyramid0, D0, pyramid1)
+    assert_array_almost_equal(pose10.T, expected.T)
+
+    # the depth map has been attached to the pyramid
+    pose10 = estimator(pyramid0, None, pyramid1)
+    assert_array_almost_equal(pose10.T, expected.T)
+
+    # selected pixels only
+    estimator = PoseChangeEstimator(camera_model, camera_model,
+                                    n_coarse_to_fine=3,
+                                    pixel_selector=PixelSelector())
+    pose10 = estimator(pyramid0, None, pyramid1)
+    error = PhotometricError(camera_model, camera_model, I0, D0, I1)
+    assert(error(pose10) < error(Pose.identity()))
+
+
+def test_pose_change_estimator_float32():
+    camera_model, I0, D0, I1, tx = make_translated_textures()
+
+    pyramid0 = ImagePyramid(camera_model, I0, D0, n_levels=3,
+                            dtype=np.float32)
+    assert(pyramid0[1].image.dtype == np.float32)
+    assert(pyramid0[1].depth_map.dtype == np.float32)
+    assert(pyramid0[1].backprojection.P.dtype == np.float32)
+
+    estimator = PoseChangeEstimator(camera_model, camera_model,
+                                    n_coarse_to_fine=3, dtype=np.float32)
+    pose10 = estimator(I0, D0, I1)
+    assert_array_almost_equal(pose10.t, [tx, 0, 0], decimal=2)
+
+    estimator = InverseCompositionalPoseChangeEstimator(
+        camera_model, camera_model, I0, D0, n_coarse_to_fine=3,
+        dtype=np.float32
+    )
+    keyframe = estimator.keyframes[0]
+    assert(keyframe.P0.dtype == np.float32)
+    # points are warped in float32
+    P1, us1 = _InverseCompositionalPoseChangeEstimator(
+        keyframe, camera_model, max_iter=1
+    )._warp(Pose.identity())
+    assert(P1.dtype == np.float32)
+    pose10 = estimator(I1)
+    assert_array_almost_equal(pose10.t, [tx, 0, 0], decimal=2)
+
+
+def test_calc_normal_equation():
+    shape = (40, 50)
+    camera_model = CameraModel(
+        CameraParameters(focal_length=[20., 25.], offset=[25., 20.]),
+        distortion_model=None
+    )
+    ys, xs = np.mgrid[0:shape[0], 0:shape[1]]
+    I1 = texture(xs, ys)
+    gradient1 = calc_image_gradient(I1)
+
+    N = 200
+    P0 = np.column_stack((np.random.uniform(-2, 2, (N, 2)),
+                          np.random.uniform(-1, 4, N)))
+    intensities0 = np.random.uniform(0, 1, N)
+    weights = np.random.uniform(0, 1, N)
+    pose10 = Pose.from_se3(np.array([0.1, -0.2, 0.3, 0.05, -0.1, 0.02]))
+
+    # compute the expected values explicitly
+    P1 = np.dot(pose10.R, P0.T).T + pose10.t
+    us1 = camera_model.unnormalize(P1[:, 0:2] / P1[:, [2]])
+    mask = ((P1[:, 2] > 0) &
+            (0 <= us1[:, 0]) & (us1[:, 0] <= shape[1] - 1) &
+            (0 <= us1[:, 1]) & (us1[:, 1] <= shape[0] - 1))
+    assert(0 < np.sum(mask) < N)
+
+    r = intensities0[mask] - interpolation(I1, us1[mask])
+    J = calc_jacobian([20., 25.],
+                      interpolation(gradient1[0], us1[mask]),
+                      interpolation(gradient1[1], us1[mask]),
+                      P1[mask])
+    w = weights[mask]
+
+    def check(equation, weighted):
+        H, g, error, count = equation
+        W = w if weighted else np.ones(len(w))
+        assert_array_almost_equal(H, np.dot(J.T * W, J))
+        assert_array_almost_equal(g, np.dot(J.T, W * r))
+        assert_almost_equal(error, np.dot(W * r, r))
+        assert(count == np.sum(mask))
+
+    check(calc_normal_equation_(camera_model, pose10, P0, intensities0,
+                                I1, gradient1, weights), True)
+    check(calc_normal_equation_(camera_model, pose10, P0, intensities0,
+                                I1, gradient1, None), False)
+    # the native kernel if it is built
+    check(calc_normal_equation(camera_model, pose10, P0, intensities0,
+                               I1, gradient1, weights), True)
+    check(calc_normal_equation(camera_model, pose10, P0, intensities0,
+                               I1, gradient1, None), False)
+
+    # all points are behind the camera
+    P0 = np.column_stack((P0[:, 0:2], -10 * np.ones(N)))
+    H, g, error, count = calc_normal_equation(
+        camera_model, pose10, P0, intensities0, I1, gradient1)
+    assert(count == 0)
+
+
+def test_pose_change_estimator_stats():
+    camera_model, I0, D0, I1, tx = make_translated_textures()
+
+    motion_model = ConstantVelocityModel()
+    estimator = PoseChangeEstimator(camera_model, camera_model,
+                                    n_coarse_to_fine=3, max_iter=50,
+                                    motion_model=motion_model,
+                                    min_level_motion=2.0)
+
+    # identity is predicted first so only the finest level is run
+    pose10, stats = estimator(I0, D0, I1, return_stats=True)
+    assert([s.level for s in stats] == [0])
+
+    # all levels run since the predicted motion is large
+    pose10 = Pose.from_se3(np.array([6 * tx, 0, 0, 0, 0, 0]))
+    pose10, stats = estimator(I0, D0, I1, pose10=pose10, return_stats=True)
+    assert([s.level for s in stats] == [2, 1, 0])
+    for s in stats:
+        # stopped by the convergence criteria
+        assert(0 < s.n_iterations < 50)
+    assert(stats[-1].error < 1e-8)
+    assert_array_almost_equal(pose10.t, [tx, 0, 0])
+
+    # the estimated pose is used as the next initial guess
+    assert(motion_model.predict() is pose10)
+    # predicted motion at level 1 is 1.0 / 1.5 < 2.0 pixels
+    _, stats = estimator(I0, D0, I1, return_stats=True)
+    assert([s.level for s in stats] == [0])
+
+
+def test_initial_hypotheses():
+    prediction = Pose.from_se3(np.array([0.1, 0.2, 0.3, 0.0, 0.1, 0.0]))
+    hypotheses = initial_hypotheses(prediction, 0.05)
+    assert(len(hypotheses) == 8)
+    assert(hypotheses[0] == Pose.identity())
+    assert(hypotheses[1] == prediction)
+    for i, pose in enumerate(hypotheses[2:]):
+        dpose = pose * prediction.inv()
+        rotvec = np.zeros(3)
+        rotvec[i // 2] = 0.05 if i % 2 == 1 else -0.05
+        assert_array_almost_equal(dpose.rotation.as_rotvec(), rotvec)
+        assert_array_almost_equal(dpose.t, np.zeros(3))
+
+
+def test_pose_change_estimator_multi_hypothesis():
+    camera_model, I0, D0, I1, tx = make_translated_textures()
+
+    # this prior warps all points out of the image
+    prior = Pose.from_se3(np.array([100., 0., 0., 0., 0., 0.]))
+
+    estimator = PoseChangeEstimator(camera_model, camera_model,
+                                    n_coarse_to_fine=3,
+                                    multi_hypothesis=True)
+    with warnings.catch_warnings():
+        # hypotheses out of the image are expected and not warned
+        warnings.simplefilter("error")
+        pose10 = estimator(I0, D0, I1, pose10=prior)
+    assert_array_almost_equal(pose10.t, [tx, 0, 0])
+
+    estimator = PoseChangeEstimator(camera_model, camera_model,
+                                    n_coarse_to_fine=3)
+    with pytest.warns(RuntimeWarning, match="Camera pose change is too large"):
+        pose10 = estimator(I0, D0, I1, pose10=prior)
+    assert(pose10 == prior)
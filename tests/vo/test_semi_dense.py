@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+from numpy.linalg import norm
+from skimage.color import rgb2gray
+from skimage.transform import resize
+
+from tadataka import camera
+from tadataka.camera import CameraModel, CameraParameters
+from tadataka.dataset.new_tsukuba import NewTsukubaDataset
+from tadataka.pose import Pose
+from tadataka.vo.semi_dense import DoubleBuffer, SemiDenseVO
+from tadataka.vo.semi_dense.flag import ResultFlag as FLAG
+from tests.dataset.path import new_tsukuba
+
+
+def test_double_buffer():
+    buffer = DoubleBuffer([0], [0])
+
+    with buffer.write() as back:
+        back[0] = 1
+        # readers do not see the buffer being written
+        with buffer.read() as front:
+            assert(front[0] == 0)
+
+    # swapped
+    with buffer.read() as front:
+        assert(front[0] == 1)
+    assert(buffer.front[0] == 1)
+
+
+def test_double_buffer_waits_for_readers():
+    buffer = DoubleBuffer([0], [0])
+
+    taken, release = threading.Event(), threading.Event()
+
+    def read():
+        with buffer.read() as front:
+            taken.set()
+            release.wait()
+            # not modified while it is read
+            assert(front[0] == 0)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    taken.wait()
+
+    with buffer.write() as back:
+        back[0] = 1
+
+    written = threading.Event()
+
+    def write():
+        # the back buffer is now the one held by the reader
+        with buffer.write() as back:
+            back[0] = 2
+        written.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    assert(not written.wait(0.1))
+
+    release.set()
+    reader.join()
+    writer.join()
+    assert(written.is_set())
+    with buffer.read() as front:
+        assert(front[0] == 2)
+
+
+def test_semi_dense_vo():
+    from rust_bindings.semi_dense import Params
+
+    dataset = NewTsukubaDataset(new_tsukuba)
+    frames = [dataset[i][0] for i in range(3)]
+
+    scale = 0.2
+    camera_model = camera.resize(frames[0].camera_model, scale)
+    shape = (int(frames[0].image.shape[0] * scale),
+             int(frames[0].image.shape[1] * scale))
+    images = [resize(rgb2gray(f.image), shape) for f in frames]
+
+    params = Params(
+        min_depth=60.0,
+        max_depth=1000.0,
+        geo_coeff=0.01,
+        photo_coeff=0.01,
+        ref_step_size=0.01,
+        min_gradient=0.2
+    )
+    vo = SemiDenseVO(camera_model, shape, params,
+                     default_depth=200.0, default_variance=100.0)
+
+    # the first two poses are given to fix the scale
+    assert(vo.track(images[0], frames[0].pose) == frames[0].pose)
+    assert(vo.track(images[1], frames[1].pose) == frames[1].pose)
+    # frame 2 is tracked against the depth map of frame 1
+    vo.wait()
+    assert(vo.depth_map().frame_id == 1)
+    pose = vo.track(images[2])
+    assert(isinstance(pose, Pose))
+    vo.close()
+
+    # errors are smaller than the camera motion from the previous frame
+    pose_true = frames[2].pose
+    motion = frames[1].pose.inv() * pose_true
+    error = pose.inv() * pose_true
+    assert(norm(pose.t - pose_true.t) <
+           0.5 * norm(frames[1].pose.t - pose_true.t))
+    assert(norm(error.rotation.as_rotvec()) <
+           0.5 * norm(motion.rotation.as_rotvec()))
+
+    depth_map = vo.depth_map()
+    assert(depth_map.frame_id == 2)
+    assert(depth_map.depth.shape == depth_map.variance.shape == shape)
+    assert(depth_map.flag.shape == depth_map.age.shape == shape)
+    assert(np.any(depth_map.flag == FLAG.SUCCESS))
+    assert(np.max(depth_map.age) <= 2)
+
+    # copies are returned
+    depth_map.depth[:] = 0
+    assert(not np.all(vo.depth_map().depth == 0))
+
+
+def test_semi_dense_vo_tracking_does_not_wait_for_mapping():
+    from rust_bindings.semi_dense import Params
+
+    shape = (60, 80)
+    camera_model = CameraModel(
+        CameraParameters(focal_length=[50., 50.], offset=[40., 30.]),
+        distortion_model=None
+    )
+    ys, xs = np.mgrid[0:shape[0], 0:shape[1]]
+    images = [(np.sin((xs - 2 * i) / 7.) * np.cos(ys / 5.)) / 3 + 0.5
+              for i in range(3)]
+    params = Params(min_depth=1.0, max_depth=10.0, geo_coeff=0.01,
+                    photo_coeff=0.01, ref_step_size=0.01, min_gradient=0.2)
+    vo = SemiDenseVO(camera_model, shape, params,
+                     default_depth=5.0, default_variance=1.0,
+                     n_coarse_to_fine=2)
+
+    vo.track(images[0], Pose.identity())
+    vo.wait()
+
+    # the mapping thread is blocked until 'release' is set
+    started, release = threading.Event(), threading.Event()
+    mapped = []
+    map_ = vo._map
+
+    def blocked_map(*args):
+        started.set()
+        release.wait(10)
+        mapped.append(args[2])
+        map_(*args)
+
+    vo._map = blocked_map
+
+    vo.track(images[1], Pose.from_se3(np.array([0.1, 0, 0, 0, 0, 0])))
+    assert(started.wait(10))
+    # frame 2 is tracked against the depth map of frame 0
+    # while frame 1 is still being mapped
+    pose = vo.track(images[2])
+    assert(isinstance(pose, Pose))
+    assert(not release.is_set())
+    assert(vo.depth_map().frame_id == 0)
+
+    # only the newest of the frames waiting for mapping is kept
+    for _ in range(3):  # frames 3, 4 and 5
+        vo.track(images[2], pose)
+    assert(len(vo._pending) == 2)  # frame 1 and the waiting frame
+
+    release.set()
+    vo.close()
+    assert(mapped == [1, 5])
+    assert(vo.depth_map().frame_id == 5)